@@ -0,0 +1,126 @@
+import mmap
+import os
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from exceptions import ResourceError
+from utils import logger, BufferedFrame
+
+SNAPSHOT_MAGIC = b'PDRSNAP1'
+SNAPSHOT_VERSION = 1
+
+# ファイル構成: ヘッダー / レコード（タイムスタンプ・長さ + JPEGデータ）の連続 / インデックス / フッター
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('reserved', '<u4')
+])
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('length', '<u4')
+])
+
+INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),  # JPEGデータの位置（静止シーンで共有するフレームは同じ位置を指す）
+    ('length', '<u4'),
+    ('timestamp', '<f8'),
+    ('width', '<u2'),
+    ('height', '<u2'),
+    ('tier', '<u1')  # 保存時のバッファ階層
+])
+
+FOOTER_DTYPE = np.dtype([
+    ('index_offset', '<u8'),
+    ('count', '<u4'),
+    ('magic', 'S8')
+])
+
+def write_snapshot(path: str, entries: Iterable[Tuple[int, BufferedFrame]]) -> int:
+    """
+    バッファのフレームをスナップショットファイルに書き出す
+    一時ファイルに書き込んでからリネームするため、書き出し中に停止しても前回のファイルは壊れない
+    Args:
+        path: 出力先のパス
+        entries: (階層番号, フレーム) を古い順に
+    Returns:
+        書き出したフレーム数
+    """
+    temp_path = f"{path}.tmp"
+    index = []
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(np.array((SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0), dtype=HEADER_DTYPE).tobytes())
+            offset = HEADER_DTYPE.itemsize
+            previous_payload = None
+            previous_location = None
+            for tier, entry in entries:
+                width, height = entry.size or (0, 0)
+                if entry.payload is previous_payload:
+                    location = previous_location
+                else:
+                    payload = np.ascontiguousarray(entry.payload).reshape(-1)
+                    f.write(np.array((entry.timestamp, len(payload)), dtype=RECORD_DTYPE).tobytes())
+                    offset += RECORD_DTYPE.itemsize
+                    f.write(payload.data)
+                    location = (offset, len(payload))
+                    offset += len(payload)
+                    previous_payload = entry.payload
+                    previous_location = location
+                index.append((location[0], location[1], entry.timestamp, width, height, tier))
+
+            f.write(np.array(index, dtype=INDEX_DTYPE).tobytes())
+            f.write(np.array((offset, len(index), SNAPSHOT_MAGIC), dtype=FOOTER_DTYPE).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except OSError as e:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise ResourceError(f"バッファのスナップショットを書き出せませんでした: {path}: {e}")
+    return len(index)
+
+def read_snapshot(path: str) -> List[Tuple[int, BufferedFrame]]:
+    """
+    スナップショットファイルを読み込む
+    ファイルはmmapで開き、JPEGデータはコピーせずにマップした領域を参照する
+    Args:
+        path: スナップショットファイルのパス
+    Returns:
+        (階層番号, フレーム) を古い順に
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise ResourceError(f"バッファのスナップショットを開けませんでした: {path}: {e}")
+
+    size = len(mapped)
+    if size < HEADER_DTYPE.itemsize + FOOTER_DTYPE.itemsize:
+        raise ResourceError(f"バッファのスナップショットが壊れています: {path}")
+    header = np.frombuffer(mapped, dtype=HEADER_DTYPE, count=1)[0]
+    footer = np.frombuffer(mapped, dtype=FOOTER_DTYPE, count=1, offset=size - FOOTER_DTYPE.itemsize)[0]
+    index_offset = int(footer['index_offset'])
+    count = int(footer['count'])
+    if (header['magic'] != SNAPSHOT_MAGIC or footer['magic'] != SNAPSHOT_MAGIC
+            or header['version'] != SNAPSHOT_VERSION
+            or index_offset + count * INDEX_DTYPE.itemsize != size - FOOTER_DTYPE.itemsize):
+        raise ResourceError(f"バッファのスナップショットが壊れています: {path}")
+
+    index = np.frombuffer(mapped, dtype=INDEX_DTYPE, count=count, offset=index_offset)
+    if count and int((index['offset'] + index['length']).max()) > index_offset:
+        raise ResourceError(f"バッファのスナップショットが壊れています: {path}")
+
+    entries = []
+    payloads = {}
+    for offset, length, timestamp, width, height, tier in index.tolist():
+        shared = offset in payloads
+        if not shared:
+            payloads = {offset: np.frombuffer(mapped, dtype=np.uint8, count=length, offset=offset)}
+        size = (width, height) if width and height else None
+        entries.append((tier, BufferedFrame(timestamp, payloads[offset], size, shared=shared)))
+    logger.debug(f"バッファのスナップショットを読み込み: {path} ({count}フレーム)")
+    return entries
@@ -0,0 +1,185 @@
+import argparse
+import signal
+import sys
+import threading
+import time
+
+import cv2
+
+from overlay import FrameOverlay
+from shared_ring import SharedFrameRing
+from utils import logger, now, configure_logging, Config, CaptureHealth, FramePacer
+
+def ring_name_for(config: Config, device_id: int) -> str:
+    """カメラごとの共有メモリ名"""
+    prefix = config.get('capture', 'ring_name', 'pydriverecorder')
+    return f"{prefix}_cam{device_id}"
+
+def open_camera(config: Config, device_id: int):
+    """カメラを開いて解像度とfpsを設定（開けない場合はNone）"""
+    camera = cv2.VideoCapture(device_id)
+    if not camera.isOpened():
+        camera.release()
+        return None
+    camera.set(cv2.CAP_PROP_FRAME_WIDTH, config.get('camera', 'frame_width'))
+    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, config.get('camera', 'frame_height'))
+    camera.set(cv2.CAP_PROP_FPS, config.get('camera', 'fps'))
+    return camera
+
+def run_capture(config: Config, device_id: int):
+    """
+    カメラをキャプチャし、JPEGを共有メモリのリングバッファに書き込む
+    読み出しは別スレッドで行い、読み出しの失敗やブロックしたままの停止を検知して再接続する
+    Args:
+        config: 設定オブジェクト
+        device_id: カメラ番号
+    """
+    stopping = False
+
+    def on_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    camera = open_camera(config, device_id)
+    if camera is None:
+        logger.error(f"カメラ {device_id} を開けませんでした")
+        return 1
+
+    width = int(camera.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = config.get('camera', 'fps')
+    pacer = FramePacer(fps)
+    health = CaptureHealth(
+        config.get('capture', 'reconnect_backoff', 0.5),
+        config.get('capture', 'reconnect_backoff_max', 10.0)
+    )
+    stall_timeout = config.get('capture', 'stall_timeout', 5.0)
+
+    slot_count = config.get('capture', 'ring_slots')
+    slot_size = config.get('capture', 'ring_slot_kb') * 1024
+    quality = config.get('buffer', 'compression_quality')
+    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    # 日時の焼き込み（テレメトリはGUIプロセスで受け付けるため、この方式では表示しない）
+    overlay = FrameOverlay.from_config(config)
+
+    ring = SharedFrameRing.create(
+        ring_name_for(config, device_id), slot_count, slot_size, width, height, fps
+    )
+    logger.info(f"キャプチャプロセスを開始: camera={device_id} {width}x{height} @{fps}fps ring={ring.name}")
+
+    # 読み出しスレッドとの共有状態（generation が変わったスレッドはリングに書き込まない）
+    state = {'generation': 0, 'last_frame_at': time.monotonic(), 'error': None}
+    write_lock = threading.Lock()
+
+    def read_frames(camera, generation):
+        try:
+            while not stopping and generation == state['generation']:
+                # grab() はフレームが届くまでブロックする
+                if not camera.grab():
+                    state['error'] = "フレームの取得に失敗"
+                    return
+                timestamp = now()
+                if not pacer.should_keep(timestamp):
+                    continue
+                ret, frame = camera.retrieve()
+                if not ret:
+                    continue
+                if overlay is not None:
+                    overlay.apply(frame, timestamp)
+                result, payload = cv2.imencode('.jpg', frame, encode_param)
+                if not result:
+                    continue
+                with write_lock:
+                    if generation != state['generation']:
+                        return
+                    ring.write(payload, timestamp)
+                    state['last_frame_at'] = time.monotonic()
+        except Exception as e:
+            state['error'] = str(e)
+        finally:
+            camera.release()
+
+    last_report = now()
+    reader = None
+    try:
+        while not stopping and not ring.stop_requested:
+            if camera is None and reader is None:
+                # 再接続を待つ間も生存通知を続け、リングの内容（トリガー前の映像）は残す
+                delay = health.next_backoff()
+                deadline = time.monotonic() + delay
+                while not stopping and not ring.stop_requested and time.monotonic() < deadline:
+                    ring.touch()
+                    time.sleep(min(0.1, delay))
+                camera = open_camera(config, device_id)
+                if camera is None:
+                    logger.warning(f"カメラ {device_id} の再接続に失敗（{delay:.1f}秒後に再試行）")
+                    continue
+                health.mark_connected()
+                logger.info(f"カメラ {device_id} に再接続しました")
+
+            if reader is None:
+                with write_lock:
+                    state['generation'] += 1
+                    state['last_frame_at'] = time.monotonic()
+                state['error'] = None
+                reader = threading.Thread(
+                    target=read_frames,
+                    args=(camera, state['generation']),
+                    name='capture',
+                    daemon=True
+                )
+                reader.start()
+                camera = None
+
+            reader.join(timeout=0.1)
+            ring.touch()
+            if not reader.is_alive():
+                reason = state['error'] or "キャプチャが終了しました"
+            elif time.monotonic() - state['last_frame_at'] > stall_timeout:
+                reason = f"{stall_timeout:g}秒間フレームが届きません"
+            else:
+                reason = None
+            if reason is not None:
+                # ブロックしたままのスレッドは切り離す（戻ってきてもリングには書き込まない）
+                with write_lock:
+                    state['generation'] += 1
+                reader = None
+                health.mark_disconnected(reason)
+                logger.error(f"カメラ {device_id} の映像が途切れました: {reason}。再接続します")
+                continue
+
+            # 実測fpsを読み出し側に公開
+            current = now()
+            if current - last_report >= 1.0:
+                ring.set_frame_info(width, height, pacer.measured_fps)
+                last_report = current
+    finally:
+        with write_lock:
+            state['generation'] += 1
+        if reader is not None:
+            reader.join(timeout=3.0)
+        if camera is not None:
+            camera.release()
+        ring.close()
+        ring.unlink()
+        logger.info("キャプチャプロセスを終了")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="PyDriveRecorder キャプチャプロセス")
+    parser.add_argument('--config', default=None, help="設定ファイルのパス")
+    parser.add_argument('--device', type=int, default=None, help="カメラ番号")
+    args = parser.parse_args()
+
+    config = Config(args.config)
+    configure_logging(config)
+    device_id = args.device
+    if device_id is None:
+        device_id = config.get('camera', 'default_device')
+    sys.exit(run_capture(config, device_id))
+
+if __name__ == "__main__":
+    main()
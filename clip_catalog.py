@@ -0,0 +1,292 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from clip_index import sidecar_paths
+from exceptions import ResourceError
+from utils import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clips (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    trigger_type TEXT,
+    source TEXT,
+    trigger_time REAL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    duration REAL NOT NULL,
+    frame_count INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    codec TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    clock_offset REAL,
+    clock_uncertainty REAL
+);
+CREATE INDEX IF NOT EXISTS idx_clips_start ON clips (start_time);
+CREATE INDEX IF NOT EXISTS idx_clips_type_start ON clips (trigger_type, start_time);
+CREATE INDEX IF NOT EXISTS idx_clips_priority_start ON clips (priority, start_time);
+"""
+
+COLUMNS = (
+    'id', 'path', 'trigger_type', 'source', 'trigger_time', 'start_time', 'end_time',
+    'duration', 'frame_count', 'size', 'codec', 'priority', 'created_at',
+    'clock_offset', 'clock_uncertainty'
+)
+
+# 既存のデータベースに追加する列（列名, 型）
+MIGRATIONS = (
+    ('clock_offset', 'REAL'),
+    ('clock_uncertainty', 'REAL'),
+)
+
+class ClipInfo:
+    """保存したクリップの情報"""
+    def __init__(self, path: str, start_time: float, end_time: float, duration: float,
+                 frame_count: int, size: int, codec: str = None, trigger_type: str = None,
+                 source: str = None, trigger_time: float = None, priority: int = 0,
+                 created_at: float = None, clock_offset: float = None,
+                 clock_uncertainty: float = None, id: int = None):
+        self.id = id
+        self.path = path
+        self.trigger_type = trigger_type
+        self.source = source
+        self.trigger_time = trigger_time
+        self.start_time = start_time
+        self.end_time = end_time
+        self.duration = duration
+        self.frame_count = frame_count
+        self.size = size
+        self.codec = codec
+        self.priority = priority
+        self.created_at = created_at if created_at is not None else time.time()
+        # trigger_time をクライアントの時計から補正した場合の時計のずれと誤差（秒）
+        self.clock_offset = clock_offset
+        self.clock_uncertainty = clock_uncertainty
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {column: getattr(self, column) for column in COLUMNS}
+
+class ClipCatalog:
+    """
+    保存したクリップのSQLiteインデックス
+    ディスク容量の管理（保持ポリシー）もディレクトリを走査せずにインデックスから行う
+    """
+    def __init__(self, db_path: str, max_disk_mb: float = 0, max_age_days: float = 0,
+                 policy: str = 'priority'):
+        """
+        カタログの初期化
+        Args:
+            db_path: データベースファイルのパス
+            max_disk_mb: クリップの合計サイズの上限（0で無制限）
+            max_age_days: クリップを保持する日数（0で無制限）
+            policy: 上限超過時の削除順 priority（優先度の低い順→古い順） / oldest（古い順）
+        """
+        if policy not in ('priority', 'oldest'):
+            raise ResourceError(f"未対応の保持ポリシー: {policy}")
+        self.db_path = db_path
+        self.max_bytes = int(max_disk_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.policy = policy
+        self._lock = threading.Lock()
+        try:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+            self._total_size = self._conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM clips'
+            ).fetchone()[0]
+        except sqlite3.Error as e:
+            raise ResourceError(f"クリップカタログを開けませんでした: {db_path}: {e}")
+
+        self._retention_thread = None
+        self._stop_event = threading.Event()
+        logger.info(f"クリップカタログを開きました: {db_path} ({self._total_size / 1024 / 1024:.1f}MB)")
+
+    def _migrate(self):
+        """以前のバージョンで作成したデータベースに不足している列を追加"""
+        existing = {row['name'] for row in self._conn.execute('PRAGMA table_info(clips)')}
+        with self._conn:
+            for column, column_type in MIGRATIONS:
+                if column not in existing:
+                    self._conn.execute(f'ALTER TABLE clips ADD COLUMN {column} {column_type}')
+                    logger.info(f"クリップカタログに列を追加: {column}")
+
+    @property
+    def directory(self) -> str:
+        return os.path.dirname(os.path.abspath(self.db_path))
+
+    @property
+    def total_size(self) -> int:
+        """登録済みクリップの合計サイズ（バイト）"""
+        with self._lock:
+            return self._total_size
+
+    def add(self, clip: ClipInfo) -> int:
+        """
+        クリップを登録し、IDを返す
+        同じパスのクリップが登録済みの場合は置き換えずに ResourceError を送出する
+        """
+        values = clip.to_dict()
+        values.pop('id')
+        with self._lock:
+            try:
+                with self._conn:
+                    cursor = self._conn.execute(
+                        f"INSERT INTO clips ({', '.join(values)}) "
+                        f"VALUES ({', '.join('?' * len(values))})",
+                        tuple(values.values())
+                    )
+            except sqlite3.IntegrityError as e:
+                raise ResourceError(f"クリップは登録済みです: {clip.path}: {e}")
+            self._total_size += clip.size
+            clip.id = cursor.lastrowid
+        logger.debug(f"クリップを登録: id={clip.id} {clip.path}")
+        return clip.id
+
+    def get(self, clip_id: int) -> Optional[ClipInfo]:
+        """IDでクリップを取得"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM clips WHERE id = ?', (clip_id,)).fetchone()
+        return ClipInfo(**dict(row)) if row else None
+
+    def query(self, start_time: float = None, end_time: float = None,
+              trigger_type: str = None, source: str = None,
+              limit: int = 100, offset: int = 0) -> List[ClipInfo]:
+        """
+        条件に一致するクリップを新しい順に取得
+        Args:
+            start_time: この時刻以降に終わるクリップ
+            end_time: この時刻以前に始まるクリップ
+            trigger_type: トリガーの種類
+            source: トリガーの発生元
+            limit: 最大件数
+            offset: 読み飛ばす件数
+        """
+        conditions = []
+        params = []
+        if start_time is not None:
+            conditions.append('end_time >= ?')
+            params.append(start_time)
+        if end_time is not None:
+            conditions.append('start_time <= ?')
+            params.append(end_time)
+        if trigger_type is not None:
+            conditions.append('trigger_type = ?')
+            params.append(trigger_type)
+        if source is not None:
+            conditions.append('source = ?')
+            params.append(source)
+        sql = 'SELECT * FROM clips'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY start_time DESC LIMIT ? OFFSET ?'
+        params += [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [ClipInfo(**dict(row)) for row in rows]
+
+    def remove(self, clip: ClipInfo, delete_file: bool = True) -> bool:
+        """クリップをカタログから削除（ファイルも削除）。削除できなかった場合はFalse"""
+        if delete_file:
+            try:
+                os.remove(clip.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"クリップの削除に失敗: {clip.path}: {e}")
+                return False
+            # インデックスとサムネイル列（無い場合もある）
+            for path in sidecar_paths(clip.path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        with self._lock:
+            with self._conn:
+                deleted = self._conn.execute('DELETE FROM clips WHERE id = ?', (clip.id,)).rowcount
+            if deleted:
+                self._total_size -= clip.size
+        return True
+
+    def _next_victim(self, cutoff: float, exclude: Set[int] = frozenset()) -> Optional[ClipInfo]:
+        """
+        保持期間切れ、または容量超過時に削除するクリップ
+        Args:
+            cutoff: この時刻より前に始まったクリップは保持期間切れ（0で無効）
+            exclude: 候補から除くクリップID（今回の適用で削除に失敗したもの）
+        """
+        excluded = ''
+        params = list(exclude)
+        if exclude:
+            excluded = f" AND id NOT IN ({', '.join('?' * len(exclude))})"
+        with self._lock:
+            if cutoff:
+                row = self._conn.execute(
+                    f'SELECT * FROM clips WHERE start_time < ?{excluded} ORDER BY start_time LIMIT 1',
+                    [cutoff] + params
+                ).fetchone()
+                if row:
+                    return ClipInfo(**dict(row))
+            if not self.max_bytes or self._total_size <= self.max_bytes:
+                return None
+            order = 'priority, start_time' if self.policy == 'priority' else 'start_time'
+            row = self._conn.execute(
+                f'SELECT * FROM clips WHERE 1{excluded} ORDER BY {order} LIMIT 1', params
+            ).fetchone()
+        return ClipInfo(**dict(row)) if row else None
+
+    def enforce_retention(self) -> int:
+        """保持ポリシーを適用し、削除したクリップ数を返す"""
+        cutoff = time.time() - self.max_age if self.max_age else 0
+        removed = 0
+        # 削除できなかったクリップ（権限不足・使用中など）は今回は飛ばして次の候補を削除し、次回の適用で再試行する
+        failed = set()
+        while True:
+            clip = self._next_victim(cutoff, failed)
+            if clip is None:
+                break
+            if not self.remove(clip):
+                failed.add(clip.id)
+                continue
+            removed += 1
+            logger.info(f"保持ポリシーによりクリップを削除: {clip.path}")
+        if failed:
+            logger.warning(f"保持ポリシーで削除できなかったクリップ: {len(failed)}件")
+        return removed
+
+    def start_retention(self, interval: float):
+        """保持ポリシーを定期的に適用するスレッドを開始"""
+        if self._retention_thread is not None or interval <= 0:
+            return
+        self._stop_event.clear()
+        self._retention_thread = threading.Thread(
+            target=self._retention_loop,
+            args=(interval,),
+            name='clip-retention',
+            daemon=True
+        )
+        self._retention_thread.start()
+
+    def _retention_loop(self, interval: float):
+        while not self._stop_event.is_set():
+            try:
+                self.enforce_retention()
+            except Exception as e:
+                logger.error(f"保持ポリシーの適用中にエラー: {e}")
+            self._stop_event.wait(interval)
+
+    def close(self):
+        """保持スレッドを停止し、データベースを閉じる"""
+        self._stop_event.set()
+        if self._retention_thread is not None:
+            self._retention_thread.join(timeout=3.0)
+            self._retention_thread = None
+        with self._lock:
+            self._conn.close()
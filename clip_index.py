@@ -0,0 +1,289 @@
+import json
+import os
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from exceptions import VideoError
+from utils import logger
+
+SIDECAR_VERSION = 1
+
+# サンプル（フレーム）を含むボックスまでたどるコンテナボックス
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'mvex', b'moof', b'traf'}
+
+# trun/tfhd のサンプルフラグ: 非キーフレーム
+SAMPLE_IS_NON_SYNC = 0x00010000
+
+def sidecar_paths(clip_path: str) -> Tuple[str, str]:
+    """クリップに対応する (インデックス, サムネイル列) のパス"""
+    stem = os.path.splitext(clip_path)[0]
+    return f"{stem}.index.json", f"{stem}.thumbs.jpg"
+
+def _iter_boxes(f, start: int, end: int):
+    """start〜end の範囲のボックスを (種類, 本体の開始位置, 終了位置) として列挙"""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            raise VideoError(f"MP4のボックスが不正です: {box_type!r}")
+        yield box_type, position + header, min(position + size, end)
+        position += size
+
+def _read_full_box(f, start: int, end: int) -> Tuple[int, int, bytes]:
+    """FullBox の (version, flags, 残りのデータ)"""
+    f.seek(start)
+    data = f.read(end - start)
+    return data[0], int.from_bytes(data[1:4], 'big'), data[4:]
+
+def _collect_boxes(f, start: int, end: int, boxes: Dict[bytes, list], moof_start: int = None):
+    """サンプルの位置の計算に必要なボックスを集める（moof内のボックスにはmoofの位置を付ける）"""
+    for box_type, body, box_end in _iter_boxes(f, start, end):
+        if box_type == b'moof':
+            moof_start = body - 8
+        if box_type in CONTAINER_BOXES:
+            if box_type == b'trak':
+                boxes.setdefault(b'trak', []).append((body, box_end))
+            _collect_boxes(f, body, box_end, boxes, moof_start if box_type in (b'moof', b'traf') else None)
+            continue
+        boxes.setdefault(box_type, []).append((body, box_end, moof_start))
+
+def _video_track(f, boxes: Dict[bytes, list]) -> Optional[int]:
+    """映像トラックのID（見つからない場合はNone）"""
+    for trak_start, trak_end in boxes.get(b'trak', []):
+        track_boxes = {}
+        _collect_boxes(f, trak_start, trak_end, track_boxes)
+        handlers = track_boxes.get(b'hdlr', [])
+        headers = track_boxes.get(b'tkhd', [])
+        if not handlers or not headers:
+            continue
+        _, _, hdlr = _read_full_box(f, handlers[0][0], handlers[0][1])
+        if hdlr[4:8] != b'vide':
+            continue
+        version, _, tkhd = _read_full_box(f, headers[0][0], headers[0][1])
+        return struct.unpack('>I', tkhd[16:20] if version == 1 else tkhd[8:12])[0]
+    return None
+
+def _samples_from_stbl(f, boxes: Dict[bytes, list]) -> List[Tuple[int, int, bool]]:
+    """通常のMP4（moov内のサンプルテーブル）からサンプルの位置を求める"""
+    _, _, stsz = _read_full_box(f, *boxes[b'stsz'][0][:2])
+    sample_size, count = struct.unpack('>II', stsz[:8])
+    sizes = [sample_size] * count if sample_size else list(struct.unpack(f'>{count}I', stsz[8:8 + 4 * count]))
+
+    if b'co64' in boxes:
+        _, _, co = _read_full_box(f, *boxes[b'co64'][0][:2])
+        chunk_count = struct.unpack('>I', co[:4])[0]
+        chunk_offsets = struct.unpack(f'>{chunk_count}Q', co[4:4 + 8 * chunk_count])
+    else:
+        _, _, co = _read_full_box(f, *boxes[b'stco'][0][:2])
+        chunk_count = struct.unpack('>I', co[:4])[0]
+        chunk_offsets = struct.unpack(f'>{chunk_count}I', co[4:4 + 4 * chunk_count])
+
+    _, _, stsc = _read_full_box(f, *boxes[b'stsc'][0][:2])
+    runs = [struct.unpack('>III', stsc[4 + 12 * i:16 + 12 * i])[:2] for i in range(struct.unpack('>I', stsc[:4])[0])]
+
+    sync = None
+    if b'stss' in boxes:
+        _, _, stss = _read_full_box(f, *boxes[b'stss'][0][:2])
+        sync_count = struct.unpack('>I', stss[:4])[0]
+        sync = set(struct.unpack(f'>{sync_count}I', stss[4:4 + 4 * sync_count]))
+
+    samples = []
+    for run_index, (first_chunk, per_chunk) in enumerate(runs):
+        last_chunk = runs[run_index + 1][0] - 1 if run_index + 1 < len(runs) else chunk_count
+        for chunk in range(first_chunk, last_chunk + 1):
+            offset = chunk_offsets[chunk - 1]
+            for _ in range(per_chunk):
+                if len(samples) >= count:
+                    break
+                size = sizes[len(samples)]
+                samples.append((offset, size, sync is None or len(samples) + 1 in sync))
+                offset += size
+    return samples
+
+def _samples_from_fragments(f, boxes: Dict[bytes, list], track_id: Optional[int]) -> List[Tuple[int, int, bool]]:
+    """fragmented MP4（moof/traf/trun）からサンプルの位置を求める"""
+    default_size, default_flags = 0, 0
+    for body, end, _ in boxes.get(b'trex', []):
+        _, _, trex = _read_full_box(f, body, end)
+        trex_track, _, _, size, flags = struct.unpack('>IIIII', trex[:20])
+        if track_id is None or trex_track == track_id:
+            default_size, default_flags = size, flags
+
+    # tfhd と trun はファイル中の順に並んでいるため、直前の tfhd の設定を後続の trun に適用する
+    items = sorted(
+        [(body, end, moof, b'tfhd') for body, end, moof in boxes.get(b'tfhd', [])]
+        + [(body, end, moof, b'trun') for body, end, moof in boxes.get(b'trun', [])]
+    )
+    samples = []
+    fragment = None
+    for body, end, moof_start, box_type in items:
+        if box_type == b'tfhd':
+            _, flags, tfhd = _read_full_box(f, body, end)
+            fragment = {'track_id': struct.unpack('>I', tfhd[:4])[0], 'base': moof_start,
+                        'size': default_size, 'flags': default_flags}
+            fragment['next'] = fragment['base']
+            position = 4
+            if flags & 0x1:
+                fragment['base'] = fragment['next'] = struct.unpack('>Q', tfhd[position:position + 8])[0]
+                position += 8
+            if flags & 0x2:
+                position += 4
+            if flags & 0x8:
+                position += 4
+            if flags & 0x10:
+                fragment['size'] = struct.unpack('>I', tfhd[position:position + 4])[0]
+                position += 4
+            if flags & 0x20:
+                fragment['flags'] = struct.unpack('>I', tfhd[position:position + 4])[0]
+            continue
+        if fragment is None or (track_id is not None and fragment['track_id'] != track_id):
+            continue
+
+        _, flags, trun = _read_full_box(f, body, end)
+        count = struct.unpack('>I', trun[:4])[0]
+        position = 4
+        # data_offset が無いtrunは、同じtraf内の直前のtrunのデータの続きから始まる
+        offset = fragment['next']
+        if flags & 0x1:
+            offset = fragment['base'] + struct.unpack('>i', trun[position:position + 4])[0]
+            position += 4
+        first_flags = None
+        if flags & 0x4:
+            first_flags = struct.unpack('>I', trun[position:position + 4])[0]
+            position += 4
+        for index in range(count):
+            size = fragment['size']
+            sample_flags = first_flags if index == 0 and first_flags is not None else fragment['flags']
+            if flags & 0x100:
+                position += 4
+            if flags & 0x200:
+                size = struct.unpack('>I', trun[position:position + 4])[0]
+                position += 4
+            if flags & 0x400:
+                sample_flags = struct.unpack('>I', trun[position:position + 4])[0]
+                position += 4
+            if flags & 0x800:
+                position += 4
+            samples.append((offset, size, not sample_flags & SAMPLE_IS_NON_SYNC))
+            offset += size
+        fragment['next'] = offset
+    return samples
+
+def read_sample_table(path: str) -> List[Tuple[int, int, bool]]:
+    """
+    MP4ファイルの映像サンプル（フレーム）の位置を取得（動画データは読まない）
+    Returns:
+        各フレームの (バイト位置, バイト数, キーフレームかどうか)
+    """
+    with open(path, 'rb') as f:
+        end = os.fstat(f.fileno()).st_size
+        boxes = {}
+        _collect_boxes(f, 0, end, boxes)
+        if b'moof' in boxes or b'trun' in boxes:
+            return _samples_from_fragments(f, boxes, _video_track(f, boxes))
+        if b'stsz' in boxes:
+            return _samples_from_stbl(f, boxes)
+    raise VideoError(f"MP4のサンプル情報が見つかりません: {path}")
+
+def build_thumbnail_strip(payloads: Sequence[np.ndarray], indices: Sequence[int],
+                          height: int, quality: int = 70) -> Tuple[Optional[bytes], int]:
+    """
+    JPEGデータからサムネイルを横に並べた画像を作成
+    JPEGのDCT縮小デコード（1/8）を使うため、フル解像度のデコードは行わない
+    Args:
+        payloads: 出力フレームのJPEGデータ
+        indices: サムネイルにするフレーム番号
+        height: サムネイルの高さ
+        quality: JPEG圧縮品質
+    Returns:
+        (JPEGデータ, サムネイル1枚の幅)
+    """
+    thumbnails = []
+    for index in indices:
+        frame = cv2.imdecode(payloads[index], cv2.IMREAD_REDUCED_COLOR_8)
+        if frame is None:
+            continue
+        width = max(1, round(frame.shape[1] * height / frame.shape[0]))
+        thumbnails.append(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA))
+    if not thumbnails:
+        return None, 0
+    # 解像度の異なるフレームが混在しても同じ幅に揃える
+    width = thumbnails[0].shape[1]
+    strip = np.hstack([
+        thumb if thumb.shape[1] == width else cv2.resize(thumb, (width, height), interpolation=cv2.INTER_AREA)
+        for thumb in thumbnails
+    ])
+    result, encoded = cv2.imencode('.jpg', strip, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not result:
+        return None, 0
+    return encoded.tobytes(), width
+
+def write_sidecar(clip_path: str, payloads: Sequence[np.ndarray], timestamps: Sequence[float],
+                  fps: float, thumbnail_interval: float = 1.0,
+                  thumbnail_height: int = 72) -> Dict[str, Any]:
+    """
+    クリップのシーク用インデックスとサムネイル列を書き出す
+    Args:
+        clip_path: 公開済みのクリップのパス
+        payloads: 出力した各フレームのJPEGデータ
+        timestamps: 出力した各フレームのキャプチャ時刻
+        fps: 出力フレームレート
+        thumbnail_interval: サムネイルの間隔（秒）
+        thumbnail_height: サムネイルの高さ
+    Returns:
+        インデックスの内容
+    """
+    index_path, thumbs_path = sidecar_paths(clip_path)
+    samples = read_sample_table(clip_path)
+    if len(samples) != len(timestamps):
+        logger.warning(
+            f"クリップのフレーム数が一致しません: {os.path.basename(clip_path)} "
+            f"(MP4 {len(samples)}, 出力 {len(timestamps)})"
+        )
+    count = min(len(samples), len(timestamps))
+
+    step = max(1, round(thumbnail_interval * fps))
+    thumbnail_frames = list(range(0, count, step))
+    strip, thumbnail_width = build_thumbnail_strip(payloads, thumbnail_frames, thumbnail_height)
+
+    index = {
+        'version': SIDECAR_VERSION,
+        'clip': os.path.basename(clip_path),
+        'fps': fps,
+        'frame_count': count,
+        'frames': {
+            'pts': [round(i / fps, 6) for i in range(count)],
+            'timestamp': [round(t, 6) for t in timestamps[:count]],
+            'offset': [sample[0] for sample in samples[:count]],
+            'size': [sample[1] for sample in samples[:count]]
+        },
+        'keyframes': [i for i in range(count) if samples[i][2]],
+        'thumbnails': None
+    }
+    if strip is not None:
+        index['thumbnails'] = {
+            'file': os.path.basename(thumbs_path),
+            'width': thumbnail_width,
+            'height': thumbnail_height,
+            'frames': thumbnail_frames
+        }
+        _write_atomic(thumbs_path, strip)
+    _write_atomic(index_path, json.dumps(index, separators=(',', ':')).encode('utf-8'))
+    return index
+
+def _write_atomic(path: str, data: bytes):
+    """一時ファイルに書き込んでからリネーム（読み手に書き込み途中のファイルを見せない）"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
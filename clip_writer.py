@@ -0,0 +1,155 @@
+import glob
+import os
+import time
+from typing import Any, Dict
+
+from exceptions import ResourceError
+from utils import logger
+
+# 一時ファイル名: .<名前>.partial<拡張子>（cv2.VideoWriterは拡張子でコンテナを決めるため拡張子は残す）
+TEMP_MARKER = '.partial'
+
+class ClipWriter:
+    """
+    クリップを一時ファイルに書き込み、完了後にアトミックに公開するライター
+    書き込み中に電源が落ちても保存先に壊れた .mp4 が残らない
+    """
+    def __init__(self, output_path: str, fsync_interval_mb: float = 8,
+                 max_write_mb_per_sec: float = 0):
+        """
+        ライターの初期化
+        Args:
+            output_path: 公開先のパス
+            fsync_interval_mb: fsyncを行う書き込み量の間隔（0で完了時のみ）
+            max_write_mb_per_sec: 書き込み帯域の上限（0で無制限）
+        """
+        self.output_path = output_path
+        directory, name = os.path.split(os.path.abspath(output_path))
+        self.directory = directory
+        stem, ext = os.path.splitext(name)
+        self.temp_path = os.path.join(directory, f'.{stem}{TEMP_MARKER}{ext}')
+        self.fsync_interval = int(fsync_interval_mb * 1024 * 1024)
+        self.max_rate = max_write_mb_per_sec * 1024 * 1024
+        self._file = None
+        self._started = time.monotonic()
+        self._unsynced = 0
+        self.bytes_written = 0
+        self.fsync_count = 0
+        self.fsync_total = 0.0
+        self.fsync_max = 0.0
+
+    @classmethod
+    def from_settings(cls, output_path: str, settings: Dict[str, Any]) -> 'ClipWriter':
+        """saveセクションの設定値から生成"""
+        return cls(
+            output_path,
+            fsync_interval_mb=settings.get('fsync_interval_mb', 8),
+            max_write_mb_per_sec=settings.get('max_write_mb_per_sec', 0)
+        )
+
+    def open(self):
+        """一時ファイルを開く（write() で書き込む場合）"""
+        try:
+            self._file = open(self.temp_path, 'wb')
+        except OSError as e:
+            raise ResourceError(f"一時ファイルを作成できません: {self.temp_path}: {e}")
+
+    def write(self, data):
+        """一時ファイルに書き込み（帯域制限とバッチfsyncを適用）"""
+        if self.max_rate > 0:
+            # 書き込み量に見合う時間が経過するまで待ち、キャプチャ側のI/Oを妨げない
+            delay = self._started + self.bytes_written / self.max_rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self._file.write(data)
+        self.bytes_written += len(data)
+        self._unsynced += len(data)
+        if self.fsync_interval and self._unsynced >= self.fsync_interval:
+            self._sync()
+
+    def _sync(self):
+        """書き込み済みデータをディスクに反映し、所要時間を記録"""
+        self._file.flush()
+        start = time.monotonic()
+        os.fsync(self._file.fileno())
+        elapsed = time.monotonic() - start
+        self.fsync_count += 1
+        self.fsync_total += elapsed
+        self.fsync_max = max(self.fsync_max, elapsed)
+        self._unsynced = 0
+
+    def commit(self) -> Dict[str, Any]:
+        """
+        一時ファイルをディスクに反映して公開先にリネーム
+        Returns:
+            書き込み統計
+        """
+        if self._file is None:
+            # エンコーダーが一時ファイルに直接書き込んだ場合
+            self.bytes_written = os.path.getsize(self.temp_path)
+            self._file = open(self.temp_path, 'rb+')
+        try:
+            self._sync()
+        finally:
+            self._file.close()
+            self._file = None
+        os.replace(self.temp_path, self.output_path)
+        self._sync_directory()
+
+        stats = self.stats
+        logger.info(
+            f"クリップを公開: {os.path.basename(self.output_path)} "
+            f"{stats['bytes'] / 1024 / 1024:.1f}MB {stats['throughput_mb_s']:.1f}MB/s "
+            f"fsync {stats['fsync_count']}回 (平均 {stats['fsync_avg_ms']:.1f}ms, 最大 {stats['fsync_max_ms']:.1f}ms)"
+        )
+        return stats
+
+    def _sync_directory(self):
+        """リネームをディスクに反映（ディレクトリのfsyncに対応しないOSでは無視）"""
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def abort(self):
+        """書き込みを中止し、一時ファイルを削除"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"一時ファイルの削除に失敗: {self.temp_path}: {e}")
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """書き込みスループットとfsync時間"""
+        elapsed = time.monotonic() - self._started
+        return {
+            'bytes': self.bytes_written,
+            'elapsed': elapsed,
+            'throughput_mb_s': self.bytes_written / 1024 / 1024 / elapsed if elapsed > 0 else 0.0,
+            'fsync_count': self.fsync_count,
+            'fsync_avg_ms': self.fsync_total / self.fsync_count * 1000 if self.fsync_count else 0.0,
+            'fsync_max_ms': self.fsync_max * 1000
+        }
+
+def remove_stale_temp_files(directory: str) -> int:
+    """異常終了で残った書き込み途中の一時ファイルを削除"""
+    removed = 0
+    for path in glob.glob(os.path.join(directory, f'.*{TEMP_MARKER}.*')):
+        try:
+            os.remove(path)
+            removed += 1
+            logger.warning(f"書き込み途中の一時ファイルを削除: {path}")
+        except OSError as e:
+            logger.warning(f"一時ファイルの削除に失敗: {path}: {e}")
+    return removed
@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+from exceptions import TriggerError
+from utils import now
+
+def ntp_sample(t0: float, t1: float, t2: float, t3: float) -> Tuple[float, float]:
+    """
+    1回の往復から時計のずれを計算（NTP方式）
+    Args:
+        t0: 要求を送信した時刻（要求側の時計）
+        t1: 要求を受信した時刻（応答側の時計）
+        t2: 応答を送信した時刻（応答側の時計）
+        t3: 応答を受信した時刻（要求側の時計）
+    Returns:
+        (応答側の時計 - 要求側の時計, 往復の通信時間)
+    """
+    offset = ((t1 - t0) + (t2 - t3)) / 2
+    delay = (t3 - t0) - (t2 - t1)
+    return offset, delay
+
+class ClockEstimate:
+    """クライアントの時計のずれの推定値"""
+    def __init__(self, offset: float, uncertainty: float, samples: int):
+        self.offset = offset  # クライアントの時計 - サーバーの時計（秒）
+        self.uncertainty = uncertainty  # 推定誤差の上限（秒）
+        self.samples = samples
+
+    def to_dict(self):
+        return {'offset': self.offset, 'uncertainty': self.uncertainty, 'samples': self.samples}
+
+class ClockOffsetEstimator:
+    """
+    クライアントごとの時計のずれの推定
+    直近の往復のうち通信時間が最短のものを採用し（NTPのクロックフィルタ）、
+    往復時間の半分に経過時間分のドリフトを加えたものを誤差とする
+    """
+    def __init__(self, window: int = 8, max_sample_age: float = 600.0, drift_ppm: float = 100.0,
+                 max_event_age: float = 30.0, max_clients: int = 256):
+        """
+        Args:
+            window: クライアントごとに保持する往復の数
+            max_sample_age: これより古い往復は使わない（秒）
+            drift_ppm: 計測後に時計がずれていく速さの想定（ppm）
+            max_event_age: 受信時刻よりこれ以上古いイベント時刻は受け付けない（秒）
+            max_clients: 計測を保持するクライアントの数（超えたら最も長く計測の無いものから忘れる）
+        """
+        self.window = window
+        self.max_sample_age = max_sample_age
+        self.drift = drift_ppm / 1e6
+        self.max_event_age = max_event_age
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        # クライアントの識別名は要求側が指定するため、数に上限を設ける（最近計測した順）
+        self._samples: Dict[str, deque] = OrderedDict()
+
+    def add_sample(self, client: str, offset: float, delay: float, measured_at: float = None):
+        """
+        往復1回分の計測結果を追加
+        Args:
+            client: クライアントの識別名
+            offset: クライアントの時計 - サーバーの時計
+            delay: 往復の通信時間（処理時間を除く）
+            measured_at: 計測した時刻（サーバーの時計）
+        """
+        if delay < 0:
+            # 時計の巻き戻りなどで往復時間が負になった計測は使わない
+            return
+        measured_at = now() if measured_at is None else measured_at
+        with self._lock:
+            samples = self._samples.get(client)
+            if samples is None:
+                samples = self._samples[client] = deque(maxlen=self.window)
+                if len(self._samples) > self.max_clients:
+                    self._samples.popitem(last=False)
+            else:
+                self._samples.move_to_end(client)
+            samples.append((offset, delay, measured_at))
+
+    def estimate(self, client: str) -> Optional[ClockEstimate]:
+        """時計のずれの推定値（有効な計測が無い場合はNone）"""
+        current = now()
+        with self._lock:
+            samples = [
+                sample for sample in self._samples.get(client, ())
+                if current - sample[2] <= self.max_sample_age
+            ]
+        if not samples:
+            return None
+        offset, delay, measured_at = min(samples, key=lambda sample: sample[1])
+        uncertainty = delay / 2 + self.drift * (current - measured_at)
+        return ClockEstimate(offset, uncertainty, len(samples))
+
+    def correct(self, client: str, event_time: float,
+                received_at: float) -> Tuple[float, Optional[ClockEstimate]]:
+        """
+        クライアントの時計のイベント時刻をサーバーの時計に変換
+        計測が無い場合はクライアントの時刻をそのまま使う。受信時刻より後になる場合は受信時刻に丸める
+        Args:
+            client: クライアントの識別名
+            event_time: イベント時刻（クライアントの時計）
+            received_at: 受信時刻（サーバーの時計）
+        Returns:
+            (補正後のイベント時刻, 使用した推定値)
+        """
+        estimate = self.estimate(client)
+        corrected = event_time - estimate.offset if estimate else event_time
+        if received_at - corrected > self.max_event_age:
+            raise TriggerError(
+                f"イベント時刻が古すぎます: {received_at - corrected:.1f}秒前 (client={client})"
+            )
+        return min(corrected, received_at), estimate
+
+    def clients(self) -> Dict[str, dict]:
+        """全クライアントの推定値（/status 用）"""
+        with self._lock:
+            names = list(self._samples)
+        result = {}
+        for name in names:
+            estimate = self.estimate(name)
+            if estimate:
+                result[name] = estimate.to_dict()
+        return result
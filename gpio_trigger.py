@@ -0,0 +1,185 @@
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from exceptions import TriggerError
+from utils import logger, now
+
+# GPIOライブラリ（Raspberry Pi以外では無い場合がある）
+try:
+    from gpiozero import DigitalInputDevice
+    GPIOZERO_AVAILABLE = True
+    logger.debug("gpiozero library is available.")
+except ImportError:
+    GPIOZERO_AVAILABLE = False
+
+try:
+    import RPi.GPIO as GPIO
+    RPIGPIO_AVAILABLE = True
+    logger.debug("RPi.GPIO library is available.")
+except (ImportError, RuntimeError):
+    # RPi.GPIO はRaspberry Pi以外ではRuntimeErrorになる
+    RPIGPIO_AVAILABLE = False
+
+GPIO_AVAILABLE = GPIOZERO_AVAILABLE or RPIGPIO_AVAILABLE
+
+class PinState:
+    """
+    ピンごとのデバウンスの状態
+    押下のエッジで即座にトリガーし、離した後の一定時間内に戻ったエッジはチャタリングとして無視する
+    """
+    def __init__(self, source: str):
+        self.source = source
+        self.pressed = False
+        self.released_at = None  # 最後に離したエッジの時刻
+        self.edges = 0
+        self.triggers = 0
+        self.bounces = 0
+
+    def on_edge(self, active: bool, timestamp: float, bounce_time: float) -> bool:
+        """
+        エッジの処理
+        Args:
+            active: 押下側のエッジか
+            timestamp: エッジの時刻
+            bounce_time: チャタリングとみなす時間（秒）
+        Returns:
+            トリガーする場合はTrue
+        """
+        self.edges += 1
+        if not active:
+            if self.pressed:
+                self.pressed = False
+                self.released_at = timestamp
+            return False
+        if self.pressed:
+            # 同じ向きのエッジが続いた（離したエッジを取りこぼした）
+            return False
+        self.pressed = True
+        if self.released_at is not None and timestamp - self.released_at < bounce_time:
+            self.bounces += 1
+            return False
+        self.triggers += 1
+        return True
+
+class GpioTriggerEngine:
+    """
+    GPIOトリガー
+    エッジのコールバックでは時刻を記録して状態を更新するだけにし、待機や再読み込みは行わない
+    複数のピンをそれぞれ別の発生元としてトリガーできる
+    """
+    def __init__(self, pins: Dict[int, str], callback: Callable[[str, float], Any],
+                 library: str = 'auto', bounce_time: float = 0.05, pin_factory=None):
+        """
+        Args:
+            pins: ピン番号（BCM） -> 発生元の名前
+            callback: トリガー時に (発生元, エッジの時刻) で呼び出す関数
+            library: auto / gpiozero / rpigpio
+            bounce_time: チャタリングとみなす時間（秒）
+            pin_factory: gpiozero のピンファクトリ（MockFactory などで実機なしに動かす場合）
+        """
+        if not pins:
+            raise TriggerError("GPIOピンが指定されていません")
+        self.pins = dict(pins)
+        self.callback = callback
+        self.bounce_time = bounce_time
+        self.pin_factory = pin_factory
+        self.library = self._select_library(library)
+        self._states = {pin: PinState(source) for pin, source in self.pins.items()}
+        self._lock = threading.Lock()
+        self._devices = []
+
+    def _select_library(self, preference: str) -> str:
+        preference = preference.lower()
+        if self.pin_factory is not None or preference == 'gpiozero':
+            if GPIOZERO_AVAILABLE:
+                return 'gpiozero'
+        elif preference in ('rpigpio', 'rpi.gpio'):
+            if RPIGPIO_AVAILABLE:
+                return 'rpigpio'
+        elif preference == 'auto':
+            if GPIOZERO_AVAILABLE:
+                return 'gpiozero'
+            if RPIGPIO_AVAILABLE:
+                return 'rpigpio'
+        raise TriggerError(f"要求されたGPIOライブラリ '{preference}' が利用できないか、'auto' で利用可能なライブラリがありません。")
+
+    def start(self):
+        """全ピンの監視を開始（プルアップ、LOWで押下）"""
+        try:
+            for pin in self.pins:
+                if self.library == 'gpiozero':
+                    self._start_gpiozero(pin)
+                else:
+                    self._start_rpigpio(pin)
+        except Exception as e:
+            self.stop()
+            raise TriggerError(f"GPIOピン {pin} の初期化に失敗 ({self.library}): {e}")
+        logger.info(f"GPIOリスナーを開始 ({self.library}): " + ', '.join(
+            f"pin{pin}={source}" for pin, source in self.pins.items()
+        ))
+
+    def _start_gpiozero(self, pin: int):
+        # チャタリングはこちらで処理するため、gpiozero の bounce_time は使わない
+        device = DigitalInputDevice(pin, pull_up=True, bounce_time=None, pin_factory=self.pin_factory)
+        self._devices.append(device)
+        device.when_activated = lambda: self.on_edge(pin, True)
+        device.when_deactivated = lambda: self.on_edge(pin, False)
+
+    def _start_rpigpio(self, pin: int):
+        if not self._devices:
+            GPIO.setmode(GPIO.BCM)
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        self._devices.append(pin)
+
+        def on_change(channel):
+            timestamp = now()
+            self.on_edge(channel, GPIO.input(channel) == GPIO.LOW, timestamp)
+
+        GPIO.add_event_detect(pin, GPIO.BOTH, callback=on_change)
+
+    def stop(self):
+        """監視を停止し、ピンを解放"""
+        devices, self._devices = self._devices, []
+        if self.library == 'gpiozero':
+            for device in devices:
+                try:
+                    device.close()
+                except Exception as e:
+                    logger.error(f"Error closing gpiozero device: {e}")
+        elif devices:
+            try:
+                GPIO.cleanup(devices)
+            except Exception as e:
+                logger.error(f"Error cleaning up RPi.GPIO: {e}")
+
+    def on_edge(self, pin: int, active: bool, timestamp: Optional[float] = None):
+        """
+        エッジの処理（ライブラリのイベントスレッドから呼ばれる）
+        Args:
+            pin: ピン番号
+            active: 押下側のエッジか
+            timestamp: エッジの時刻（省略時は現在時刻）
+        """
+        if timestamp is None:
+            timestamp = now()
+        state = self._states.get(pin)
+        if state is None:
+            return
+        with self._lock:
+            fire = state.on_edge(active, timestamp, self.bounce_time)
+        if fire:
+            self.callback(state.source, timestamp)
+
+    def stats(self) -> Dict[str, Any]:
+        """ピンごとのエッジ・トリガー・チャタリングの件数（/status 用）"""
+        with self._lock:
+            return {
+                f"pin{pin}": {
+                    'source': state.source,
+                    'pressed': state.pressed,
+                    'edges': state.edges,
+                    'triggers': state.triggers,
+                    'bounces': state.bounces
+                }
+                for pin, state in self._states.items()
+            }
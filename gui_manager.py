@@ -52,7 +52,8 @@ class GUIManager:
         self.trigger_frame = ttk.LabelFrame(self.control_frame, text="トリガー設定")
         self.trigger_frame.pack(fill=tk.X, padx=5, pady=5)
 
-        self.trigger_type = tk.StringVar(value="keyboard")
+        # 複数のトリガーを同時に有効化できる
+        self.trigger_vars = {}
         # プラットフォームに応じてトリガーオプションを設定
         triggers = [("キーボード", "keyboard")]
         
@@ -63,16 +64,18 @@ class GUIManager:
         # その他のトリガー
         triggers.extend([
             ("HTTP", "http"),
-            ("WebSocket", "websocket")
+            ("WebSocket", "websocket"),
+            ("動き検知", "motion")
         ])
         
         for text, value in triggers:
-            ttk.Radiobutton(
+            var = tk.BooleanVar(value=False)
+            self.trigger_vars[value] = var
+            ttk.Checkbutton(
                 self.trigger_frame,
                 text=text,
-                value=value,
-                variable=self.trigger_type,
-                command=self._on_trigger_type_change
+                variable=var,
+                command=lambda value=value: self._on_trigger_toggle(value)
             ).pack(anchor=tk.W, padx=5, pady=2)
 
         # 録画時間設定
@@ -176,6 +179,7 @@ class GUIManager:
                 self.preview_running = True
                 self.preview_thread = threading.Thread(
                     target=self._update_preview,
+                    name='preview',
                     daemon=True
                 )
                 self.preview_thread.start()
@@ -238,25 +242,37 @@ class GUIManager:
                     self.preview_label.config(image=photo)
                     self.preview_label.image = photo  # ガベージコレクション対策
 
-    def _on_trigger_type_change(self):
-        """トリガータイプが変更された時の処理"""
-        if self.trigger_manager:
-            self.trigger_manager.set_trigger_type(self.trigger_type.get())
+    def _on_trigger_toggle(self, trigger_type):
+        """トリガーの有効・無効が切り替えられた時の処理（他のトリガーは再起動しない）"""
+        if not self.trigger_manager:
+            return
+        if self.trigger_vars[trigger_type].get():
+            if not self.trigger_manager.enable_trigger(trigger_type):
+                self.status_var.set(f"トリガー {trigger_type} を開始できませんでした")
+        else:
+            self.trigger_manager.disable_trigger(trigger_type)
 
     def _on_camera_change(self, event=None):
         """カメラ番号が変更された時の処理"""
         if self.video_manager and self.video_manager.running:
-            # 現在のカメラを停止
-            self.video_manager.stop_capture()
-            # 新しいカメラで再起動
+            # 録画を止めずに切り替える（新しいカメラの準備ができるまで現在のカメラで録画を続ける）
             camera_id = int(self.camera_id.get())
-            success = self.video_manager.start_capture(device_id=camera_id)
-            if not success:
-                self.status_var.set(f"カメラ {camera_id} の起動に失敗しました")
-                # 失敗した場合は録画を停止
-                self._stop_recording()
-            else:
-                self.status_var.set(f"カメラ {camera_id} に切り替えました")
+
+            def show_result(success):
+                if success:
+                    self.status_var.set(f"カメラ {camera_id} に切り替えました")
+                else:
+                    self.status_var.set(f"カメラ {camera_id} への切り替えに失敗しました")
+                    # 録画を続けられなくなった場合のみ停止
+                    if not self.video_manager.running:
+                        self._stop_recording()
+
+            def on_done(success):
+                # 切り替えスレッドから呼ばれるため、Tkの操作はイベントループで行う
+                self.root.after(0, show_result, success)
+
+            if self.video_manager.switch_camera(device_id=camera_id, on_done=on_done):
+                self.status_var.set(f"カメラ {camera_id} に切り替え中...")
 
     def _manual_trigger(self):
         """手動トリガーボタンが押された時の処理"""
@@ -281,5 +297,11 @@ class GUIManager:
         """マネージャーの設定"""
         self.video_manager = video_manager
         self.trigger_manager = trigger_manager
-        # 初期トリガータイプを設定
-        self.trigger_manager.set_trigger_type(self.trigger_type.get())
+        # 動き検知はバッファの最新フレームを解析する
+        self.trigger_manager.set_frame_source(self.video_manager.get_latest_entry)
+        self.trigger_manager.add_status_provider('capture', self.video_manager.capture_metrics)
+        self.trigger_manager.set_config_handler(self.video_manager.reconfigure)
+        self.trigger_manager.set_telemetry_handler(self.video_manager.update_telemetry)
+        # 設定で有効なトリガーをチェックボックスに反映
+        for trigger_type, var in self.trigger_vars.items():
+            var.set(trigger_type in self.trigger_manager.enabled_types)
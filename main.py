@@ -1,13 +1,17 @@
 import tkinter as tk
 import threading
 import os
+import signal
 import sys
 from datetime import datetime
 
 from gui_manager import GUIManager
 from video_manager import VideoManager
 from trigger_manager import TriggerManager, TriggerEvent
-from utils import logger, Config
+from clip_catalog import ClipCatalog
+from clip_writer import remove_stale_temp_files
+from tracing import tracer
+from utils import logger, configure_logging, Config
 from exceptions import VideoError, TriggerError, ConfigError
 
 class RecorderApp:
@@ -20,6 +24,8 @@ class RecorderApp:
         try:
             # 設定の読み込み
             self.config = Config(config_path)
+            configure_logging(self.config)
+            tracer.configure(self.config)
             
             # GUIの初期化
             self.root = tk.Tk()
@@ -32,6 +38,11 @@ class RecorderApp:
             
             # マネージャーの設定
             self.gui.set_managers(self.video_manager, self.trigger_manager)
+
+            # クリップカタログ（保存先ディレクトリごとに作成）
+            self.save_dir = None
+            self.clip_catalog = None
+            self._prepare_save_dir(self.gui.save_path.get())
             
             # トリガー監視スレッドの初期化
             self.trigger_thread = None
@@ -39,6 +50,11 @@ class RecorderApp:
 
             # ウィンドウクローズ時のイベントハンドラを設定
             self.root.protocol("WM_DELETE_WINDOW", self._on_closing)
+
+            # SIGTERM（サービスの停止・再起動）でもウィンドウを閉じた時と同様に終了処理を行う
+            self._terminate_requested = False
+            signal.signal(signal.SIGTERM, self._on_signal)
+            self._watch_signals()
             
             # エラーハンドラの設定
             sys.excepthook = self._handle_exception
@@ -58,11 +74,44 @@ class RecorderApp:
             self._show_error("初期化エラー", str(e))
             sys.exit(1)
 
+    def _prepare_save_dir(self, save_dir: str):
+        """
+        保存先ディレクトリの準備（変更時のみ）
+        書き込み途中で残った一時ファイルを削除し、クリップカタログを開く
+        Args:
+            save_dir: 保存先ディレクトリ
+        """
+        if save_dir == self.save_dir:
+            return
+        self.save_dir = save_dir
+        os.makedirs(save_dir, exist_ok=True)
+        # 前回異常終了した時の書き込み途中のファイルを削除
+        remove_stale_temp_files(save_dir)
+
+        if not self.config.get('catalog', 'enabled', True):
+            return
+        db_path = os.path.join(save_dir, self.config.get('catalog', 'filename', 'clips.db'))
+        if self.clip_catalog:
+            self.clip_catalog.close()
+            self.clip_catalog = None
+        try:
+            self.clip_catalog = ClipCatalog(
+                db_path,
+                max_disk_mb=self.config.get('catalog', 'max_disk_mb', 0),
+                max_age_days=self.config.get('catalog', 'max_age_days', 0),
+                policy=self.config.get('catalog', 'policy', 'priority')
+            )
+            self.clip_catalog.start_retention(self.config.get('catalog', 'retention_interval', 60))
+        except Exception as e:
+            logger.error(f"クリップカタログを開けませんでした: {e}")
+        self.trigger_manager.set_clip_catalog(self.clip_catalog)
+
     def _start_trigger_monitoring(self):
         """トリガー監視を開始"""
         self.monitoring = True
         self.trigger_thread = threading.Thread(
             target=self._monitor_triggers,
+            name='trigger-monitor',
             daemon=True
         )
         self.trigger_thread.start()
@@ -72,8 +121,10 @@ class RecorderApp:
         """トリガーイベントを監視"""
         while self.monitoring:
             try:
-                trigger = self.trigger_manager.get_trigger()
+                # キューにイベントが入るまでブロック（停止確認のため一定時間で戻る）
+                trigger = self.trigger_manager.get_trigger(timeout=0.5)
                 if trigger:
+                    tracer.span(trigger.trace_id, 'trigger.dequeued', trigger.admitted_at, type=trigger.type)
                     self._handle_trigger(trigger)
             except Exception as e:
                 logger.error(f"トリガー監視中にエラー: {e}")
@@ -87,11 +138,11 @@ class RecorderApp:
         try:
             # 保存先ディレクトリの準備
             save_dir = self.gui.save_path.get()
-            os.makedirs(save_dir, exist_ok=True)
+            self._prepare_save_dir(save_dir)
 
-            # ファイル名の生成
-            timestamp = datetime.fromtimestamp(trigger.timestamp).strftime("%Y%m%d_%H%M%S")
-            filename = f"record_{trigger.type}_{timestamp}.mp4"
+            # ファイル名の生成（同じ秒に複数のトリガーがあっても重複しないよう、ミリ秒とトレースIDを付ける）
+            timestamp = datetime.fromtimestamp(trigger.timestamp).strftime("%Y%m%d_%H%M%S_%f")[:-3]
+            filename = f"record_{trigger.type}_{timestamp}_{trigger.trace_id}.mp4"
             filepath = os.path.join(save_dir, filename)
 
             # 動画の保存
@@ -101,15 +152,28 @@ class RecorderApp:
             self.gui.status_var.set(f"トリガー検知 ({trigger.type}): {filename}を保存中...")
             logger.info(f"トリガー検知: type={trigger.type}, source={trigger.source}")
             
-            success = self.video_manager.save_video(
+            clip = self.video_manager.save_video(
                 filepath,
                 before_time,
-                after_time
+                after_time,
+                trigger_time=trigger.timestamp,
+                trace_id=trigger.trace_id
+            )
+            tracer.span(
+                trigger.trace_id, 'clip.total', trigger.timestamp,
+                type=trigger.type, source=trigger.source, saved=clip is not None
             )
             
-            if success:
+            if clip:
                 self.gui.status_var.set(f"保存完了: {filename}")
                 logger.info(f"動画を保存: {filename}")
+                if self.clip_catalog:
+                    clip.trigger_type = trigger.type
+                    clip.source = trigger.source
+                    clip.priority = self.trigger_manager.priorities.get(trigger.type, 0)
+                    clip.clock_offset = trigger.clock_offset
+                    clip.clock_uncertainty = trigger.clock_uncertainty
+                    self.clip_catalog.add(clip)
             else:
                 self.gui.status_var.set("保存失敗")
                 logger.error("動画の保存に失敗")
@@ -125,7 +189,7 @@ class RecorderApp:
             if self.gui:
                 self.gui._stop_recording()
             if self.video_manager:
-                self.video_manager.stop_capture()
+                self.video_manager.shutdown()
             if self.trigger_manager:
                 self.trigger_manager.stop_listening()
                 
@@ -135,10 +199,28 @@ class RecorderApp:
                     self.trigger_thread.join(timeout=3.0)
                 except:
                     pass
+            if self.clip_catalog:
+                self.clip_catalog.close()
+            tracer.close()
         finally:
             self.root.quit()
             self.root.destroy()
 
+    def _on_signal(self, signum, frame):
+        """終了シグナルを受け取った（終了処理はTkのイベントループで行う）"""
+        logger.info(f"シグナルを受信しました: {signum}")
+        self._terminate_requested = True
+
+    def _watch_signals(self):
+        """
+        終了要求の確認
+        Tkのイベントループ中でもPythonのシグナルハンドラが実行されるよう、定期的に呼び出す
+        """
+        if self._terminate_requested:
+            self._on_closing()
+            return
+        self.root.after(500, self._watch_signals)
+
     def _handle_exception(self, exc_type, exc_value, exc_traceback):
         """未処理の例外をハンドル"""
         logger.error(
@@ -0,0 +1,229 @@
+import string
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from exceptions import ConfigError
+from utils import Config
+
+# 事前に描画する文字（それ以外の文字は '?' で表示）
+ATLAS_CHARSET = ''.join(chr(code) for code in range(32, 127))
+
+class GlyphAtlas:
+    """
+    文字ごとに描画済みのタイル（背景付き、アンチエイリアス済み）
+    行への描画はタイルのスライスへの代入だけで済む
+    """
+    def __init__(self, font_scale: float, thickness: int,
+                 color: Tuple[int, int, int] = (255, 255, 255),
+                 background: Tuple[int, int, int] = (0, 0, 0)):
+        """
+        Args:
+            font_scale: cv2.putText のフォントスケール
+            thickness: 線の太さ
+            color: 文字色 (B, G, R)
+            background: 背景色 (B, G, R)
+        """
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        sizes = [cv2.getTextSize(char, font, font_scale, thickness) for char in ATLAS_CHARSET]
+        ascent = max(height for (_, height), _ in sizes)
+        descent = max(baseline for _, baseline in sizes)
+        self.height = ascent + descent + 2 * thickness
+        self.background = np.array(background, dtype=np.uint8)
+
+        self._glyphs = {}
+        for char, ((width, _), _) in zip(ATLAS_CHARSET, sizes):
+            # 文字間の余白を含めた幅（プロポーショナル）
+            tile = np.empty((self.height, width + thickness, 3), dtype=np.uint8)
+            tile[:] = self.background
+            cv2.putText(tile, char, ((thickness + 1) // 2, ascent + thickness), font, font_scale, color, thickness, cv2.LINE_AA)
+            self._glyphs[char] = tile
+        self.max_width = max(tile.shape[1] for tile in self._glyphs.values())
+
+    def glyph(self, char: str) -> np.ndarray:
+        return self._glyphs.get(char, self._glyphs['?'])
+
+class TextLine:
+    """
+    1行分の描画結果のキャッシュ
+    前回と異なる文字（と、幅が変わって位置がずれた後続の文字）のタイルだけを書き換える
+    """
+    def __init__(self, atlas: GlyphAtlas, max_chars: int):
+        self.atlas = atlas
+        self.max_chars = max_chars
+        self.image = np.empty((atlas.height, atlas.max_width * max_chars, 3), dtype=np.uint8)
+        self.image[:] = atlas.background
+        self.text = ''
+        self.width = 0  # 現在の文字列の描画幅
+        self._positions = []  # 各文字の描画位置
+
+    def update(self, text: str) -> int:
+        """
+        表示する文字列を更新
+        Returns:
+            書き換えた文字数
+        """
+        text = text[:self.max_chars]
+        if text == self.text:
+            return 0
+        changed = 0
+        positions = []
+        x = 0
+        for index, char in enumerate(text):
+            glyph = self.atlas.glyph(char)
+            # 同じ位置に同じ文字が描画済みなら書き換えない
+            if not (index < len(self.text) and self.text[index] == char and self._positions[index] == x):
+                self.image[:, x:x + glyph.shape[1]] = glyph
+                changed += 1
+            positions.append(x)
+            x += glyph.shape[1]
+        if x < self.width:
+            # 短くなった分を背景で消す
+            self.image[:, x:self.width] = self.atlas.background
+        self.text = text
+        self.width = x
+        self._positions = positions
+        return changed
+
+class Telemetry:
+    """HTTP APIなどから受け取った表示用の値（速度など）。一定時間更新がない値は表示しない"""
+    MAX_FIELDS = 16
+
+    def __init__(self, max_age: float = 5.0):
+        """
+        Args:
+            max_age: 値を表示し続ける秒数
+        """
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def update(self, values: Dict[str, Any]):
+        """値の更新（数値または短い文字列のみ）"""
+        for key, value in values.items():
+            if not isinstance(key, str) or not key.isidentifier():
+                raise ConfigError(f"項目名が不正です: {key}")
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ConfigError(f"{key} は数値または文字列で指定してください")
+            if isinstance(value, str) and len(value) > 32:
+                raise ConfigError(f"{key} が長すぎます")
+        updated = time.monotonic()
+        with self._lock:
+            if len(set(self._values) | set(values)) > self.MAX_FIELDS:
+                raise ConfigError(f"項目は{self.MAX_FIELDS}個までです")
+            for key, value in values.items():
+                self._values[key] = (value, updated)
+
+    def current(self) -> Dict[str, Any]:
+        """有効期限内の値"""
+        limit = time.monotonic() - self.max_age
+        with self._lock:
+            return {key: value for key, (value, updated) in self._values.items() if updated >= limit}
+
+class _OverlayFormatter(string.Formatter):
+    """値が無い項目や書式が合わない項目は '--' にする"""
+    def get_value(self, key, args, kwargs):
+        return kwargs.get(key)
+
+    def format_field(self, value, format_spec):
+        if value is None:
+            return '--'
+        try:
+            return format(value, format_spec)
+        except (TypeError, ValueError):
+            return str(value)
+
+class FrameOverlay:
+    """
+    フレームへの日時・テレメトリの焼き込み
+    文字列が変わった時だけ変化した文字のタイルを書き換え、フレームには描画済みの行をコピーするだけにする
+    """
+    POSITIONS = ('top-left', 'top-right', 'bottom-left', 'bottom-right')
+
+    def __init__(self, template: str = '{time}', time_format: str = '%Y-%m-%d %H:%M:%S',
+                 position: str = 'bottom-left', scale: float = 1.0, margin: int = 8,
+                 max_chars: int = 48, telemetry: Telemetry = None):
+        """
+        Args:
+            template: 表示する文字列（{time} と テレメトリの項目名を使える。例: "{time} {speed:.0f}km/h"）
+            time_format: {time} の書式（strftime形式）
+            position: 表示位置 top-left / top-right / bottom-left / bottom-right
+            scale: 文字の大きさ（高さ720pxのフレームに対する倍率）
+            margin: フレームの端からの余白（ピクセル）
+            max_chars: 表示する最大文字数
+            telemetry: テレメトリの値
+        """
+        if position not in self.POSITIONS:
+            raise ConfigError(f"未対応の表示位置: {position}")
+        self.template = template
+        self.time_format = time_format
+        self.position = position
+        self.scale = scale
+        self.margin = margin
+        self.max_chars = max_chars
+        self.telemetry = telemetry
+        self._formatter = _OverlayFormatter()
+        self._line = None
+        self._frame_height = None
+        self._second = None
+        self._time_text = ''
+
+    @classmethod
+    def from_config(cls, config: Config, telemetry: Telemetry = None) -> Optional['FrameOverlay']:
+        """overlayセクションの設定から生成（無効の場合はNone）"""
+        if not config.get('overlay', 'enabled', False):
+            return None
+        return cls(
+            template=config.get('overlay', 'template', '{time}'),
+            time_format=config.get('overlay', 'time_format', '%Y-%m-%d %H:%M:%S'),
+            position=config.get('overlay', 'position', 'bottom-left'),
+            scale=config.get('overlay', 'scale', 1.0),
+            margin=config.get('overlay', 'margin', 8),
+            max_chars=config.get('overlay', 'max_chars', 48),
+            telemetry=telemetry
+        )
+
+    def _text(self, timestamp: float) -> str:
+        second = int(timestamp)
+        if second != self._second:
+            self._second = second
+            self._time_text = datetime.fromtimestamp(second).strftime(self.time_format)
+        values = self.telemetry.current() if self.telemetry else {}
+        values['time'] = self._time_text
+        try:
+            return self._formatter.vformat(self.template, (), values)
+        except (IndexError, KeyError, ValueError):
+            return self._time_text
+
+    def _prepare(self, frame_height: int):
+        """フレームの高さに合わせてアトラスを作成（解像度が変わった時のみ）"""
+        font_scale = max(0.3, frame_height / 720 * self.scale)
+        thickness = max(1, round(font_scale * 2))
+        self._line = TextLine(GlyphAtlas(font_scale, thickness), self.max_chars)
+        self._frame_height = frame_height
+
+    def apply(self, frame: np.ndarray, timestamp: float) -> np.ndarray:
+        """
+        フレームに文字列を焼き込む（フレームを直接書き換える）
+        Args:
+            frame: BGRフレーム
+            timestamp: フレームのキャプチャ時刻
+        """
+        height, width = frame.shape[:2]
+        if height != self._frame_height:
+            self._prepare(height)
+        line = self._line
+        line.update(self._text(timestamp))
+
+        line_width = min(line.width, width - self.margin)
+        line_height = min(line.image.shape[0], height - self.margin)
+        if line_width <= 0 or line_height <= 0:
+            return frame
+        x = self.margin if self.position.endswith('left') else width - self.margin - line_width
+        y = self.margin if self.position.startswith('top') else height - self.margin - line_height
+        frame[y:y + line_height, x:x + line_width] = line.image[:line_height, :line_width]
+        return frame
@@ -0,0 +1,130 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict
+
+from exceptions import ResourceError
+from utils import logger
+
+class ProfilerBusyError(ResourceError):
+    """プロファイラーが既に実行中"""
+    pass
+
+class SamplingProfiler:
+    """
+    全スレッドのスタックを一定間隔で採取するサンプリングプロファイラー
+    停止中はスレッドを持たないため、オーバーヘッドはない
+    結果は flamegraph.pl / speedscope で読める collapsed 形式で出力する
+    """
+    def __init__(self, output_dir: str = 'logs', interval: float = 0.01, max_seconds: float = 300):
+        """
+        プロファイラーの初期化
+        Args:
+            output_dir: 出力先ディレクトリ
+            interval: サンプリング間隔（秒）
+            max_seconds: 1回の計測の最大秒数
+        """
+        self.output_dir = output_dir
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._output_path = None
+        self._finished_at = None
+
+    @property
+    def running(self) -> bool:
+        with self._lock:
+            return self._thread is not None
+
+    def start(self, seconds: float) -> str:
+        """
+        計測を開始
+        Args:
+            seconds: 計測する秒数
+        Returns:
+            出力ファイルのパス
+        """
+        if seconds <= 0:
+            raise ResourceError("計測時間は正の値を指定してください")
+        seconds = min(seconds, self.max_seconds)
+        with self._lock:
+            if self._thread is not None:
+                raise ProfilerBusyError("プロファイラーは既に実行中です")
+            os.makedirs(self.output_dir, exist_ok=True)
+            self._output_path = os.path.join(
+                self.output_dir, datetime.now().strftime('profile-%Y%m%d-%H%M%S.collapsed')
+            )
+            self._finished_at = time.monotonic() + seconds
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(self._output_path,),
+                name='profiler',
+                daemon=True
+            )
+            self._thread.start()
+        logger.info(f"プロファイラーを開始: {seconds:g}秒, 出力={self._output_path}")
+        return self._output_path
+
+    def stop(self):
+        """計測を途中で終了（採取済みの結果は出力する）"""
+        self._stop_event.set()
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5.0)
+
+    def status(self) -> Dict[str, Any]:
+        """計測状態"""
+        with self._lock:
+            remaining = None
+            if self._thread is not None:
+                remaining = max(0.0, self._finished_at - time.monotonic())
+            return {
+                'running': self._thread is not None,
+                'remaining': remaining,
+                'path': self._output_path
+            }
+
+    def _run(self, output_path: str):
+        own_ident = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        try:
+            while not self._stop_event.is_set() and time.monotonic() < self._finished_at:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stacks[self._collapse(names.get(ident, f'thread-{ident}'), frame)] += 1
+                samples += 1
+                self._stop_event.wait(self.interval)
+            self._write(output_path, stacks)
+            logger.info(f"プロファイラーを終了: {samples}サンプル, 出力={output_path}")
+        except Exception as e:
+            logger.error(f"プロファイリング中にエラー: {e}")
+        finally:
+            with self._lock:
+                self._thread = None
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        """スタックを「スレッド名;外側の関数;...;内側の関数」の形式に変換"""
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        parts.append(thread_name)
+        return ';'.join(reversed(parts))
+
+    @staticmethod
+    def _write(output_path: str, stacks: Counter):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
@@ -0,0 +1,161 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+    SHARED_MEMORY_AVAILABLE = True
+except ImportError:
+    # Python 3.7以前では shared_memory が利用できない
+    SHARED_MEMORY_AVAILABLE = False
+
+from exceptions import ResourceError, VideoError
+from utils import logger
+
+def _encode_clip(shm_name: str, spans: List[Tuple[int, int]], output_path: str,
+                 fps: float, frame_size: Tuple[int, int],
+                 encoder_settings: Dict[str, Any],
+                 save_settings: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    ワーカープロセス側: 共有メモリ上のJPEGデータをエンコードして保存
+    Args:
+        shm_name: 共有メモリブロック名
+        spans: 各フレームの (オフセット, 長さ)
+        output_path: 保存先のパス
+        fps: 出力フレームレート
+        frame_size: 出力解像度 (幅, 高さ)
+        encoder_settings: encoderセクションの設定値
+        save_settings: saveセクションの設定値（fsync間隔・帯域制限）
+    Returns:
+        書き込み統計（失敗時はNone）
+    """
+    import time
+    from clip_writer import ClipWriter
+    from video_encoder import create_encoder, create_decode_pool, write_payloads
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    writer = ClipWriter.from_settings(output_path, save_settings)
+    decode_pool = None
+    views = {}
+    payloads = []
+    try:
+        started = time.monotonic()
+        encoder = create_encoder(encoder_settings)
+        encoder.open(output_path, fps, frame_size, writer=writer)
+        if not encoder.accepts_jpeg:
+            decode_pool = create_decode_pool(save_settings)
+        try:
+            # コピーせず共有メモリ上のビューをそのまま渡す（同じ領域のフレームは同じビューを使う）
+            for span in spans:
+                if span not in views:
+                    offset, length = span
+                    views[span] = np.frombuffer(shm.buf, dtype=np.uint8, count=length, offset=offset)
+                payloads.append(views[span])
+            write_payloads(
+                encoder, payloads, decode_pool,
+                save_settings.get('decode_batch', 8),
+                save_settings.get('decode_window', 4)
+            )
+        finally:
+            success = encoder.close()
+        if not success:
+            writer.abort()
+            return None
+        elapsed = time.monotonic() - started
+        stats = writer.commit()
+        stats['export_fps'] = round(len(spans) / max(elapsed, 1e-6), 1)
+        return stats
+    except Exception:
+        writer.abort()
+        raise
+    finally:
+        if decode_pool is not None:
+            decode_pool.shutdown()
+        # 共有メモリを閉じる前にビューを解放する
+        views.clear()
+        payloads.clear()
+        shm.close()
+
+class SaveWorkerPool:
+    """保存・エンコード処理を別プロセスで実行するワーカープール"""
+    def __init__(self, workers: int, encoder_settings: Dict[str, Any],
+                 save_settings: Dict[str, Any] = None):
+        """
+        ワーカープールの初期化
+        Args:
+            workers: ワーカープロセス数
+            encoder_settings: encoderセクションの設定値
+            save_settings: saveセクションの設定値
+        """
+        if not SHARED_MEMORY_AVAILABLE:
+            raise ResourceError("multiprocessing.shared_memory が利用できません (Python 3.8以上が必要)")
+        self.encoder_settings = encoder_settings
+        self.save_settings = save_settings or {}
+        # Tkやカメラのスレッドを複製しないよう spawn で起動する
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        logger.info(f"保存ワーカープロセスを準備: workers={workers}")
+
+    def submit(self, output_path: str, payloads: Sequence[np.ndarray], fps: float,
+               frame_size: Tuple[int, int]) -> Future:
+        """
+        クリップの保存をワーカーに依頼
+        Args:
+            output_path: 保存先のパス
+            payloads: JPEG圧縮済みフレーム
+            fps: 出力フレームレート
+            frame_size: 出力解像度 (幅, 高さ)
+        """
+        # fps変換で複製されたフレームは一度だけコピーし、同じ領域を参照させる
+        unique = {id(payload): payload for payload in payloads}
+        total = sum(len(payload) for payload in unique.values())
+        shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+        try:
+            view = np.ndarray((total,), dtype=np.uint8, buffer=shm.buf)
+            locations = {}
+            offset = 0
+            for key, payload in unique.items():
+                length = len(payload)
+                view[offset:offset + length] = payload.reshape(-1)
+                locations[key] = (offset, length)
+                offset += length
+            del view
+            spans = [locations[id(payload)] for payload in payloads]
+
+            future = self._executor.submit(
+                _encode_clip, shm.name, spans, output_path, fps, frame_size,
+                self.encoder_settings, self.save_settings
+            )
+        except Exception:
+            self._release(shm)
+            raise
+
+        future.add_done_callback(lambda _: self._release(shm))
+        return future
+
+    def save(self, output_path: str, payloads: Sequence[np.ndarray], fps: float,
+             frame_size: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+        """クリップを保存し、完了まで待機（書き込み統計を返す。失敗時はNone）"""
+        future = self.submit(output_path, payloads, fps, frame_size)
+        try:
+            return future.result()
+        except Exception as e:
+            raise VideoError(f"保存ワーカーでエラー: {e}")
+
+    @staticmethod
+    def _release(shm):
+        """共有メモリブロックの解放"""
+        try:
+            shm.close()
+            shm.unlink()
+        except Exception as e:
+            logger.warning(f"共有メモリの解放中にエラー: {e}")
+
+    def shutdown(self):
+        """ワーカープールの停止"""
+        self._executor.shutdown(wait=True)
+        logger.info("保存ワーカープロセスを停止しました")
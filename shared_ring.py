@@ -0,0 +1,317 @@
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+    SHARED_MEMORY_AVAILABLE = True
+except ImportError:
+    SHARED_MEMORY_AVAILABLE = False
+
+from exceptions import ResourceError
+from utils import logger, monotonic_offset, BufferedFrame
+
+RING_MAGIC = 0x50445252  # 'PDRR'
+RING_VERSION = 2
+
+# 共有メモリ先頭のヘッダー（書き込み側のみが更新する）
+HEADER_DTYPE = np.dtype([
+    ('magic', '<u4'),
+    ('version', '<u4'),
+    ('slot_count', '<u4'),
+    ('slot_size', '<u4'),
+    ('width', '<u4'),
+    ('height', '<u4'),
+    ('fps', '<f8'),
+    ('write_index', '<u8'),  # これまでに書き込んだフレーム総数
+    ('heartbeat', '<f8'),  # 書き込み側の生存確認用時刻（単調時計）
+    ('stop_request', '<u4'),  # 読み出し側からの停止要求
+    ('reserved', '<u4'),
+    ('clock_anchor', '<f8'),  # 書き込み側の monotonic_offset()（タイムスタンプの変換用）
+])
+HEADER_SIZE = 64
+
+# スロットごとのヘッダー。seq は書き込み中は奇数、書き込み完了後は偶数（seqlock）
+SLOT_DTYPE = np.dtype([
+    ('seq', '<u8'),
+    ('timestamp', '<f8'),
+    ('length', '<u4'),
+    ('reserved', '<u4'),
+])
+
+def _align(size: int, alignment: int = 64) -> int:
+    return (size + alignment - 1) // alignment * alignment
+
+def _attach_untracked(name: str):
+    """
+    既存の共有メモリに接続（resource_trackerに登録しない）
+    読み出し側の終了時に書き込み側のブロックが削除されないようにする
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.12以前は track 引数が無いため、登録を取り消す
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+class SharedFrameRing:
+    """
+    JPEGフレームを格納する共有メモリのリングバッファ
+    書き込みは1プロセスのみ、読み出しは複数プロセスからロックなしで行う
+    """
+    def __init__(self, shm, owner: bool):
+        self._shm = shm
+        self.owner = owner
+        self._header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)
+        if int(self._header['magic'][0]) != RING_MAGIC:
+            raise ResourceError(f"共有メモリ {shm.name} はフレームリングではありません")
+        if int(self._header['version'][0]) != RING_VERSION:
+            raise ResourceError(
+                f"共有メモリ {shm.name} のバージョンが異なります: {int(self._header['version'][0])}"
+            )
+        # 書き込み側の now() の時刻をこのプロセスの now() の時刻に変換する差分
+        # （壁時計の基準はプロセスの起動時に決まるため、プロセスごとに異なる）
+        self._clock_shift = monotonic_offset() - float(self._header['clock_anchor'][0])
+        self.slot_count = int(self._header['slot_count'][0])
+        self.slot_size = int(self._header['slot_size'][0])
+        slots_size = _align(SLOT_DTYPE.itemsize * self.slot_count)
+        self._slots = np.ndarray(
+            (self.slot_count,), dtype=SLOT_DTYPE, buffer=shm.buf, offset=HEADER_SIZE
+        )
+        self._data = np.ndarray(
+            (self.slot_count, self.slot_size), dtype=np.uint8, buffer=shm.buf,
+            offset=HEADER_SIZE + slots_size
+        )
+
+    @classmethod
+    def create(cls, name: str, slot_count: int, slot_size: int,
+               width: int, height: int, fps: float) -> 'SharedFrameRing':
+        """リングバッファを新規作成（書き込み側）"""
+        if not SHARED_MEMORY_AVAILABLE:
+            raise ResourceError("multiprocessing.shared_memory が利用できません (Python 3.8以上が必要)")
+        size = HEADER_SIZE + _align(SLOT_DTYPE.itemsize * slot_count) + slot_count * slot_size
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # 異常終了したキャプチャプロセスの残骸を削除して作り直す
+            stale = _attach_untracked(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)
+        header[0] = (RING_MAGIC, RING_VERSION, slot_count, slot_size,
+                     width, height, fps, 0, time.monotonic(), 0, 0, monotonic_offset())
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'SharedFrameRing':
+        """既存のリングバッファに接続（読み出し側）"""
+        if not SHARED_MEMORY_AVAILABLE:
+            raise ResourceError("multiprocessing.shared_memory が利用できません (Python 3.8以上が必要)")
+        return cls(_attach_untracked(name), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def write_index(self) -> int:
+        """これまでに書き込まれたフレーム総数"""
+        return int(self._header['write_index'][0])
+
+    @property
+    def frame_info(self) -> Tuple[int, int, float]:
+        """書き込み側が設定した (幅, 高さ, 実測fps)"""
+        header = self._header[0]
+        return int(header['width']), int(header['height']), float(header['fps'])
+
+    def set_frame_info(self, width: int, height: int, fps: float):
+        """解像度と実測fpsを更新（書き込み側）"""
+        self._header['width'] = width
+        self._header['height'] = height
+        self._header['fps'] = fps
+
+    def touch(self):
+        """生存確認用の時刻を更新（書き込み側）"""
+        self._header['heartbeat'] = time.monotonic()
+
+    def writer_alive(self, timeout: float = 5.0) -> bool:
+        """書き込み側が動作中かどうか"""
+        return time.monotonic() - float(self._header['heartbeat'][0]) < timeout
+
+    def request_stop(self):
+        """書き込み側に停止を要求"""
+        self._header['stop_request'] = 1
+
+    @property
+    def stop_requested(self) -> bool:
+        return bool(self._header['stop_request'][0])
+
+    def write(self, payload: np.ndarray, timestamp: float) -> bool:
+        """
+        フレームを書き込み（書き込み側）
+        Args:
+            payload: JPEG圧縮済みフレーム
+            timestamp: フレームのタイムスタンプ（書き込み側の now()）
+        """
+        length = len(payload)
+        if length > self.slot_size:
+            logger.warning(f"フレームがスロットサイズを超えたため破棄: {length} > {self.slot_size}")
+            return False
+
+        index = self.write_index
+        slot = index % self.slot_count
+        self._slots['seq'][slot] = 2 * index + 1
+        self._data[slot, :length] = payload.reshape(-1)
+        self._slots['timestamp'][slot] = timestamp
+        self._slots['length'][slot] = length
+        self._slots['seq'][slot] = 2 * index + 2
+        self._header['write_index'] = index + 1
+        self._header['heartbeat'] = time.monotonic()
+        return True
+
+    def read(self, index: int) -> Optional[Tuple[float, np.ndarray]]:
+        """
+        指定インデックスのフレームを読み出し
+        上書き済み、または書き込み中の場合は None を返す
+        タイムスタンプはこのプロセスの now() の時刻に変換して返す
+        """
+        slot = index % self.slot_count
+        expected = 2 * index + 2
+        if int(self._slots['seq'][slot]) != expected:
+            return None
+        length = int(self._slots['length'][slot])
+        timestamp = float(self._slots['timestamp'][slot])
+        payload = self._data[slot, :length].copy()
+        if int(self._slots['seq'][slot]) != expected:
+            return None
+        return timestamp + self._clock_shift, payload
+
+    def timestamp_at(self, index: int) -> Optional[float]:
+        """指定インデックスのタイムスタンプ（ペイロードはコピーしない）"""
+        slot = index % self.slot_count
+        expected = 2 * index + 2
+        if int(self._slots['seq'][slot]) != expected:
+            return None
+        timestamp = float(self._slots['timestamp'][slot])
+        if int(self._slots['seq'][slot]) != expected:
+            return None
+        return timestamp + self._clock_shift
+
+    def read_range(self, start: int, end: int) -> List[Tuple[float, np.ndarray]]:
+        """[start, end) のうち読み出せたフレームを返す"""
+        start = max(start, end - self.slot_count, 0)
+        frames = []
+        for index in range(start, end):
+            frame = self.read(index)
+            if frame is not None:
+                frames.append(frame)
+        return frames
+
+    def close(self):
+        """共有メモリから切断"""
+        self._header = self._slots = self._data = None
+        self._shm.close()
+
+    def unlink(self):
+        """共有メモリブロックを削除（書き込み側）"""
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+class RingFrameBuffer:
+    """SharedFrameRingをFrameBufferと同じインターフェースで読み出すアダプター"""
+    def __init__(self, ring: SharedFrameRing):
+        self.ring = ring
+        self._floor = 0  # clear() 以前のフレームは返さない
+
+    def get_encoded_frames(self, count: int = None):
+        """JPEG圧縮済みフレームの取得（デコードなし）"""
+        end = self.ring.write_index
+        start = max(self._floor, end - count) if count else self._floor
+        return [payload for _, payload in self.ring.read_range(start, end)]
+
+    def _search(self, start: int, end: int, timestamp: float, inclusive: bool) -> int:
+        """
+        タイムスタンプの二分探索（スロットのタイムスタンプは書き込み順に単調増加）
+        inclusive がFalseなら timestamp 以上、Trueなら timestamp より大きい最初のインデックス
+        読み出し中に上書きされたスロットは古い側として扱う
+        """
+        while start < end:
+            middle = (start + end) // 2
+            value = self.ring.timestamp_at(middle)
+            if value is None or value < timestamp or (inclusive and value == timestamp):
+                start = middle + 1
+            else:
+                end = middle
+        return start
+
+    def get_entries(self, start_time: float = None, end_time: float = None) -> List[BufferedFrame]:
+        """指定時間範囲のフレームを古い順に取得（範囲内のスロットだけをコピーする）"""
+        end = self.ring.write_index
+        start = max(self._floor, end - self.ring.slot_count, 0)
+        if start_time is not None:
+            start = self._search(start, end, start_time, inclusive=False)
+        if end_time is not None:
+            end = self._search(start, end, end_time, inclusive=True)
+        width, height, _ = self.ring.frame_info
+        return [
+            BufferedFrame(timestamp, payload, (width, height))
+            for timestamp, payload in self.ring.read_range(start, end)
+            if (start_time is None or timestamp >= start_time)
+            and (end_time is None or timestamp <= end_time)
+        ]
+
+    def get_latest(self) -> Optional[BufferedFrame]:
+        """最新フレームの取得（デコードなし）"""
+        end = self.ring.write_index
+        if end <= self._floor:
+            return None
+        frame = self.ring.read(end - 1)
+        if frame is None:
+            return None
+        width, height, _ = self.ring.frame_info
+        return BufferedFrame(frame[0], frame[1], (width, height))
+
+    @property
+    def latest_timestamp(self) -> Optional[float]:
+        """最新フレームのタイムスタンプ"""
+        end = self.ring.write_index
+        if end <= self._floor:
+            return None
+        return self.ring.timestamp_at(end - 1)
+
+    def wait_for_frame(self, after: float, timeout: float) -> bool:
+        """指定時刻より新しいフレームが書き込まれるまで待機（別プロセスのためポーリング）"""
+        deadline = time.monotonic() + timeout
+        while True:
+            latest = self.latest_timestamp
+            if latest is not None and latest > after:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+
+    def get_frames(self, count: int = None):
+        """フレームの取得"""
+        import cv2
+
+        return [cv2.imdecode(frame, cv2.IMREAD_COLOR) for frame in self.get_encoded_frames(count)]
+
+    def clear(self):
+        """読み出し済み位置を進める（リング自体は書き込み側が管理）"""
+        self._floor = self.ring.write_index
+
+    @property
+    def frame_count(self):
+        """現在読み出し可能なフレーム数"""
+        end = self.ring.write_index
+        return end - max(self._floor, end - self.ring.slot_count, 0)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# リポジトリ直下のモジュールを読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# X サーバーの無い環境でも pynput（キーボードトリガー）を読み込めるようにする
+os.environ.setdefault('PYNPUT_BACKEND', 'dummy')
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+import yaml
+
+pytest.importorskip('gpiozero')
+from gpiozero.pins.mock import MockFactory
+
+from trigger_manager import TriggerManager
+from utils import Config, now
+
+BOUNCE_TIME = 0.05
+# エッジからキューへの追加までの許容時間（以前は待機だけで50ms掛かっていた）
+MAX_LATENCY = 0.010
+
+@pytest.fixture
+def gpio(tmp_path):
+    """MockFactory のピンで動かすGPIOトリガー（2ピン）"""
+    # 設定は一時ファイルから読み込む（他のテストの設定に影響しない）
+    path = tmp_path / 'config.yaml'
+    path.write_text(yaml.safe_dump({
+        'trigger': {
+            'enabled_types': ['gpio'],
+            'gpio_pins': {17: 'brake', 27: 'door'},
+            'gpio_bounce_time': BOUNCE_TIME
+        },
+        'admission': {'debounce': {}, 'queue_size': 1000}
+    }))
+    config = Config(str(path))
+    factory = MockFactory()
+    manager = TriggerManager(config)
+    manager.gpio_pin_factory = factory
+
+    submitted = []
+    submit = manager.submit
+
+    def record(event):
+        submitted.append((event, now()))
+        return submit(event)
+
+    manager.submit = record
+    manager.start_listening()
+    try:
+        yield manager, factory, submitted
+    finally:
+        manager.stop_listening()
+        factory.close()
+
+def press(pin):
+    """押下のエッジを入れ、その直前の時刻を返す"""
+    edge_time = now()
+    pin.drive_low()
+    return edge_time
+
+def test_edge_to_submit_latency(gpio):
+    manager, factory, submitted = gpio
+    pin = factory.pin(17)
+    latencies = []
+    for _ in range(20):
+        edge_time = press(pin)
+        event, submitted_at = submitted[-1]
+        # イベント時刻はエッジの時刻（待機後の時刻ではない）
+        assert edge_time <= event.timestamp <= submitted_at
+        assert event.timestamp - edge_time < MAX_LATENCY
+        latencies.append(submitted_at - edge_time)
+        pin.drive_high()
+        time.sleep(BOUNCE_TIME * 1.5)
+    assert len(submitted) == 20
+    assert max(latencies) < MAX_LATENCY
+
+def test_injected_edge_keeps_timestamp(gpio):
+    manager, factory, submitted = gpio
+    edge_time = now() - 0.2
+    manager.gpio_engine.on_edge(17, True, edge_time)
+    event, _ = submitted[-1]
+    assert event.timestamp == edge_time
+    assert manager.get_trigger(1.0) is event
+
+def test_release_press_within_bounce_time_is_ignored(gpio):
+    manager, factory, submitted = gpio
+    pin = factory.pin(17)
+    press(pin)
+    # 離した直後のチャタリング
+    pin.drive_high()
+    pin.drive_low()
+    pin.drive_high()
+    pin.drive_low()
+    pin.drive_high()
+    assert len(submitted) == 1
+    stats = manager.gpio_engine.stats()['pin17']
+    assert stats['triggers'] == 1
+    assert stats['bounces'] == 2
+
+    # 離した状態が bounce_time 続いた後の押下は新しいトリガー
+    time.sleep(BOUNCE_TIME * 1.5)
+    press(pin)
+    assert len(submitted) == 2
+
+def test_pins_report_separate_sources(gpio):
+    manager, factory, submitted = gpio
+    press(factory.pin(17))
+    press(factory.pin(27))
+    assert [event.source for event, _ in submitted] == ['brake', 'door']
+    assert all(event.type == 'gpio' for event, _ in submitted)
+    stats = manager.gpio_engine.stats()
+    assert stats['pin17']['source'] == 'brake'
+    assert stats['pin27']['source'] == 'door'
+    assert stats['pin17']['triggers'] == 1
+    assert stats['pin27']['triggers'] == 1
+    assert 'gpio' in manager.status_providers
+
+def test_fixture_does_not_change_defaults(gpio):
+    defaults = Config(None)
+    assert defaults.get('admission', 'debounce')['gpio'] == 0.5
+    assert defaults.get('trigger', 'gpio_pins', {}) != {17: 'brake', 27: 'door'}
@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip('cv2')
+
+from video_manager import resample_to_fps
+
+def test_picks_nearest_frame():
+    # 0.2 の出力時刻には 0.2 のフレームを使う（0.25 のフレームに置き換えない）
+    assert resample_to_fps([0, .1, .2, .25, .5], 10) == [0, 1, 2, 3, 4, 4]
+
+def test_duplicates_when_frames_are_missing():
+    assert resample_to_fps([0, .3], 10) == [0, 0, 1, 1]
+
+def test_drops_when_frames_are_dense():
+    timestamps = [n / 60 for n in range(61)]
+    indices = resample_to_fps(timestamps, 30)
+    assert indices == list(range(0, 61, 2))
+
+def test_empty():
+    assert resample_to_fps([], 30) == []
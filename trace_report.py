@@ -0,0 +1,71 @@
+import argparse
+import glob
+import json
+import math
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+# パイプライン上の順序（未知のスパンは末尾にアルファベット順で表示）
+STAGE_ORDER = [
+    'trigger.created', 'trigger.dequeued', 'save.preroll', 'save.postroll',
+    'save.encode', 'save.publish', 'save.sidecar', 'clip.total', 'trigger.dropped'
+]
+
+def percentile(values: List[float], ratio: float) -> float:
+    """最近傍法によるパーセンタイル（valuesはソート済み）"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(ratio * len(values)) - 1))
+    return values[index]
+
+def load_spans(paths: Iterable[str]):
+    """JSONLファイルからスパンを読み込む（壊れた行は読み飛ばす）"""
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                yield span
+
+def summarize(spans, trigger_type: str = None) -> Dict[str, List[float]]:
+    """スパン名ごとの所要時間（ms）を集計"""
+    spans = list(spans)
+    if trigger_type:
+        # type属性を持つスパンからトレースIDを絞り込む
+        trace_ids = {span['trace_id'] for span in spans if span.get('type') == trigger_type}
+        spans = [span for span in spans if span['trace_id'] in trace_ids]
+    durations = defaultdict(list)
+    for span in spans:
+        durations[span['span']].append(span['duration_ms'])
+    return durations
+
+def main():
+    parser = argparse.ArgumentParser(description="トレースログ（JSONL）の段階別レイテンシ集計")
+    parser.add_argument('paths', nargs='+', help="トレースファイル（glob可）")
+    parser.add_argument('--type', default=None, help="集計するトリガーの種類")
+    args = parser.parse_args()
+
+    paths = sorted({path for pattern in args.paths for path in glob.glob(pattern)})
+    if not paths:
+        print("トレースファイルが見つかりません", file=sys.stderr)
+        sys.exit(1)
+
+    durations = summarize(load_spans(paths), args.type)
+    names = sorted(
+        durations,
+        key=lambda name: (STAGE_ORDER.index(name) if name in STAGE_ORDER else len(STAGE_ORDER), name)
+    )
+    print(f"{'stage':<18}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}{'max ms':>12}")
+    for name in names:
+        values = sorted(durations[name])
+        print(
+            f"{name:<18}{len(values):>8}"
+            f"{percentile(values, 0.50):>12.1f}{percentile(values, 0.95):>12.1f}"
+            f"{percentile(values, 0.99):>12.1f}{values[-1]:>12.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
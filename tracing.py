@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Optional
+
+from utils import logger, now, Config
+
+def new_trace_id() -> str:
+    """トレースIDの生成"""
+    return uuid.uuid4().hex[:16]
+
+class Tracer:
+    """
+    トリガーごとの処理時間をスパンとしてJSONLに記録
+    ファイルは日付ごとに分かれる（例: logs/trace-20240101.jsonl）
+    """
+    def __init__(self, path_pattern: str = 'logs/trace-%Y%m%d.jsonl', enabled: bool = False):
+        """
+        トレーサーの初期化
+        Args:
+            path_pattern: 出力先のパス（strftime形式）
+            enabled: 記録するかどうか
+        """
+        self.path_pattern = path_pattern
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+
+    def configure(self, config: Config):
+        """tracingセクションの設定を適用"""
+        with self._lock:
+            self._close()
+            self.enabled = config.get('tracing', 'enabled', False)
+            self.path_pattern = config.get('tracing', 'path', self.path_pattern)
+
+    def span(self, trace_id: Optional[str], name: str, start: float, end: float = None,
+             **attrs: Any):
+        """
+        スパンを記録
+        Args:
+            trace_id: トレースID（Noneの場合は記録しない）
+            name: スパン名（例: save.encode）
+            start: 開始時刻（UNIX時刻、Noneの場合は記録しない）
+            end: 終了時刻（省略時は現在時刻）
+            attrs: 追加情報
+        """
+        if not self.enabled or trace_id is None or start is None:
+            return
+        if end is None:
+            end = now()
+        record = {
+            'trace_id': trace_id,
+            'span': name,
+            'start': round(start, 6),
+            'end': round(end, 6),
+            'duration_ms': round((end - start) * 1000, 3)
+        }
+        record.update(attrs)
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        try:
+            with self._lock:
+                self._file_for(end).write(line)
+        except OSError as e:
+            logger.warning(f"トレースの書き込みに失敗: {e}")
+
+    def _file_for(self, timestamp: float):
+        """時刻に対応する日付のファイルを開く"""
+        path = datetime.fromtimestamp(timestamp).strftime(self.path_pattern)
+        if path != self._path:
+            self._close()
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 1行ずつ書き出し、異常終了時も記録が残るようにする
+            self._file = open(path, 'a', encoding='utf-8', buffering=1)
+            self._path = path
+        return self._file
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._path = None
+
+    def close(self):
+        """出力ファイルを閉じる"""
+        with self._lock:
+            self._close()
+
+# アプリケーション全体で共有するトレーサー（RecorderAppで設定を適用）
+tracer = Tracer()
@@ -1,58 +1,196 @@
+import heapq
+import itertools
+import os
+import re
 import threading
-import queue
 import socket
 import time
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from typing import Optional, Callable
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+from typing import Any, Dict, List, Optional, Callable
 import json
 
+import cv2
+import numpy as np
+
 from pynput import keyboard
 
-# Try importing GPIO libraries
-try:
-    from gpiozero import Button, Device
-    # Attempt to set the default pin factory. This might fail if not on a Pi.
-    try:
-        Device.pin_factory # Accessing this property initializes the default factory
-        GPIOZERO_AVAILABLE = True
-        logger.debug("gpiozero library is available.")
-    except Exception as e:
-        logger.debug(f"gpiozero pin factory setup failed, likely not on RPi or config issue: {e}")
-        GPIOZERO_AVAILABLE = False
-except ImportError:
-    GPIOZERO_AVAILABLE = False
-
-try:
-    import RPi.GPIO as GPIO
-    RPIGPIO_AVAILABLE = True
-    logger.debug("RPi.GPIO library is available.")
-except ImportError:
-    RPIGPIO_AVAILABLE = False
-
-# Overall GPIO availability check
-GPIO_AVAILABLE = GPIOZERO_AVAILABLE or RPIGPIO_AVAILABLE
-
-from exceptions import TriggerError
-from utils import logger, Config
+from exceptions import TriggerError, ConfigError, ResourceError
+from utils import logger, now, Config
+from tracing import tracer, new_trace_id
+from profiler import SamplingProfiler, ProfilerBusyError
+from clip_index import sidecar_paths
+from clock_sync import ClockOffsetEstimator, ntp_sample
+from gpio_trigger import GpioTriggerEngine, GPIO_AVAILABLE
+
+# POST /config で受け付けるカメラ・バッファの設定（VideoManager.reconfigure に渡す）
+CAPTURE_CONFIG_KEYS = (
+    'camera_device', 'frame_width', 'frame_height', 'fps', 'buffer_size_mb', 'compression_quality'
+)
 
 class TriggerEvent:
-    def __init__(self, trigger_type: str, source: str, timestamp: float):
+    def __init__(self, trigger_type: str, source: str, timestamp: float,
+                 clock_offset: float = None, clock_uncertainty: float = None):
         self.type = trigger_type
         self.source = source
         self.timestamp = timestamp
+        # クライアントが指定したイベント時刻を補正した場合の時計のずれと誤差（秒）
+        self.clock_offset = clock_offset
+        self.clock_uncertainty = clock_uncertainty
+        # 保存までの各段階の処理時間を紐付けるID
+        self.trace_id = new_trace_id()
+        self.admitted_at = None
+
+# クライアントが指定する発生元の名前の最大長（時計のずれの推定やカタログのキーになる）
+MAX_SOURCE_LENGTH = 64
+
+def validate_source(source: Any) -> str:
+    """クライアントが指定した発生元の名前を検証"""
+    if not isinstance(source, str) or not source or len(source) > MAX_SOURCE_LENGTH:
+        raise TriggerError(f"source は1〜{MAX_SOURCE_LENGTH}文字の文字列で指定してください")
+    return source
+
+def create_remote_event(clock: ClockOffsetEstimator, trigger_type: str, source: str,
+                        event_time: Any, received_at: float) -> TriggerEvent:
+    """
+    HTTP/WebSocketのトリガーイベントを作成
+    クライアントがイベント時刻を指定した場合は、時計のずれを補正した時刻をクリップの基準にする
+    Args:
+        clock: クライアントごとの時計のずれの推定
+        trigger_type: トリガーの種類
+        source: トリガーの発生元（時計のずれもこの名前ごとに推定する）
+        event_time: イベント時刻（クライアントの時計のUNIX時刻、省略時はNone）
+        received_at: 受信時刻
+    """
+    if event_time is None:
+        return TriggerEvent(trigger_type, source, received_at)
+    if isinstance(event_time, bool) or not isinstance(event_time, (int, float)):
+        raise TriggerError("event_time は数値（UNIX時刻）で指定してください")
+    timestamp, estimate = clock.correct(source, float(event_time), received_at)
+    if estimate is None:
+        logger.debug(f"時計のずれが未計測のためイベント時刻をそのまま使用: source={source}")
+        return TriggerEvent(trigger_type, source, timestamp)
+    return TriggerEvent(trigger_type, source, timestamp, estimate.offset, estimate.uncertainty)
+
+class TokenBucket:
+    """トークンバケットによるレート制限"""
+    def __init__(self, rate: float, burst: float):
+        """
+        Args:
+            rate: 1秒あたりに補充されるトークン数
+            burst: バケットの容量
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def consume(self) -> bool:
+        """トークンを1つ消費（不足時はFalse）"""
+        current = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (current - self.updated) * self.rate)
+        self.updated = current
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def refund(self):
+        """消費したトークンを1つ戻す（後段の制限で拒否した場合）"""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def retry_after(self) -> float:
+        """次のトークンが補充されるまでの秒数"""
+        if self.rate <= 0:
+            return 0.0
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class TriggerQueue:
+    """
+    優先度付きの上限ありトリガーキュー
+    満杯時は drop_policy に従い、最も優先度の低いイベントから破棄する
+    """
+    def __init__(self, maxsize: int, drop_policy: str = 'drop_oldest'):
+        """
+        Args:
+            maxsize: キューの最大長
+            drop_policy: drop_oldest（古いイベントを破棄） / drop_newest（新しいイベントを破棄）
+        """
+        if drop_policy not in ('drop_oldest', 'drop_newest'):
+            raise TriggerError(f"未対応の破棄ポリシー: {drop_policy}")
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def put(self, event: 'TriggerEvent', priority: int) -> Optional['TriggerEvent']:
+        """
+        イベントを追加
+        Returns:
+            破棄されたイベント（破棄が無ければNone、追加したイベント自体の場合もある）
+        """
+        with self._cond:
+            dropped = None
+            if len(self._heap) >= self.maxsize:
+                # 最も優先度の低いイベントの中から破棄対象を選ぶ
+                lowest = -max(item[0] for item in self._heap)
+                candidates = [item for item in self._heap if -item[0] == lowest]
+                if self.drop_policy == 'drop_oldest':
+                    victim = min(candidates, key=lambda item: item[1])
+                    if priority < lowest:
+                        return event
+                else:
+                    victim = max(candidates, key=lambda item: item[1])
+                    if priority <= lowest:
+                        return event
+                self._heap.remove(victim)
+                heapq.heapify(self._heap)
+                dropped = victim[2]
+
+            heapq.heappush(self._heap, (-priority, next(self._counter), event))
+            self._cond.notify()
+            return dropped
+
+    def get(self, timeout: float = None) -> Optional['TriggerEvent']:
+        """優先度の高い順（同じ優先度は古い順）に取り出す"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._heap, timeout):
+                return None
+            return heapq.heappop(self._heap)[2]
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._heap)
 
 class HttpTriggerHandler(BaseHTTPRequestHandler):
+    # Keep-Aliveとチャンクなしのストリーミングのため
+    protocol_version = 'HTTP/1.1'
+
     def do_GET(self):
         """GETリクエストの処理"""
-        if self.path == '/status':
+        self.received_at = now()
+        url = urlsplit(self.path)
+        if url.path == '/status':
             self._handle_status()
-        elif self.path == '/trigger':
+        elif url.path == '/trigger':
             self._handle_trigger('GET')
+        elif url.path == '/clips':
+            self._handle_clips(parse_qs(url.query))
+        elif url.path.startswith('/clips/'):
+            self._handle_clip_download(*url.path[len('/clips/'):].split('/', 1))
+        elif url.path == '/live.mjpg':
+            self._handle_live()
+        elif url.path == '/profile':
+            self._send_json_response(self.server.trigger_manager.profiler.status())
         else:
             self._send_error(404, "エンドポイントが見つかりません")
 
     def do_POST(self):
         """POSTリクエストの処理"""
+        # 時計のずれの計測に使うため、本文を読む前に受信時刻を記録
+        self.received_at = now()
         content_length = int(self.headers.get('Content-Length', 0))
         if content_length > 0:
             post_data = self.rfile.read(content_length).decode('utf-8')
@@ -63,49 +201,365 @@ class HttpTriggerHandler(BaseHTTPRequestHandler):
         else:
             data = {}
 
-        if self.path == '/trigger':
+        url = urlsplit(self.path)
+        if url.path == '/trigger':
             self._handle_trigger('POST', data)
-        elif self.path == '/config':
+        elif url.path == '/config':
             self._handle_config(data)
+        elif url.path == '/profile':
+            self._handle_profile(parse_qs(url.query))
+        elif url.path == '/telemetry':
+            self._handle_telemetry(data)
+        elif url.path == '/clock':
+            self._handle_clock(data)
         else:
             self._send_error(404, "エンドポイントが見つかりません")
 
     def _handle_status(self):
         """ステータス情報を返す"""
+        trigger_manager = self.server.trigger_manager
         response = {
             'status': 'running',
-            'trigger_type': self.server.trigger_manager.trigger_type,
+            'enabled_types': sorted(trigger_manager.enabled_types),
+            'active_types': sorted(trigger_manager.active_types),
+            'admission': trigger_manager.admission_stats(),
             'uptime': time.time() - self.server.start_time
         }
+        for name, provider in list(trigger_manager.status_providers.items()):
+            try:
+                response[name] = provider()
+            except Exception as e:
+                logger.warning(f"ステータスの取得に失敗: {name}: {e}")
         self._send_json_response(response)
 
     def _handle_trigger(self, method, data=None):
         """トリガーイベントを処理"""
-        source = f"http_{method.lower()}"
-        if data and 'source' in data:
-            source = data['source']
+        if data is not None and not isinstance(data, dict):
+            self._send_error(400, "JSONオブジェクトを送信してください")
+            return
+        data = data or {}
+        trigger_manager = self.server.trigger_manager
+        try:
+            source = validate_source(data['source']) if 'source' in data else f"http_{method.lower()}"
+            event = create_remote_event(
+                trigger_manager.clock, 'http', source, data.get('event_time'), self.received_at
+            )
+        except TriggerError as e:
+            self._send_error(400, str(e))
+            return
+        accepted, reason, retry_after = trigger_manager.submit(event)
+        if not accepted:
+            self._send_json_response(
+                {'status': 'rejected', 'message': 'トリガーが制限されました', 'reason': reason},
+                status=429,
+                headers={'Retry-After': str(max(1, int(retry_after + 0.999)))}
+            )
+            return
+        self._send_json_response({
+            'status': 'ok',
+            'message': 'トリガーを実行しました',
+            'event_time': event.timestamp,
+            'clock_offset': event.clock_offset,
+            'clock_uncertainty': event.clock_uncertainty
+        })
+
+    def _handle_clock(self, data):
+        """
+        時計のずれの計測（NTP方式）
+        クライアントは送信時刻 t0 を送り、応答の t1（受信）・t2（送信）と応答を受け取った時刻 t3 を
+        次回の要求の previous で報告する。報告された往復からクライアントごとのずれを推定する
+        """
+        if not isinstance(data, dict) or 'source' not in data:
+            self._send_error(400, "source を指定してください")
+            return
+        try:
+            source = validate_source(data['source'])
+        except TriggerError as e:
+            self._send_error(400, str(e))
+            return
+        clock = self.server.trigger_manager.clock
+        previous = data.get('previous')
+        if previous is not None:
+            report = [previous.get(key) if isinstance(previous, dict) else None for key in ('t0', 't1', 't2', 't3')]
+            if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in report):
+                self._send_error(400, "previous には t0, t1, t2, t3 を数値で指定してください")
+                return
+            # t0/t3 がクライアント、t1/t2 がサーバーの時計
+            offset, delay = ntp_sample(*report)
+            clock.add_sample(source, -offset, delay)
+        estimate = clock.estimate(source)
+        response = {
+            'status': 'ok',
+            'offset': estimate.offset if estimate else None,
+            'uncertainty': estimate.uncertainty if estimate else None,
+            't0': data.get('t0'),
+            't1': self.received_at
+        }
+        response['t2'] = now()
+        self._send_json_response(response)
+
+    def _handle_clips(self, params):
+        """
+        クリップカタログの検索
+        パラメータ: start, end（UNIX時刻）, type, source, limit, offset
+        """
+        catalog = self.server.trigger_manager.clip_catalog
+        if catalog is None:
+            self._send_error(503, "クリップカタログが利用できません")
+            return
+
+        def param(name, convert=str, default=None):
+            values = params.get(name)
+            return convert(values[0]) if values else default
+
+        try:
+            clips = catalog.query(
+                start_time=param('start', float),
+                end_time=param('end', float),
+                trigger_type=param('type'),
+                source=param('source'),
+                # 負の LIMIT は SQLite では無制限になるため、1〜1000 に収める
+                limit=max(1, min(param('limit', int, 100), 1000)),
+                offset=max(0, param('offset', int, 0))
+            )
+        except ValueError as e:
+            self._send_error(400, f"パラメータが不正です: {e}")
+            return
+        self._send_json_response({
+            'status': 'ok',
+            'total_size': catalog.total_size,
+            'clips': [clip.to_dict() for clip in clips]
+        })
+
+    def _handle_clip_download(self, clip_id, part=None):
+        """
+        クリップのダウンロード（Rangeリクエスト対応、sendfileで転送）
+        /clips/<id>/index でシーク用インデックス、/clips/<id>/thumbs でサムネイル列を返す
+        """
+        catalog = self.server.trigger_manager.clip_catalog
+        if catalog is None:
+            self._send_error(503, "クリップカタログが利用できません")
+            return
+        clip = catalog.get(int(clip_id)) if clip_id.isdigit() else None
+        if clip is None or part not in (None, 'index', 'thumbs'):
+            self._send_error(404, "クリップが見つかりません")
+            return
+        index_path, thumbs_path = sidecar_paths(clip.path)
+        path, content_type, disposition = {
+            None: (clip.path, 'video/mp4', f'attachment; filename="{os.path.basename(clip.path)}"'),
+            'index': (index_path, 'application/json', None),
+            'thumbs': (thumbs_path, 'image/jpeg', None)
+        }[part]
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self._send_error(404, "クリップのファイルが見つかりません")
+            return
+
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            byte_range = self._parse_range(self.headers.get('Range'), size)
+            if byte_range is False:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            if byte_range is None:
+                offset, count = 0, size
+                self.send_response(200)
+            else:
+                offset, count = byte_range[0], byte_range[1] - byte_range[0] + 1
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {byte_range[0]}-{byte_range[1]}/{size}')
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(count))
+            self.send_header('Accept-Ranges', 'bytes')
+            if disposition:
+                self.send_header('Content-Disposition', disposition)
+            self.end_headers()
+            if count > 0:
+                # カーネル内でファイルからソケットへ直接転送する
+                self.wfile.flush()
+                self.connection.sendfile(f, offset, count)
+
+    @staticmethod
+    def _parse_range(header, size):
+        """
+        Rangeヘッダー（単一範囲のみ）を解析
+        Returns:
+            (開始, 終了) / 指定なしはNone / 範囲外はFalse
+        """
+        if not header:
+            return None
+        match = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', header)
+        if not match or (not match.group(1) and not match.group(2)):
+            # 複数範囲などの未対応形式は全体を返す
+            return None
+        if not match.group(1):
+            # bytes=-N: 末尾Nバイト
+            length = int(match.group(2))
+            if length == 0:
+                return False
+            return max(0, size - length), size - 1
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+        if start >= size or end < start:
+            return False
+        return start, min(end, size - 1)
+
+    def _handle_live(self):
+        """
+        バッファの最新JPEGをそのままMJPEGで配信
+        送信が遅いクライアントは途中のフレームを飛ばし、キャプチャ側を待たせない
+        """
+        trigger_manager = self.server.trigger_manager
+        frame_source = trigger_manager.frame_source
+        if frame_source is None:
+            self._send_error(503, "ライブ映像が利用できません")
+            return
+        if not trigger_manager.acquire_live_client():
+            self._send_error(503, "ライブ配信の接続数が上限に達しています")
+            return
 
-        self.server.trigger_queue.put(
-            TriggerEvent('http', source, time.time())
+        interval = 1.0 / trigger_manager.config.get('trigger', 'live_fps', 10)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            # 応答しないクライアントはタイムアウトで切断
+            self.connection.settimeout(10.0)
+
+            last_timestamp = None
+            while not self.server.stopping.is_set():
+                entry = frame_source()
+                if entry is None or entry.timestamp == last_timestamp:
+                    self.server.stopping.wait(interval / 2)
+                    continue
+                last_timestamp = entry.timestamp
+                self.wfile.write(
+                    b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+                    + str(len(entry.payload)).encode('ascii') + b'\r\n\r\n'
+                )
+                # バッファのペイロードを再圧縮・コピーせずに送信
+                self.wfile.write(memoryview(entry.payload))
+                self.wfile.write(b'\r\n')
+                self.server.stopping.wait(interval)
+        except (BrokenPipeError, ConnectionResetError, socket.timeout):
+            logger.debug("ライブ配信クライアントが切断しました")
+        finally:
+            self.close_connection = True
+            trigger_manager.release_live_client()
+
+    def _handle_profile(self, params):
+        """サンプリングプロファイラーを指定秒数だけ実行"""
+        profiler = self.server.trigger_manager.profiler
+        try:
+            seconds = float(params.get('seconds', ['30'])[0])
+        except ValueError:
+            self._send_error(400, "seconds には数値を指定してください")
+            return
+        # 実行中かどうかの判定は start() に任せる（同時に来た要求の一方だけが開始する）
+        try:
+            path = profiler.start(seconds)
+        except ProfilerBusyError as e:
+            self._send_error(409, str(e))
+            return
+        except ResourceError as e:
+            self._send_error(400, str(e))
+            return
+        self._send_json_response(
+            {'status': 'started', 'seconds': min(seconds, profiler.max_seconds), 'path': path},
+            status=202
         )
-        self._send_json_response({'status': 'ok', 'message': 'トリガーを実行しました'})
 
     def _handle_config(self, data):
         """設定の更新を処理"""
+        trigger_manager = self.server.trigger_manager
         try:
-            # 設定の更新（実装例）
+            # 有効にするトリガーソースを決定
+            enabled = set(trigger_manager.enabled_types)
             if 'trigger_type' in data:
-                self.server.trigger_manager.set_trigger_type(data['trigger_type'])
-            self._send_json_response({'status': 'ok', 'message': '設定を更新しました'})
+                enabled = {data['trigger_type']}
+            if 'enabled_types' in data:
+                enabled = set(data['enabled_types'])
+            enabled |= set(data.get('enable', []))
+            enabled -= set(data.get('disable', []))
+            for trigger_type in enabled:
+                trigger_manager.validate_type(trigger_type)
+
+            # カメラ・バッファの設定（カメラの切り替えはバックグラウンドで行われる）
+            settings = {key: data[key] for key in CAPTURE_CONFIG_KEYS if key in data}
+            applied = {}
+            if settings:
+                if trigger_manager.config_handler is None:
+                    raise ConfigError("カメラの設定は変更できません")
+                applied = trigger_manager.config_handler(settings)
         except Exception as e:
             self._send_error(400, str(e))
+            return
+
+        # http 以外のソースは応答前に起動・停止し、実際に動作しているソースを返す
+        # （http はこのリクエストを処理中のサーバー自身のため、応答後に別スレッドで切り替える）
+        current_http = {'http'} & trigger_manager.enabled_types
+        try:
+            failed = trigger_manager.set_enabled_types((enabled - {'http'}) | current_http)
+        except Exception as e:
+            self._send_error(500, f"トリガーの切り替えに失敗: {e}")
+            return
+        if failed:
+            self._send_json_response({
+                'status': 'error',
+                'message': f"トリガー監視を開始できませんでした: {', '.join(failed)}",
+                'failed': failed,
+                'enabled_types': sorted(trigger_manager.enabled_types),
+                'active_types': sorted(trigger_manager.active_types),
+                'applied': applied
+            }, status=500)
+        else:
+            self._send_json_response({
+                'status': 'ok',
+                'message': '設定を更新しました',
+                'enabled_types': sorted(enabled),
+                'active_types': sorted(trigger_manager.active_types),
+                'applied': applied
+            })
+        if ('http' in enabled) != bool(current_http):
+            threading.Thread(
+                target=trigger_manager.set_enabled_types,
+                args=((trigger_manager.enabled_types - {'http'}) | ({'http'} & enabled),),
+                daemon=True
+            ).start()
+
+    def _handle_telemetry(self, data):
+        """焼き込み用のテレメトリ（GPS速度など）を更新"""
+        handler = self.server.trigger_manager.telemetry_handler
+        if handler is None:
+            self._send_error(503, "テレメトリを受け付けていません")
+            return
+        if not isinstance(data, dict) or not data:
+            self._send_error(400, "値を指定してください")
+            return
+        try:
+            current = handler(data)
+        except ConfigError as e:
+            self._send_error(400, str(e))
+            return
+        self._send_json_response({'status': 'ok', 'telemetry': current})
 
-    def _send_json_response(self, data, status=200):
+    def _send_json_response(self, data, status=200, headers=None):
         """JSONレスポンスを送信"""
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self.wfile.write(body)
 
     def _send_error(self, code, message):
         """エラーレスポンスを送信"""
@@ -119,24 +573,50 @@ class HttpTriggerHandler(BaseHTTPRequestHandler):
         logger.debug(f"HTTP: {format%args}")
 
 class WebSocketTrigger:
-    def __init__(self, port: int, callback: Callable):
+    """
+    ソケットによるトリガー
+    従来の「trigger」だけを送って切断するクライアントに加え、接続を維持して改行区切りのJSONを送るクライアントに対応する
+    JSONのクライアントには定期的に ping を送り、その往復からクライアントの時計のずれを推定する
+    """
+    MAX_LINE = 65536
+
+    def __init__(self, port: int, callback: Callable, clock: ClockOffsetEstimator = None,
+                 sync_interval: float = 10.0):
+        """
+        Args:
+            port: 待ち受けポート
+            callback: トリガーイベントを受け取る関数（(受理したか, 拒否理由, 再試行までの秒数) を返す）
+            clock: クライアントごとの時計のずれの推定
+            sync_interval: ping を送る間隔（秒）
+        """
         self.port = port
         self.callback = callback
+        self.clock = clock or ClockOffsetEstimator()
+        self.sync_interval = sync_interval
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.running = False
         self.thread = None
+        self._clients = set()
+        self._clients_lock = threading.Lock()
 
     def start(self):
         self.running = True
         self.server.bind(('localhost', self.port))
-        self.server.listen(1)
-        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.server.listen(5)
+        self.thread = threading.Thread(target=self._run, name='websocket-trigger', daemon=True)
         self.thread.start()
 
     def stop(self):
         self.running = False
         if self.server:
             self.server.close()
+        with self._clients_lock:
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
         if self.thread:
             self.thread.join(timeout=3.0)
 
@@ -144,14 +624,241 @@ class WebSocketTrigger:
         while self.running:
             try:
                 client, _ = self.server.accept()
-                data = client.recv(1024).decode('utf-8')
-                if data.strip() == 'trigger':
-                    self.callback(TriggerEvent('websocket', 'client', time.time()))
-                client.close()
+                with self._clients_lock:
+                    self._clients.add(client)
+                threading.Thread(
+                    target=self._serve_client,
+                    args=(client,),
+                    name='websocket-client',
+                    daemon=True
+                ).start()
             except Exception as e:
                 if self.running:
                     logger.error(f"WebSocketエラー: {e}")
 
+    def _serve_client(self, client: socket.socket):
+        """1接続分の処理（ping の送信も同じスレッドで行う）"""
+        session = {'source': 'client', 'synced': False, 'next_ping': 0.0}
+        pending = b''
+        try:
+            client.settimeout(0.5)
+            while self.running:
+                if session['synced'] and time.monotonic() >= session['next_ping']:
+                    self._send(client, {'type': 'ping', 't0': now()})
+                    session['next_ping'] = time.monotonic() + self.sync_interval
+                try:
+                    chunk = client.recv(4096)
+                except socket.timeout:
+                    continue
+                received_at = now()
+                if not chunk:
+                    if pending.strip():
+                        self._handle_line(client, session, pending, received_at)
+                    break
+                pending += chunk
+                *lines, pending = pending.split(b'\n')
+                if not lines and not session['synced'] and pending.strip() == b'trigger':
+                    # 改行なしの「trigger」だけを送る従来のクライアント
+                    lines, pending = [pending], b''
+                for line in lines:
+                    if line.strip() and not self._handle_line(client, session, line, received_at):
+                        return
+                if len(pending) > self.MAX_LINE:
+                    logger.warning("WebSocket: 1行が長すぎるため切断します")
+                    break
+        except OSError as e:
+            if self.running:
+                logger.debug(f"WebSocketの接続が切れました: {e}")
+        finally:
+            with self._clients_lock:
+                self._clients.discard(client)
+            client.close()
+
+    def _handle_line(self, client: socket.socket, session: Dict[str, Any], line: bytes,
+                     received_at: float) -> bool:
+        """
+        受信した1行の処理
+        Returns:
+            接続を維持する場合はTrue
+        """
+        text = line.decode('utf-8', errors='replace').strip()
+        if text == 'trigger' and not session['synced']:
+            # 従来のクライアントは1回のトリガーで切断する
+            self.callback(TriggerEvent('websocket', session['source'], received_at))
+            return False
+        try:
+            message = json.loads(text)
+        except json.JSONDecodeError:
+            message = None
+        if not isinstance(message, dict):
+            self._send(client, {'type': 'error', 'message': 'JSONオブジェクトを送信してください'})
+            return True
+
+        if 'source' in message:
+            try:
+                session['source'] = validate_source(message['source'])
+            except TriggerError as e:
+                self._send(client, {'type': 'error', 'message': str(e)})
+                return True
+        if not session['synced']:
+            # JSONで話すクライアントには接続直後から ping を送る
+            session['synced'] = True
+            session['next_ping'] = 0.0
+
+        message_type = message.get('type')
+        if message_type == 'pong':
+            # t0/t3 がサーバー、client_time がクライアントの時計
+            t0, client_time = message.get('t0'), message.get('client_time')
+            if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in (t0, client_time)):
+                offset, delay = ntp_sample(t0, client_time, client_time, received_at)
+                self.clock.add_sample(session['source'], offset, delay)
+        elif message_type == 'trigger':
+            try:
+                event = create_remote_event(
+                    self.clock, 'websocket', session['source'], message.get('event_time'), received_at
+                )
+            except TriggerError as e:
+                self._send(client, {'type': 'error', 'message': str(e)})
+                return True
+            accepted, reason, retry_after = self.callback(event)
+            self._send(client, {
+                'type': 'ack',
+                'status': 'ok' if accepted else 'rejected',
+                'reason': reason,
+                'retry_after': retry_after,
+                'event_time': event.timestamp,
+                'clock_offset': event.clock_offset,
+                'clock_uncertainty': event.clock_uncertainty
+            })
+        elif message_type != 'hello':
+            self._send(client, {'type': 'error', 'message': f"未対応のメッセージ: {message_type}"})
+        return True
+
+    @staticmethod
+    def _send(client: socket.socket, message: Dict[str, Any]):
+        client.sendall(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+
+class MotionTrigger:
+    """
+    ライブ映像の動き検知トリガー
+    バッファ内の最新JPEGを1/8縮小グレースケールでデコードし、移動平均の背景との差分で判定する
+    """
+    def __init__(self, settings: Dict[str, Any], frame_source: Callable, callback: Callable):
+        """
+        Args:
+            settings: trigger.motion の設定値
+            frame_source: 最新フレーム（BufferedFrame）を返す関数
+            callback: トリガーイベントを受け取る関数
+        """
+        self.frame_source = frame_source
+        self.callback = callback
+        self.interval = 1.0 / settings.get('analysis_fps', 5)
+        self.pixel_threshold = settings.get('pixel_threshold', 25)
+        self.on_ratio = settings.get('on_ratio', 0.02)
+        self.off_ratio = settings.get('off_ratio', 0.01)
+        self.on_frames = settings.get('on_frames', 2)
+        self.off_frames = settings.get('off_frames', 10)
+        self.background_alpha = settings.get('background_alpha', 0.05)
+        self.roi = settings.get('roi') or []  # [x, y, 幅, 高さ]（0-1の比率）のリスト
+        self.running = False
+        self.thread = None
+        self._stop_event = threading.Event()
+
+        self._background = None
+        self._mask = None
+        self._mask_pixels = 0
+        self._active = False
+        self._streak = 0
+        self._onset_timestamp = None
+        self._last_payload = None
+
+    def start(self):
+        self.running = True
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='motion-trigger', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self._stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=3.0)
+
+    def _run(self):
+        next_time = time.monotonic()
+        while self.running:
+            next_time += self.interval
+            delay = next_time - time.monotonic()
+            if delay < 0:
+                # 解析が間に合わない場合は周期を現在に合わせ直す
+                next_time = time.monotonic()
+                delay = 0
+            if self._stop_event.wait(delay):
+                break
+            try:
+                entry = self.frame_source()
+                # 静止シーンでデータを共有しているフレームは解析しない
+                if entry is None or entry.payload is self._last_payload:
+                    continue
+                self._last_payload = entry.payload
+                self._analyze(entry)
+            except Exception as e:
+                logger.error(f"動き検知中にエラー: {e}")
+
+    def _build_mask(self, shape):
+        """ROIマスクの作成（ROI未指定の場合は全体）"""
+        height, width = shape
+        if not self.roi:
+            self._mask = None
+            self._mask_pixels = height * width
+            return
+        mask = np.zeros(shape, dtype=bool)
+        for x, y, w, h in self.roi:
+            mask[int(y * height):int((y + h) * height), int(x * width):int((x + w) * width)] = True
+        self._mask = mask
+        self._mask_pixels = max(1, int(np.count_nonzero(mask)))
+
+    def _analyze(self, entry):
+        """1フレームを解析し、ヒステリシス付きで動きの開始を判定"""
+        # JPEGを1/8の解像度で直接デコードする（フル解像度に展開しない）
+        gray = cv2.imdecode(entry.payload, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if gray is None:
+            return
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.astype(np.float32)
+            self._build_mask(gray.shape)
+            return
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        changed = diff > self.pixel_threshold
+        if self._mask is not None:
+            changed &= self._mask
+        ratio = np.count_nonzero(changed) / self._mask_pixels
+        cv2.accumulateWeighted(gray, self._background, self.background_alpha)
+
+        if not self._active:
+            if ratio >= self.on_ratio:
+                if self._streak == 0:
+                    self._onset_timestamp = entry.timestamp
+                self._streak += 1
+                if self._streak >= self.on_frames:
+                    self._active = True
+                    self._streak = 0
+                    logger.debug(f"動きを検知: ratio={ratio:.3f}")
+                    self.callback(TriggerEvent('motion', 'camera', self._onset_timestamp))
+            else:
+                self._streak = 0
+        else:
+            if ratio < self.off_ratio:
+                self._streak += 1
+                if self._streak >= self.off_frames:
+                    self._active = False
+                    self._streak = 0
+            else:
+                self._streak = 0
+
 class TriggerManager:
     def __init__(self, config: Config):
         """
@@ -160,19 +867,75 @@ class TriggerManager:
             config: 設定オブジェクト
         """
         self.config = config
-        self.trigger_queue = queue.Queue()
+
+        # アドミッション制御（デバウンス、レート制限、優先度付きの上限ありキュー）
+        self.trigger_queue = TriggerQueue(
+            config.get('admission', 'queue_size', 8),
+            config.get('admission', 'drop_policy', 'drop_oldest')
+        )
+        self.debounce = config.get('admission', 'debounce', {})
+        self.priorities = config.get('admission', 'priority', {})
+        # レート制限とデバウンスは発生元ごと（1つのクライアントが同じ種類の他のクライアントの枠を使い切らないように）
+        self.rates = config.get('admission', 'rate', {})
+        self.bursts = config.get('admission', 'burst', {})
+        self.max_sources = config.get('admission', 'max_sources', 256)
+        # source はクライアントが指定するため、種類ごとに全発生元で共有するバケットでも制限する
+        self._type_buckets = {
+            trigger_type: TokenBucket(rate, config.get('admission', 'type_burst', {}).get(trigger_type, 1))
+            for trigger_type, rate in config.get('admission', 'type_rate', {}).items()
+        }
+        self._buckets = OrderedDict()  # (種類, 発生元) -> TokenBucket（最近使った順）
+        self._last_accepted = OrderedDict()  # (種類, 発生元) -> 最後に受理した受付時刻
+        self._stats = {}
+        self._admission_lock = threading.Lock()
         self._running = False
-        self.trigger_type = config.get('trigger', 'default_type')
         self.gpio_library_preference = config.get('trigger', 'gpio_library', 'auto').lower() # Read library preference
+
+        # 有効なトリガーソース（同時に複数を有効化できる）
+        enabled_types = config.get('trigger', 'enabled_types', None) or [config.get('trigger', 'default_type')]
+        self.enabled_types = set()
+        for trigger_type in enabled_types:
+            self.validate_type(trigger_type)
+            self.enabled_types.add(trigger_type)
+        self.active_types = set()
         
         # 各トリガーのハンドラ
         self.keyboard_listener = None
-        self.active_gpio_handler = None # Holds the active GPIO object (Button or pin number)
-        self.active_gpio_library = None # Stores 'gpiozero' or 'rpigpio'
+        self.gpio_engine = None
+        # gpiozero のピンファクトリ（MockFactory を設定すると実機なしでGPIOトリガーを動かせる）
+        self.gpio_pin_factory = None
         self.http_server = None
         self.websocket_server = None
+        self.motion_trigger = None
+
+        # 動き検知用のフレーム取得関数（VideoManagerから設定）
+        self.frame_source = None
+        self.status_providers = {}  # /status に追加する項目名 -> 取得関数
+        self.config_handler = None  # /config でカメラ・バッファの設定を変更する関数
+        self.telemetry_handler = None  # /telemetry で焼き込み用の値を更新する関数
+        # HTTP/WebSocketのクライアントごとの時計のずれ（クライアント指定のイベント時刻の補正に使用）
+        self.clock = ClockOffsetEstimator(
+            window=config.get('clock', 'window', 8),
+            max_sample_age=config.get('clock', 'max_sample_age', 600),
+            drift_ppm=config.get('clock', 'drift_ppm', 100),
+            max_event_age=config.get('clock', 'max_event_age', 30),
+            max_clients=config.get('clock', 'max_clients', 256)
+        )
+        self.status_providers['clock'] = self.clock.clients
+        # HTTPでの検索に使用するクリップカタログ（RecorderAppから設定）
+        self.clip_catalog = None
+        # ライブ配信の接続数
+        self._live_clients = 0
+        # HTTPから起動するサンプリングプロファイラー（停止中は何もしない）
+        self.profiler = SamplingProfiler(
+            output_dir=config.get('profiling', 'output_dir', 'logs'),
+            interval=config.get('profiling', 'interval_ms', 10) / 1000.0,
+            max_seconds=config.get('profiling', 'max_seconds', 300)
+        )
         
         self._lock = threading.Lock()
+        # トリガーソースの起動・停止を直列化する
+        self._source_lock = threading.RLock()
 
     @property
     def running(self) -> bool:
@@ -180,209 +943,387 @@ class TriggerManager:
         with self._lock:
             return self._running
 
-    def start_listening(self):
-        """トリガー入力のリスニングを開始"""
-        try:
-            with self._lock:
-                self._running = True
-
-            if self.trigger_type == 'keyboard':
-                self._start_keyboard_listener()
-            elif self.trigger_type == 'gpio':
-                # GPIO listener start now depends on library availability and preference
-                self._start_gpio_listener()
-            elif self.trigger_type == 'http':
-                self._start_http_listener()
-            elif self.trigger_type == 'websocket':
-                self._start_websocket_listener()
-            else:
-                raise TriggerError(f"未対応のトリガータイプ: {self.trigger_type}")
+    def validate_type(self, trigger_type: str):
+        """トリガータイプが利用可能か検証"""
+        if trigger_type not in self.config.get('trigger', 'available_types'):
+            raise TriggerError(f"未対応のトリガータイプ: {trigger_type}")
 
-            logger.info(f"トリガー監視を開始: {self.trigger_type}")
+    def start_listening(self):
+        """有効な全トリガーソースのリスニングを開始"""
+        with self._lock:
+            self._running = True
 
-        except Exception as e:
-            logger.error(f"トリガー監視の開始に失敗: {e}")
-            self.stop_listening()
-            raise
+        with self._source_lock:
+            for trigger_type in sorted(self.enabled_types):
+                self._start_source(trigger_type)
+        logger.info(f"トリガー監視を開始: {', '.join(sorted(self.active_types)) or 'なし'}")
 
     def stop_listening(self):
         """トリガー入力のリスニングを停止"""
         with self._lock:
             self._running = False
 
-        if self.keyboard_listener:
-            self.keyboard_listener.stop()
-            self.keyboard_listener = None
+        with self._source_lock:
+            for trigger_type in list(self.active_types):
+                self._stop_source(trigger_type)
 
-        # Cleanup based on the active GPIO library
-        if self.active_gpio_handler is not None:
-            if self.active_gpio_library == 'gpiozero' and GPIOZERO_AVAILABLE:
-                try:
-                    self.active_gpio_handler.close()
-                    logger.debug("Closed gpiozero handler.")
-                except Exception as e:
-                    logger.error(f"Error closing gpiozero handler: {e}")
-            elif self.active_gpio_library == 'rpigpio' and RPIGPIO_AVAILABLE:
-                try:
-                    # RPi.GPIO cleans up all channels used by the script unless specific channels are passed
-                    GPIO.cleanup()
-                    logger.debug("Cleaned up RPi.GPIO.")
-                except Exception as e:
-                    logger.error(f"Error cleaning up RPi.GPIO: {e}")
-            self.active_gpio_handler = None
-            self.active_gpio_library = None
+        logger.info("トリガー監視を停止")
 
-        if self.http_server:
-            self.http_server.shutdown()
-            self.http_server = None
+    def _start_source(self, trigger_type: str) -> bool:
+        """
+        1つのトリガーソースを開始（失敗しても他のソースには影響しない）
+        Args:
+            trigger_type: トリガータイプ
+        """
+        if trigger_type in self.active_types:
+            return True
+        starters = {
+            'keyboard': self._start_keyboard_listener,
+            # GPIO listener start now depends on library availability and preference
+            'gpio': self._start_gpio_listener,
+            'http': self._start_http_listener,
+            'websocket': self._start_websocket_listener,
+            'motion': self._start_motion_listener,
+        }
+        try:
+            if trigger_type not in starters:
+                raise TriggerError(f"未対応のトリガータイプ: {trigger_type}")
+            starters[trigger_type]()
+            self.active_types.add(trigger_type)
+            return True
+        except Exception as e:
+            logger.error(f"トリガー監視の開始に失敗 ({trigger_type}): {e}")
+            try:
+                self._stop_source(trigger_type)
+            except Exception:
+                pass
+            return False
 
-        if self.websocket_server:
-            self.websocket_server.stop()
-            self.websocket_server = None
+    def _stop_source(self, trigger_type: str):
+        """1つのトリガーソースを停止"""
+        stoppers = {
+            'keyboard': self._stop_keyboard_listener,
+            'gpio': self._stop_gpio_listener,
+            'http': self._stop_http_listener,
+            'websocket': self._stop_websocket_listener,
+            'motion': self._stop_motion_listener,
+        }
+        self.active_types.discard(trigger_type)
+        if trigger_type in stoppers:
+            stoppers[trigger_type]()
 
-        logger.info("トリガー監視を停止")
+    def enable_trigger(self, trigger_type: str) -> bool:
+        """
+        トリガーソースを有効化（他のソースは再起動しない）
+        Args:
+            trigger_type: トリガータイプ
+        """
+        self.validate_type(trigger_type)
+        with self._source_lock:
+            self.enabled_types.add(trigger_type)
+            if self.running:
+                return self._start_source(trigger_type)
+        return True
+
+    def disable_trigger(self, trigger_type: str):
+        """
+        トリガーソースを無効化（他のソースは停止しない）
+        Args:
+            trigger_type: トリガータイプ
+        """
+        self.validate_type(trigger_type)
+        with self._source_lock:
+            self.enabled_types.discard(trigger_type)
+            if trigger_type in self.active_types:
+                self._stop_source(trigger_type)
+                logger.info(f"トリガーを無効化: {trigger_type}")
+
+    def set_enabled_types(self, trigger_types) -> List[str]:
+        """
+        有効なトリガーソースをまとめて設定（変更のあったソースのみ起動・停止）
+        開始できなかったソースは有効なソースから外す
+        Args:
+            trigger_types: 有効にするトリガータイプのリスト
+        Returns:
+            開始できなかったトリガータイプのリスト
+        """
+        trigger_types = set(trigger_types)
+        for trigger_type in trigger_types:
+            self.validate_type(trigger_type)
+        failed = []
+        with self._source_lock:
+            for trigger_type in self.enabled_types - trigger_types:
+                self.disable_trigger(trigger_type)
+            # 有効でも開始に失敗したままのソースは再度開始を試みる
+            for trigger_type in sorted(trigger_types - (self.active_types if self.running else self.enabled_types)):
+                if not self.enable_trigger(trigger_type):
+                    self.enabled_types.discard(trigger_type)
+                    failed.append(trigger_type)
+        return failed
 
     def set_trigger_type(self, trigger_type: str):
-        """トリガータイプを設定"""
-        if trigger_type not in self.config.get('trigger', 'available_types'):
-            raise TriggerError(f"未対応のトリガータイプ: {trigger_type}")
-        
-        was_running = self.running
-        if was_running:
-            self.stop_listening()
-        
-        self.trigger_type = trigger_type
-        
-        if was_running:
-            self.start_listening()
+        """トリガータイプを設定（指定したソースのみを有効にする）"""
+        self.validate_type(trigger_type)
+        self.set_enabled_types([trigger_type])
+
+    def set_frame_source(self, frame_source: Callable):
+        """動き検知に使う最新フレームの取得関数を設定"""
+        self.frame_source = frame_source
+
+    def add_status_provider(self, name: str, provider: Callable[[], Any]):
+        """/status に含める情報の取得関数を登録"""
+        self.status_providers[name] = provider
+
+    def set_config_handler(self, handler: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """/config で受け付けたカメラ・バッファの設定を適用する関数を登録"""
+        self.config_handler = handler
+
+    def set_telemetry_handler(self, handler: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """/telemetry で受け付けた値（速度など）を反映する関数を登録"""
+        self.telemetry_handler = handler
+
+    def set_clip_catalog(self, clip_catalog):
+        """HTTPで検索するクリップカタログを設定"""
+        self.clip_catalog = clip_catalog
+
+    def acquire_live_client(self) -> bool:
+        """ライブ配信の接続枠を確保"""
+        with self._lock:
+            if self._live_clients >= self.config.get('trigger', 'live_max_clients', 4):
+                return False
+            self._live_clients += 1
+            return True
+
+    def release_live_client(self):
+        """ライブ配信の接続枠を解放"""
+        with self._lock:
+            self._live_clients -= 1
+
+    def submit(self, event: TriggerEvent):
+        """
+        トリガーイベントをアドミッション制御を通してキューに追加
+        Args:
+            event: トリガーイベント
+        Returns:
+            (受理したか, 拒否理由, 再試行までの秒数)
+        """
+        event.admitted_at = now()
+        accepted, reason, retry_after = self._admit(event)
+        tracer.span(
+            event.trace_id, 'trigger.created', event.timestamp, event.admitted_at,
+            type=event.type, source=event.source, accepted=accepted, reason=reason
+        )
+        return accepted, reason, retry_after
+
+    def _admit(self, event: TriggerEvent):
+        """デバウンス・レート制限・キュー上限の判定"""
+        trigger_type = event.type
+        with self._admission_lock:
+            stats = self._stats.setdefault(
+                trigger_type,
+                {'accepted': 0, 'debounced': 0, 'rate_limited': 0, 'dropped': 0}
+            )
+
+            key = (trigger_type, event.source)
+
+            # デバウンス: 同じ発生元で直前に受理したイベントから一定時間内は拒否
+            # クライアントが指定するイベント時刻ではなく、サーバーの受付時刻で判定する
+            window = self.debounce.get(trigger_type, 0)
+            last = self._last_accepted.get(key)
+            if window and last is not None and event.admitted_at - last < window:
+                stats['debounced'] += 1
+                return False, 'debounced', window - (event.admitted_at - last)
+
+            # 発生元ごとのトークンバケットによるレート制限
+            bucket = self._source_bucket(key)
+            if bucket and not bucket.consume():
+                stats['rate_limited'] += 1
+                return False, 'rate_limited', bucket.retry_after()
+            # 発生元を毎回変えても、種類全体のバケットで制限する
+            type_bucket = self._type_buckets.get(trigger_type)
+            if type_bucket and not type_bucket.consume():
+                if bucket:
+                    bucket.refund()
+                stats['rate_limited'] += 1
+                return False, 'rate_limited', type_bucket.retry_after()
+
+            dropped = self.trigger_queue.put(event, self.priorities.get(trigger_type, 0))
+            if dropped is event:
+                stats['dropped'] += 1
+                return False, 'queue_full', 1.0
+            if dropped is not None:
+                self._stats.setdefault(
+                    dropped.type,
+                    {'accepted': 0, 'debounced': 0, 'rate_limited': 0, 'dropped': 0}
+                )['dropped'] += 1
+                logger.warning(f"キューが満杯のためトリガーを破棄: type={dropped.type}, source={dropped.source}")
+                tracer.span(dropped.trace_id, 'trigger.dropped', dropped.admitted_at, type=dropped.type)
+
+            stats['accepted'] += 1
+            self._last_accepted[key] = event.admitted_at
+            self._last_accepted.move_to_end(key)
+            if len(self._last_accepted) > self.max_sources:
+                self._last_accepted.popitem(last=False)
+            return True, None, 0.0
+
+    def _source_bucket(self, key) -> Optional[TokenBucket]:
+        """発生元のトークンバケット（レート制限の無い種類はNone。admission_lockを取得済みで呼ぶ）"""
+        trigger_type = key[0]
+        if trigger_type not in self.rates:
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rates[trigger_type], self.bursts.get(trigger_type, 1))
+            self._buckets[key] = bucket
+            # 発生元の数に上限を設け、最も長く使われていないものから忘れる
+            if len(self._buckets) > self.max_sources:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def admission_stats(self) -> Dict[str, Any]:
+        """アドミッション制御の統計"""
+        with self._admission_lock:
+            return {
+                'queued': self.trigger_queue.qsize(),
+                'sources': {key: dict(value) for key, value in self._stats.items()}
+            }
 
     def manual_trigger(self):
         """手動トリガーの実行"""
         if self.running:
-            self.trigger_queue.put(
-                TriggerEvent('manual', 'button', time.time())
-            )
-            logger.info("手動トリガーを実行")
+            accepted, reason, _ = self.submit(TriggerEvent('manual', 'button', now()))
+            if accepted:
+                logger.info("手動トリガーを実行")
+            else:
+                logger.info(f"手動トリガーは制限されました: {reason}")
 
-    def get_trigger(self) -> Optional[TriggerEvent]:
-        """トリガーイベントを取得"""
-        try:
-            return self.trigger_queue.get_nowait()
-        except queue.Empty:
-            return None
+    def get_trigger(self, timeout: float = None) -> Optional[TriggerEvent]:
+        """
+        トリガーイベントを取得（優先度の高い順）
+        Args:
+            timeout: 最大待機秒数（省略時は待機しない）
+        """
+        return self.trigger_queue.get(timeout or 0)
 
     def _start_keyboard_listener(self):
         """キーボードリスナーの開始"""
         def on_press(key):
             if key == keyboard.Key.space and self.running:
-                self.trigger_queue.put(
-                    TriggerEvent('keyboard', 'space', time.time())
-                )
+                self.submit(TriggerEvent('keyboard', 'space', now()))
                 logger.debug("キーボードトリガーを検知")
 
         self.keyboard_listener = keyboard.Listener(on_press=on_press)
         self.keyboard_listener.start()
 
+    def _stop_keyboard_listener(self):
+        """キーボードリスナーの停止"""
+        if self.keyboard_listener:
+            self.keyboard_listener.stop()
+            self.keyboard_listener = None
+
     def _start_gpio_listener(self):
         """GPIOリスナーの開始 (ライブラリ自動選択対応)"""
-        if not GPIO_AVAILABLE:
+        if not GPIO_AVAILABLE and self.gpio_pin_factory is None:
             raise TriggerError("利用可能なGPIOライブラリが見つかりません。")
 
-        gpio_pin_number = self.config.get('trigger', 'gpio_pin')
-        library_to_use = None
-
-        # Determine which library to use based on preference and availability
-        if self.gpio_library_preference == 'gpiozero' and GPIOZERO_AVAILABLE:
-            library_to_use = 'gpiozero'
-        elif self.gpio_library_preference == 'rpigpio' and RPIGPIO_AVAILABLE:
-            library_to_use = 'rpigpio'
-        elif self.gpio_library_preference == 'auto':
-            if GPIOZERO_AVAILABLE:
-                library_to_use = 'gpiozero'
-            elif RPIGPIO_AVAILABLE:
-                library_to_use = 'rpigpio'
-
-        if not library_to_use:
-            raise TriggerError(f"要求されたGPIOライブラリ '{self.gpio_library_preference}' が利用できないか、'auto' で利用可能なライブラリがありません。")
-
-        # Initialize the chosen library
-        try:
-            if library_to_use == 'gpiozero':
-                self._initialize_gpiozero(gpio_pin_number)
-            elif library_to_use == 'rpigpio':
-                self._initialize_rpigpio(gpio_pin_number)
-            self.active_gpio_library = library_to_use
-            logger.info(f"GPIOリスナーを開始 ({library_to_use}): pin={gpio_pin_number}")
-        except Exception as e:
-            self.active_gpio_library = None # Ensure state is clean on failure
-            raise TriggerError(f"GPIOピン {gpio_pin_number} の初期化に失敗 ({library_to_use}): {e}")
-
-    def _initialize_gpiozero(self, pin_number):
-        """gpiozeroライブラリを使用してGPIOを初期化"""
-        # pull_up=True is the default for Button, equivalent to PUD_UP
-        # bounce_time is in seconds for gpiozero
-        button = Button(pin_number, pull_up=True, bounce_time=0.2)
+        # ピン番号 -> 発生元の名前（未指定の場合は gpio_pin のみ）
+        pins = {
+            int(pin): str(source)
+            for pin, source in (self.config.get('trigger', 'gpio_pins', {}) or {}).items()
+        }
+        if not pins:
+            pin = self.config.get('trigger', 'gpio_pin')
+            pins = {pin: f'pin{pin}'}
 
-        def gpio_pressed():
+        def on_trigger(source, timestamp):
             if self.running:
-                self.trigger_queue.put(
-                    TriggerEvent('gpio', f'pin{pin_number}', time.time())
-                )
-                logger.debug(f"GPIOトリガーを検知 (gpiozero): pin{pin_number}")
-
-        button.when_pressed = gpio_pressed
-        self.active_gpio_handler = button # Store the Button object
-
-    def _initialize_rpigpio(self, pin_number):
-        """RPi.GPIOライブラリを使用してGPIOを初期化"""
-        GPIO.setmode(GPIO.BCM)
-        # Setup with pull-up resistor
-        GPIO.setup(pin_number, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-        def gpio_callback(channel):
-            # Check if still running and if the event is for the correct pin
-            if self.running and channel == pin_number:
-                 # Add a small delay to debounce manually if needed, though bouncetime helps
-                time.sleep(0.05)
-                # Re-check the pin state to confirm it's low (pressed)
-                if GPIO.input(channel) == GPIO.LOW:
-                    self.trigger_queue.put(
-                        TriggerEvent('gpio', f'pin{channel}', time.time())
-                    )
-                    logger.debug(f"GPIOトリガーを検知 (RPi.GPIO): pin{channel}")
-
-        # Detect falling edge (high to low transition due to pull-up)
-        GPIO.add_event_detect(
-            pin_number,
-            GPIO.FALLING,
-            callback=gpio_callback,
-            bouncetime=200 # milliseconds
+                self.submit(TriggerEvent('gpio', source, timestamp))
+                logger.debug(f"GPIOトリガーを検知: {source}")
+
+        engine = GpioTriggerEngine(
+            pins,
+            on_trigger,
+            library=self.gpio_library_preference,
+            bounce_time=self.config.get('trigger', 'gpio_bounce_time', 0.05),
+            pin_factory=self.gpio_pin_factory
         )
-        self.active_gpio_handler = pin_number # Store the pin number for cleanup reference
+        engine.start()
+        self.gpio_engine = engine
+        self.status_providers['gpio'] = engine.stats
+
+    def _stop_gpio_listener(self):
+        """GPIOリスナーの停止"""
+        if self.gpio_engine is not None:
+            self.status_providers.pop('gpio', None)
+            self.gpio_engine.stop()
+            self.gpio_engine = None
 
     def _start_http_listener(self):
         """HTTPリスナーの開始"""
         port = self.config.get('trigger', 'http_port')
-        server = HTTPServer(('0.0.0.0', port), HttpTriggerHandler)
-        server.trigger_queue = self.trigger_queue
+        # ダウンロードやライブ配信でトリガーの受付を妨げないよう、リクエストごとにスレッドで処理
+        server = ThreadingHTTPServer(('0.0.0.0', port), HttpTriggerHandler)
+        server.daemon_threads = True
+        server.stopping = threading.Event()
         server.trigger_manager = self
         server.start_time = time.time()
         self.http_server = server
         
         threading.Thread(
             target=server.serve_forever,
+            name='http-trigger',
             daemon=True
         ).start()
         
         logger.info(f"HTTPサーバーを起動: port={port}")
 
+    def _stop_http_listener(self):
+        """HTTPリスナーの停止"""
+        if self.http_server:
+            server, self.http_server = self.http_server, None
+            server.stopping.set()
+            server.shutdown()
+            server.server_close()
+
     def _start_websocket_listener(self):
         """WebSocketリスナーの開始"""
         def on_trigger(event):
-            if self.running:
-                self.trigger_queue.put(event)
-                logger.debug("WebSocketトリガーを検知")
+            if not self.running:
+                return False, 'stopped', 0.0
+            logger.debug("WebSocketトリガーを検知")
+            return self.submit(event)
 
         port = self.config.get('trigger', 'websocket_port')
-        self.websocket_server = WebSocketTrigger(port, on_trigger)
+        self.websocket_server = WebSocketTrigger(
+            port, on_trigger, self.clock, self.config.get('clock', 'sync_interval', 10.0)
+        )
         self.websocket_server.start()
+
+    def _stop_websocket_listener(self):
+        """WebSocketリスナーの停止"""
+        if self.websocket_server:
+            self.websocket_server.stop()
+            self.websocket_server = None
+
+    def _start_motion_listener(self):
+        """動き検知の開始"""
+        if self.frame_source is None:
+            raise TriggerError("動き検知に使うフレームの取得元が設定されていません")
+
+        def on_trigger(event):
+            if self.running:
+                self.submit(event)
+                logger.debug("動き検知トリガーを検知")
+
+        settings = self.config.get('trigger', 'motion', {})
+        self.motion_trigger = MotionTrigger(settings, self.frame_source, on_trigger)
+        self.motion_trigger.start()
+        logger.info(f"動き検知を開始: {1.0 / self.motion_trigger.interval:g}fps")
+
+    def _stop_motion_listener(self):
+        """動き検知の停止"""
+        if self.motion_trigger:
+            self.motion_trigger.stop()
+            self.motion_trigger = None
@@ -1,25 +1,160 @@
+import atexit
+import copy
 import logging
+import logging.handlers
+import queue
+import threading
+import time
 import yaml
 import os
-from typing import Any, Dict
-from exceptions import ConfigError
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from exceptions import ConfigError, ResourceError
 
 # ロガーの設定
+DEFAULT_LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class RateLimitFilter(logging.Filter):
+    """
+    同じ箇所から繰り返し出力されるWARNING以上のログを間引く
+    （カメラ切断時の毎フレームのエラーなど）
+    """
+    def __init__(self, interval: float = 10.0, burst: int = 5):
+        """
+        Args:
+            interval: 集計する期間（秒）
+            burst: 期間内に出力する最大件数（0で間引かない）
+        """
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        # 出力箇所ごとの [期間の開始時刻, 件数, 抑制した件数]
+        self._windows = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.burst <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        current = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or current - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [current, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg}（直前に同じメッセージを{suppressed}件抑制）"
+                return True
+            window[1] += 1
+            if window[1] <= self.burst:
+                return True
+            window[2] += 1
+            return False
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    ログをキューに積むだけのハンドラー
+    整形と出力はQueueListenerのスレッドで行い、キューが満杯の場合は破棄する
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同一プロセス内で受け渡すため、整形はリスナー側に任せる
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
 def setup_logger(name: str) -> logging.Logger:
-    """アプリケーションロガーのセットアップ"""
+    """アプリケーションロガーのセットアップ（設定はconfigure_loggingで適用）"""
     logger = logging.getLogger(name)
     if not logger.handlers:
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        handler.setFormatter(formatter)
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=10000))
+        handler.addFilter(RateLimitFilter())
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(DEFAULT_LOG_FORMAT))
+        listener = logging.handlers.QueueListener(handler.queue, console, respect_handler_level=True)
+        listener.start()
+        # 終了時にキューに残ったログを出力する
+        atexit.register(listener.stop)
+        handler.listener = listener
         logger.addHandler(handler)
         logger.setLevel(logging.INFO)
     return logger
 
 logger = setup_logger('PyDriveRecorder')
 
+def configure_logging(config: 'Config'):
+    """
+    loggingセクションの設定（レベル・書式・ローテーションするファイル出力・間引き）を適用
+    Args:
+        config: 設定オブジェクト
+    """
+    handler = next(h for h in logger.handlers if isinstance(h, NonBlockingQueueHandler))
+    formatter = logging.Formatter(config.get('logging', 'format', DEFAULT_LOG_FORMAT))
+
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    handlers = [console]
+    log_file = config.get('logging', 'file', '')
+    if log_file:
+        try:
+            directory = os.path.dirname(log_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file,
+                maxBytes=int(config.get('logging', 'max_size_mb', 10) * 1024 * 1024),
+                backupCount=config.get('logging', 'backup_count', 5),
+                encoding='utf-8'
+            )
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        except OSError as e:
+            logger.warning(f"ログファイルを開けませんでした: {log_file}: {e}")
+
+    for old_filter in [f for f in handler.filters if isinstance(f, RateLimitFilter)]:
+        handler.removeFilter(old_filter)
+    handler.addFilter(RateLimitFilter(
+        config.get('logging', 'rate_limit_interval', 10.0),
+        config.get('logging', 'rate_limit_burst', 5)
+    ))
+
+    # リスナーを止めてから出力先を差し替える（キュー内のログは古い出力先に書き出される）
+    listener = handler.listener
+    listener.stop()
+    for old_handler in listener.handlers:
+        old_handler.close()
+    listener.handlers = tuple(handlers)
+    listener.start()
+
+    level = config.get('logging', 'level', 'INFO')
+    logger.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+# 時刻の基準（起動時の壁時計と単調時計）
+_WALL_ANCHOR = time.time()
+_MONOTONIC_ANCHOR = time.monotonic()
+
+def now() -> float:
+    """
+    現在時刻（UNIX時刻）の取得
+    単調時計から算出するため、システム時刻の変更で巻き戻らない
+    """
+    return _WALL_ANCHOR + (time.monotonic() - _MONOTONIC_ANCHOR)
+
+def monotonic_offset() -> float:
+    """
+    now() と単調時計の差（プロセスごとに起動時に決まる）
+    単調時計はプロセス間で共通のため、別プロセスの now() の時刻は
+    相手の monotonic_offset() を引いて自分の monotonic_offset() を足せば変換できる
+    """
+    return _WALL_ANCHOR - _MONOTONIC_ANCHOR
+
 class Config:
     """設定管理クラス"""
     DEFAULT_CONFIG = {
@@ -37,19 +172,138 @@ class Config:
         },
         'trigger': {
             'default_type': 'keyboard',
-            'available_types': ['keyboard', 'gpio', 'http', 'websocket'],
+            'enabled_types': [],  # 同時に有効にするトリガー（空の場合はdefault_typeのみ）
+            'available_types': ['keyboard', 'gpio', 'http', 'websocket', 'motion'],
             'http_port': 8080,
+            'live_fps': 10,  # /live.mjpg の最大配信fps
+            'live_max_clients': 4,  # /live.mjpg の同時接続数
             'websocket_port': 8081,
-            'gpio_pin': 17  # Raspberry Pi GPIO pin number
+            'gpio_pin': 17,  # Raspberry Pi GPIO pin number
+            'gpio_pins': {},  # ピン番号 -> 発生元の名前（複数ピン。空の場合は gpio_pin のみ）
+            'gpio_bounce_time': 0.05,  # 離した後にこの秒数内に戻った押下はチャタリングとして無視
+            'motion': {
+                'analysis_fps': 5,  # 解析するフレームレート
+                'pixel_threshold': 25,  # 変化とみなす輝度差
+                'on_ratio': 0.02,  # 動き開始とみなす変化画素の割合
+                'off_ratio': 0.01,  # 動き終了とみなす変化画素の割合
+                'on_frames': 2,  # 開始判定に必要な連続フレーム数
+                'off_frames': 10,  # 終了判定に必要な連続フレーム数
+                'background_alpha': 0.05,  # 背景モデルの更新率
+                'roi': []  # 解析領域 [x, y, 幅, 高さ]（0-1の比率）のリスト。空の場合は全体
+            }
+        },
+        'admission': {
+            'queue_size': 8,  # 保存待ちトリガーの上限
+            'drop_policy': 'drop_oldest',  # 満杯時: drop_oldest / drop_newest
+            # 種類ごとのデバウンス時間（秒）。発生元（source）ごとにサーバーの受付時刻で判定
+            'debounce': {'gpio': 0.5, 'keyboard': 0.5, 'http': 1.0, 'websocket': 1.0, 'motion': 5.0},
+            # 種類ごとのレート制限（1秒あたりのトリガー数）とバースト数。バケットは発生元ごと
+            'rate': {'http': 0.2, 'websocket': 0.2},
+            'burst': {'http': 2, 'websocket': 2},
+            # 種類ごとに全発生元で共有するレート制限（source を変えながらの連打も制限する）
+            'type_rate': {'http': 1.0, 'websocket': 1.0},
+            'type_burst': {'http': 5, 'websocket': 5},
+            'max_sources': 256,  # デバウンス・バケットを保持する発生元の数（超えたら最も古いものから忘れる）
+            # キューからは優先度の高い順に取り出す
+            'priority': {'manual': 100, 'gpio': 90, 'keyboard': 80, 'motion': 50, 'websocket': 40, 'http': 30}
+        },
+        'clock': {
+            'sync_interval': 10.0,  # WebSocketのクライアントに ping を送る間隔（秒）
+            'window': 8,  # クライアントごとに保持する往復の数（通信時間が最短のものを使用）
+            'max_sample_age': 600,  # これより古い往復は使わない（秒）
+            'drift_ppm': 100,  # 計測後の時計のずれの増え方の想定（誤差に加算）
+            'max_event_age': 30,  # 受信時刻よりこれ以上古いイベント時刻は拒否（秒）
+            'max_clients': 256  # 時計のずれを保持するクライアントの数（超えたら最も古いものから忘れる）
         },
         'buffer': {
             'max_size_mb': 1024,
-            'compression_quality': 90
+            'compression_quality': 90,
+            'full_resolution_seconds': 10,  # tiers指定時、フル解像度で保持する秒数
+            'tiers': [],  # 下位階層 (scale, max_size_mb, compression_quality, max_age)
+            'static_threshold': 0.0,  # 静止フレーム判定の閾値（縮小画像の区画ごとの輝度差の最大値、0で無効）
+            'static_max_interval': 1.0  # 静止シーンでも圧縮し直す間隔（秒）
+        },
+        'overlay': {
+            'enabled': False,  # 日時・テレメトリをフレームに焼き込む
+            'template': '{time}',  # 表示する文字列（例: '{time}  {speed:.0f}km/h'）
+            'time_format': '%Y-%m-%d %H:%M:%S',
+            'position': 'bottom-left',  # top-left / top-right / bottom-left / bottom-right
+            'scale': 1.0,  # 文字の大きさ（高さ720pxに対する倍率）
+            'margin': 8,
+            'max_chars': 48,
+            'telemetry_max_age': 5.0  # この秒数更新がないテレメトリは '--' と表示
+        },
+        'snapshot': {
+            # 終了時にバッファを書き出し、次回起動時に復元する（書き出しは recording.max_time 秒分まで）
+            'enabled': False,
+            'path': 'buffer.snapshot',
+            'max_age': 600  # これより古いスナップショットは復元しない（秒）
+        },
+        'encoder': {
+            'backend': 'auto',  # auto / ffmpeg / opencv
+            'ffmpeg_path': 'ffmpeg',
+            'codec': 'libx264',
+            'preset': 'veryfast',
+            'crf': 23,
+            'threads': 0,  # 0 = ffmpegに任せる
+            'input': 'jpeg',  # jpeg (image2pipe) / raw
+            'opencv_fourcc': 'mp4v'
+        },
+        'save': {
+            'worker_processes': 0,  # 0 = 保存をメインプロセス内で実行
+            'fsync_interval_mb': 8,  # 一時ファイルをfsyncする書き込み量の間隔（0で完了時のみ）
+            'max_write_mb_per_sec': 0,  # クリップ書き込み帯域の上限（0で無制限）
+            'decode_workers': 0,  # 書き出し時のJPEGデコードのスレッド数（0で自動、1で並列化しない）
+            'decode_batch': 8,  # 1タスクでデコードするフレーム数
+            'decode_window': 4,  # 先行してデコードするバッチ数の上限
+            'sidecar': True,  # シーク用インデックスとサムネイル列をクリップと一緒に書き出す
+            'thumbnail_interval': 1.0,  # サムネイルの間隔（秒）
+            'thumbnail_height': 72  # サムネイルの高さ（ピクセル）
+        },
+        'catalog': {
+            'enabled': True,
+            'filename': 'clips.db',  # 保存先ディレクトリに作成するインデックス
+            'max_disk_mb': 0,  # クリップの合計サイズの上限（0で無制限）
+            'max_age_days': 0,  # 保持日数（0で無制限）
+            'policy': 'priority',  # 上限超過時の削除順: priority / oldest
+            'retention_interval': 60  # 保持ポリシーを適用する間隔（秒）
+        },
+        'tracing': {
+            'enabled': False,  # トリガーごとの処理時間をJSONLに記録
+            'path': 'logs/trace-%Y%m%d.jsonl'  # 出力先（strftime形式、日付ごとのファイル）
+        },
+        'profiling': {
+            'output_dir': 'logs',  # POST /profile の結果（collapsed形式）の出力先
+            'interval_ms': 10,  # サンプリング間隔
+            'max_seconds': 300  # 1回の計測の最大秒数
+        },
+        'logging': {
+            'level': 'INFO',
+            'format': DEFAULT_LOG_FORMAT,
+            'file': '',  # ログファイル（空の場合はコンソールのみ）
+            'max_size_mb': 10,  # ローテーションするサイズ
+            'backup_count': 5,  # 保持する世代数
+            'rate_limit_interval': 10.0,  # 同じ箇所のWARNING以上を間引く期間（秒）
+            'rate_limit_burst': 5  # 期間内に出力する最大件数（0で間引かない）
+        },
+        'capture': {
+            'mode': 'thread',  # thread / process
+            'ring_name': 'pydriverecorder',
+            'ring_slots': 600,
+            'ring_slot_kb': 512,
+            'attach_timeout': 10,
+            'stall_timeout': 5,  # この秒数フレームが届かなければ再接続
+            'reconnect_backoff': 0.5,
+            'reconnect_backoff_max': 10,
+            'gap_threshold': 0.5,  # この秒数以上空いたフレーム間を途切れとして記録
+            'warmup_frames': 5  # カメラ切り替え時に読み捨てるフレーム数
         }
     }
 
     def __init__(self, config_path: str = None):
-        self._config = self.DEFAULT_CONFIG.copy()
+        self.path = config_path if config_path and os.path.exists(config_path) else None
+        # set() でクラス共通のデフォルト値を書き換えないよう、入れ子の辞書ごと複製する
+        self._config = copy.deepcopy(self.DEFAULT_CONFIG)
         if config_path and os.path.exists(config_path):
             try:
                 with open(config_path, 'r') as f:
@@ -79,6 +333,17 @@ class Config:
                 return default
             raise ConfigError(f"設定が見つかりません: {section}.{key}")
 
+    def set(self, section: str, key: str, value: Any):
+        """設定値の変更（実行中の変更を反映するため。ファイルへの保存は save() で行う）"""
+        self._config.setdefault(section, {})[key] = value
+
+    def get_section(self, section: str) -> Dict[str, Any]:
+        """セクション全体のコピーを取得"""
+        try:
+            return dict(self._config[section])
+        except KeyError:
+            raise ConfigError(f"設定が見つかりません: {section}")
+
     def save(self, config_path: str):
         """設定の保存"""
         try:
@@ -87,18 +352,147 @@ class Config:
         except Exception as e:
             raise ConfigError(f"設定の保存に失敗: {e}")
 
+class BufferedFrame:
+    """バッファ内のフレーム（JPEGデータ、タイムスタンプ、解像度）"""
+    __slots__ = ('timestamp', 'payload', 'size', 'shared')
+
+    # 直前のフレームのJPEGデータを参照するだけのフレームの管理コスト（バイト）
+    SHARED_COST = 64
+
+    def __init__(self, timestamp: float, payload, size: Tuple[int, int] = None,
+                 shared: bool = False):
+        self.timestamp = timestamp
+        self.payload = payload
+        self.size = size  # (幅, 高さ)
+        self.shared = shared  # True: 直前のフレームとJPEGデータを共有（静止シーン）
+
+    @property
+    def cost(self) -> int:
+        """バッファ容量の計算に使うバイト数"""
+        return self.SHARED_COST if self.shared else len(self.payload)
+
+class BufferTier:
+    """フレームバッファの階層（解像度ごとの保持領域）"""
+    def __init__(self, scale: float, max_bytes: int, quality: int, max_age: float = None):
+        """
+        Args:
+            scale: フル解像度に対する縮小率
+            max_bytes: この階層の最大バイト数
+            quality: この階層のJPEG圧縮品質
+            max_age: この秒数を過ぎたフレームを次の階層へ移す（Noneの場合は移さない）
+        """
+        self.scale = scale
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.max_age = max_age
+        self.frames = deque()
+        self.size = 0
+        # 直前に変換したフレームの (変換前のデータ, 変換後のデータ, 解像度)（共有フレームの変換に使う）
+        self.last_converted = (None, None, None)
+
+    def append(self, entry: BufferedFrame):
+        """フレームを追加し、上限を超えた古いフレームを破棄"""
+        if entry.shared and not (self.frames and self.frames[-1].payload is entry.payload):
+            # 共有元が既に無い場合は、このフレームがデータを保持する
+            entry.shared = False
+        while self.frames and self.size + entry.cost > self.max_bytes:
+            self.popleft()
+        self.frames.append(entry)
+        self.size += entry.cost
+
+    def popleft(self) -> BufferedFrame:
+        """最古のフレームを取り出す"""
+        entry = self.frames.popleft()
+        self.size -= entry.cost
+        # JPEGデータを共有している後続フレームがあれば、データの保持コストを引き継ぐ
+        if not entry.shared and self.frames and self.frames[0].payload is entry.payload:
+            successor = self.frames[0]
+            self.size += len(successor.payload) - successor.cost
+            successor.shared = False
+        return entry
+
+    def clear(self):
+        self.frames.clear()
+        self.size = 0
+        self.last_converted = (None, None, None)
+
 class FrameBuffer:
-    """最適化されたフレームバッファ"""
-    def __init__(self, max_bytes: int, compression_quality: int = 90):
+    """
+    最適化されたフレームバッファ
+    tiers を指定すると、古いフレームをバックグラウンドで縮小・再圧縮して下位の階層に移す
+    """
+    TRANSCODE_INTERVAL = 0.2
+    TRANSCODE_BATCH = 30
+    THUMBNAIL_SIZE = (64, 36)
+
+    def __init__(self, max_bytes: int, compression_quality: int = 90,
+                 full_resolution_seconds: float = None, tiers: List[Dict[str, Any]] = None,
+                 static_threshold: float = 0.0, static_max_interval: float = 1.0):
+        """
+        Args:
+            max_bytes: バッファ全体の最大バイト数
+            compression_quality: フル解像度フレームのJPEG圧縮品質
+            full_resolution_seconds: フル解像度で保持する秒数（tiers指定時のみ有効）
+            tiers: 下位階層の設定（scale, max_size_mb, compression_quality, max_age）
+            static_threshold: 縮小画像の全区画で輝度差がこの値未満なら直前のJPEGデータを共有（0で無効）
+            static_max_interval: 静止シーンでもこの秒数ごとにフレームを圧縮し直す
+        """
         self.max_bytes = max_bytes
         self.compression_quality = compression_quality
-        self._buffer = []
-        self._current_size = 0
+        self.static_threshold = static_threshold
+        self.static_max_interval = static_max_interval
+        self._cond = threading.Condition()
+
+        # 静止フレーム判定用（最後に圧縮したフレームの縮小画像）
+        self._reference_thumbnail = None
+        self._reference_time = None
+        self.shared_frames = 0
+
+        tiers = tiers or []
+        history_bytes = sum(int(tier['max_size_mb'] * 1024 * 1024) for tier in tiers)
+        if history_bytes >= max_bytes:
+            raise ConfigError("下位階層の合計サイズが buffer.max_size_mb を超えています")
+
+        self._tiers = [BufferTier(
+            1.0, max_bytes - history_bytes, compression_quality,
+            full_resolution_seconds if tiers else None
+        )]
+        for tier in tiers:
+            self._tiers.append(BufferTier(
+                float(tier['scale']),
+                int(tier['max_size_mb'] * 1024 * 1024),
+                tier.get('compression_quality', compression_quality),
+                tier.get('max_age')
+            ))
+
+        self._transcoder = None
+        self._stop_event = threading.Event()
+        if len(self._tiers) > 1:
+            self._transcoder = threading.Thread(target=self._transcode_loop, name='buffer-transcode', daemon=True)
+            self._transcoder.start()
 
-    def add_frame(self, frame):
-        """フレームの追加（サイズ制限付き）"""
+    def add_frame(self, frame, timestamp: float = None):
+        """
+        フレームの追加（サイズ制限付き）
+        Args:
+            frame: フレーム画像
+            timestamp: キャプチャ時刻（省略時は現在時刻）
+        """
         import cv2
-        import numpy as np
+
+        if timestamp is None:
+            timestamp = now()
+        size = (frame.shape[1], frame.shape[0])
+
+        # 静止シーンでは圧縮を省略し、直前のフレームのJPEGデータを共有する
+        if self.static_threshold > 0 and self._is_static(frame, timestamp):
+            with self._cond:
+                frames = self._tiers[0].frames
+                if frames and frames[-1].size == size:
+                    self._tiers[0].append(BufferedFrame(timestamp, frames[-1].payload, size, shared=True))
+                    self.shared_frames += 1
+                    self._cond.notify_all()
+                    return
 
         # フレームの圧縮
         encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), self.compression_quality]
@@ -107,29 +501,375 @@ class FrameBuffer:
         if not result:
             raise ResourceError("フレームの圧縮に失敗しました")
 
-        frame_size = len(encoded_frame)
+        with self._cond:
+            # バッファサイズの管理
+            self._tiers[0].append(BufferedFrame(timestamp, encoded_frame, size))
+            self._cond.notify_all()
+
+    def _is_static(self, frame, timestamp: float) -> bool:
+        """
+        最後に圧縮したフレームとの差が閾値未満かどうか
+        判定は縮小したグレースケール画像の区画ごとの絶対差の最大値で行う
+        （平均では画面の一部だけの動き（遠くの歩行者など）が埋もれるため）
+        """
+        import cv2
+        import numpy as np
 
-        # バッファサイズの管理
-        while self._buffer and self._current_size + frame_size > self.max_bytes:
-            self._current_size -= len(self._buffer.pop(0))
+        thumbnail = cv2.resize(frame, self.THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        thumbnail = thumbnail.astype(np.int16)
 
-        self._buffer.append(encoded_frame)
-        self._current_size += frame_size
+        reference = self._reference_thumbnail
+        if (reference is not None
+                and timestamp - self._reference_time < self.static_max_interval
+                and int(np.max(np.abs(thumbnail - reference))) < self.static_threshold):
+            return True
+
+        self._reference_thumbnail = thumbnail
+        self._reference_time = timestamp
+        return False
+
+    def _entries(self) -> List[BufferedFrame]:
+        """全階層のフレームを古い順に取得（ロック取得済みで呼ぶ）"""
+        entries = []
+        for tier in reversed(self._tiers):
+            entries.extend(tier.frames)
+        return entries
 
     def get_frames(self, count: int = None):
         """フレームの取得"""
         import cv2
-        import numpy as np
 
-        frames = self._buffer[-count:] if count else self._buffer
-        return [cv2.imdecode(frame, cv2.IMREAD_COLOR) for frame in frames]
+        return [cv2.imdecode(frame, cv2.IMREAD_COLOR) for frame in self.get_encoded_frames(count)]
+
+    def get_encoded_frames(self, count: int = None):
+        """JPEG圧縮済みフレームの取得（デコードなし）"""
+        with self._cond:
+            if count and count <= len(self._tiers[0].frames):
+                entries = list(self._tiers[0].frames)[-count:]
+            else:
+                entries = self._entries()[-count:] if count else self._entries()
+        return [entry.payload for entry in entries]
+
+    def get_entries(self, start_time: float = None, end_time: float = None) -> List[BufferedFrame]:
+        """
+        指定時間範囲のフレームを古い順に取得
+        Args:
+            start_time: 開始時刻（省略時は最古のフレームから）
+            end_time: 終了時刻（省略時は最新のフレームまで）
+        """
+        with self._cond:
+            entries = self._entries()
+        return [
+            entry for entry in entries
+            if (start_time is None or entry.timestamp >= start_time)
+            and (end_time is None or entry.timestamp <= end_time)
+        ]
+
+    def get_latest(self) -> Optional[BufferedFrame]:
+        """最新フレームの取得（デコードなし）"""
+        with self._cond:
+            for tier in self._tiers:
+                if tier.frames:
+                    return tier.frames[-1]
+            return None
+
+    @property
+    def latest_timestamp(self) -> Optional[float]:
+        """最新フレームのタイムスタンプ"""
+        latest = self.get_latest()
+        return latest.timestamp if latest else None
+
+    def wait_for_frame(self, after: float, timeout: float) -> bool:
+        """
+        指定時刻より新しいフレームが追加されるまで待機
+        Args:
+            after: この時刻より新しいフレームを待つ
+            timeout: 最大待機秒数
+        """
+        frames = self._tiers[0].frames
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: frames and frames[-1].timestamp > after,
+                timeout
+            )
+
+    def _transcode_loop(self):
+        """古いフレームを下位の階層へ移すバックグラウンド処理"""
+        while not self._stop_event.wait(self.TRANSCODE_INTERVAL):
+            for index in range(len(self._tiers) - 1):
+                try:
+                    self._demote(self._tiers[index], self._tiers[index + 1])
+                except Exception as e:
+                    logger.error(f"バッファ階層の変換中にエラー: {e}")
+
+    def _demote(self, source: BufferTier, target: BufferTier):
+        """source の期限切れフレームを縮小・再圧縮して target に移す"""
+        if source.max_age is None:
+            return
+        cutoff = now() - source.max_age
+        while True:
+            with self._cond:
+                candidates = []
+                for entry in source.frames:
+                    if entry.timestamp >= cutoff or len(candidates) >= self.TRANSCODE_BATCH:
+                        break
+                    candidates.append(entry)
+            if not candidates:
+                return
+
+            # 変換はロックの外で行う（キャプチャを止めない）
+            converted = []
+            for entry in candidates:
+                original, payload, size = target.last_converted
+                if entry.payload is original:
+                    # JPEGデータを共有するフレームは変換済みのデータを共有する
+                    converted.append(BufferedFrame(entry.timestamp, payload, size, shared=True))
+                    continue
+                new_entry = self._transcode(entry, source.scale, target)
+                if new_entry is not None:
+                    target.last_converted = (entry.payload, new_entry.payload, new_entry.size)
+                converted.append(new_entry)
+
+            with self._cond:
+                for entry, new_entry in zip(candidates, converted):
+                    # 変換中に容量超過で破棄されたフレームは移さない
+                    if not source.frames or source.frames[0] is not entry:
+                        continue
+                    source.popleft()
+                    if new_entry is not None:
+                        target.append(new_entry)
+
+    @staticmethod
+    def _transcode(entry: BufferedFrame, source_scale: float, target: BufferTier) -> Optional[BufferedFrame]:
+        """フレームを target の解像度・品質で再圧縮"""
+        import cv2
+
+        ratio = target.scale / source_scale
+        # JPEGは1/2, 1/4, 1/8 の縮小デコードができるため、フル解像度に展開しない
+        reduced_flags = {
+            0.5: cv2.IMREAD_REDUCED_COLOR_2,
+            0.25: cv2.IMREAD_REDUCED_COLOR_4,
+            0.125: cv2.IMREAD_REDUCED_COLOR_8,
+        }
+        flag = reduced_flags.get(round(ratio, 3))
+        if flag is not None:
+            frame = cv2.imdecode(entry.payload, flag)
+        else:
+            frame = cv2.imdecode(entry.payload, cv2.IMREAD_COLOR)
+            if frame is not None:
+                width = max(1, int(frame.shape[1] * ratio))
+                height = max(1, int(frame.shape[0] * ratio))
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        if frame is None:
+            return None
+
+        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), target.quality]
+        result, payload = cv2.imencode('.jpg', frame, encode_param)
+        if not result:
+            return None
+        return BufferedFrame(entry.timestamp, payload, (frame.shape[1], frame.shape[0]))
 
     def clear(self):
         """バッファのクリア"""
-        self._buffer.clear()
-        self._current_size = 0
+        with self._cond:
+            for tier in self._tiers:
+                tier.clear()
+
+    def snapshot_entries(self, since: float = None) -> List[Tuple[int, BufferedFrame]]:
+        """
+        全階層のフレームを (階層番号, フレーム) として古い順に取得（スナップショット用）
+        Args:
+            since: この時刻以降のフレームのみ（省略時は全て）
+        """
+        with self._cond:
+            return [
+                (index, entry)
+                for index in reversed(range(len(self._tiers)))
+                for entry in self._tiers[index].frames
+                if since is None or entry.timestamp >= since
+            ]
+
+    def restore(self, entries: List[Tuple[int, BufferedFrame]]) -> int:
+        """
+        スナップショットのフレームを保持中のフレームより前に戻す
+        Args:
+            entries: (階層番号, フレーム) を古い順に（存在しない階層は最下位の階層に入れる）
+        Returns:
+            復元後のフレーム数（容量を超えた古いフレームは破棄される）
+        """
+        restored = [[] for _ in self._tiers]
+        for index, entry in entries:
+            restored[min(index, len(self._tiers) - 1)].append(entry)
+        with self._cond:
+            for tier, frames in zip(self._tiers, restored):
+                if not frames:
+                    continue
+                current = list(tier.frames)
+                tier.clear()
+                for entry in frames + current:
+                    tier.append(entry)
+            self._cond.notify_all()
+        return self.frame_count
+
+    def resize(self, max_bytes: int, compression_quality: int = None):
+        """
+        バッファの最大サイズと圧縮品質を変更（保持中のフレームは残す）
+        縮小時はフル解像度の階層から古いフレームを破棄し、最新のフレームを残す
+        Args:
+            max_bytes: バッファ全体の最大バイト数
+            compression_quality: フル解像度フレームのJPEG圧縮品質（以降に追加するフレームから適用）
+        """
+        with self._cond:
+            history_bytes = sum(tier.max_bytes for tier in self._tiers[1:])
+            if history_bytes >= max_bytes:
+                raise ConfigError("下位階層の合計サイズが buffer.max_size_mb を超えています")
+            self.max_bytes = max_bytes
+            top = self._tiers[0]
+            top.max_bytes = max_bytes - history_bytes
+            while top.frames and top.size > top.max_bytes:
+                top.popleft()
+            if compression_quality is not None:
+                self.compression_quality = compression_quality
+                top.quality = compression_quality
+
+    def close(self):
+        """バックグラウンド処理の停止"""
+        self._stop_event.set()
+        if self._transcoder:
+            self._transcoder.join(timeout=3.0)
+            self._transcoder = None
 
     @property
     def frame_count(self):
         """現在のフレーム数"""
-        return len(self._buffer)
+        return sum(len(tier.frames) for tier in self._tiers)
+
+    @property
+    def tier_stats(self) -> List[Dict[str, Any]]:
+        """階層ごとのフレーム数・バイト数・保持秒数"""
+        with self._cond:
+            return [{
+                'scale': tier.scale,
+                'frames': len(tier.frames),
+                'bytes': tier.size,
+                'shared': sum(1 for entry in tier.frames if entry.shared),
+                'seconds': (tier.frames[-1].timestamp - tier.frames[0].timestamp) if tier.frames else 0.0
+            } for tier in self._tiers]
+
+class FramePacer:
+    """
+    カメラの読み出しに合わせたフレーム間引きとfps計測
+    カメラが目標fpsより速く出力する場合のみフレームを間引き、遅れたフレームは破棄しない
+    """
+    def __init__(self, target_fps: float, smoothing: float = 0.1):
+        self.interval = 1.0 / target_fps if target_fps > 0 else 0.0
+        self.smoothing = smoothing
+        self._next_due = None
+        self._last_timestamp = None
+        self.measured_fps = 0.0
+
+    def should_keep(self, timestamp: float) -> bool:
+        """
+        フレームを採用するかどうか
+        Args:
+            timestamp: フレームの取得時刻
+        """
+        # 期限より1/4フレーム以上早いフレームは間引く
+        if self._next_due is not None and timestamp < self._next_due - self.interval / 4:
+            return False
+
+        # 次の期限を設定（大きく遅れた場合は期限を現在に合わせ直す）
+        if self._next_due is None or timestamp - self._next_due >= self.interval:
+            self._next_due = timestamp + self.interval
+        else:
+            self._next_due += self.interval
+
+        if self._last_timestamp is not None:
+            elapsed = timestamp - self._last_timestamp
+            if elapsed > 0:
+                fps = 1.0 / elapsed
+                if self.measured_fps:
+                    self.measured_fps += self.smoothing * (fps - self.measured_fps)
+                else:
+                    self.measured_fps = fps
+        self._last_timestamp = timestamp
+        return True
+
+class CaptureHealth:
+    """
+    キャプチャの接続状態の記録
+    再接続の回数と映像が途切れていた時間、タイムライン上の途切れ（不連続区間）を保持する
+    """
+    def __init__(self, backoff_initial: float = 0.5, backoff_max: float = 10.0,
+                 max_discontinuities: int = 100):
+        """
+        Args:
+            backoff_initial: 再接続の初回待機秒数
+            backoff_max: 再接続の最大待機秒数
+            max_discontinuities: 保持する不連続区間の数
+        """
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._backoff = backoff_initial
+        self._lock = threading.Lock()
+        self.reconnects = 0
+        self.outage_total = 0.0
+        self.last_error = None
+        self._outage_started = None
+        self.discontinuities = deque(maxlen=max_discontinuities)
+
+    @property
+    def connected(self) -> bool:
+        with self._lock:
+            return self._outage_started is None
+
+    def mark_connected(self):
+        """カメラに接続できた（途切れていた場合は再接続として数える）"""
+        with self._lock:
+            if self._outage_started is not None:
+                self.outage_total += now() - self._outage_started
+                self.reconnects += 1
+                self._outage_started = None
+            self._backoff = self.backoff_initial
+
+    def mark_disconnected(self, reason: str):
+        """カメラから映像が得られなくなった"""
+        with self._lock:
+            if self._outage_started is None:
+                self._outage_started = now()
+            self.last_error = reason
+
+    def next_backoff(self) -> float:
+        """次の再接続までの待機秒数（失敗するたびに倍増）"""
+        with self._lock:
+            delay = self._backoff
+            self._backoff = min(self._backoff * 2, self.backoff_max)
+            return delay
+
+    def add_discontinuity(self, start: float, end: float):
+        """タイムラインの途切れを記録"""
+        with self._lock:
+            self.discontinuities.append((start, end))
+
+    def gaps_between(self, start: float, end: float) -> List[Tuple[float, float]]:
+        """指定範囲と重なる途切れ"""
+        with self._lock:
+            return [(s, e) for s, e in self.discontinuities if s < end and e > start]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """メトリクスの取得"""
+        with self._lock:
+            current_outage = now() - self._outage_started if self._outage_started is not None else 0.0
+            return {
+                'connected': self._outage_started is None,
+                'reconnects': self.reconnects,
+                'outage_seconds': round(self.outage_total + current_outage, 3),
+                'current_outage_seconds': round(current_outage, 3),
+                'last_error': self.last_error,
+                'discontinuities': [
+                    {'start': s, 'end': e, 'duration': round(e - s, 3)}
+                    for s, e in self.discontinuities
+                ]
+            }
@@ -0,0 +1,325 @@
+import os
+import shutil
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from exceptions import VideoError
+from utils import logger
+
+class OpenCVEncoder:
+    """cv2.VideoWriterを使用するエンコーダー（ffmpegが無い環境でのフォールバック）"""
+    name = 'opencv'
+    accepts_jpeg = False
+
+    def __init__(self, settings: Dict[str, Any]):
+        """
+        エンコーダーの初期化
+        Args:
+            settings: encoderセクションの設定値
+        """
+        self.fourcc = settings.get('opencv_fourcc', 'mp4v')
+        self._writer = None
+
+    @property
+    def codec(self) -> str:
+        """出力コーデック名"""
+        return self.fourcc
+
+    def open(self, output_path: str, fps: float, frame_size: Tuple[int, int], writer=None):
+        """
+        出力ファイルを開く
+        Args:
+            writer: ClipWriter（指定時はその一時ファイルに書き込む）
+        """
+        if writer is not None:
+            # VideoWriterは自身でファイルに書き込むため、一時ファイルのパスだけを使う
+            output_path = writer.temp_path
+        fourcc = cv2.VideoWriter_fourcc(*self.fourcc)
+        self._writer = cv2.VideoWriter(output_path, fourcc, fps, frame_size)
+        if not self._writer.isOpened():
+            self._writer = None
+            raise VideoError(f"VideoWriterを開けませんでした: {output_path}")
+
+    def write_frame(self, frame: np.ndarray):
+        """デコード済みフレームを書き込み"""
+        self._writer.write(frame)
+
+    def write_jpeg(self, payload: np.ndarray):
+        """JPEGデータをデコードして書き込み"""
+        frame = cv2.imdecode(payload, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise VideoError("フレームのデコードに失敗しました")
+        self.write_frame(frame)
+
+    def close(self) -> bool:
+        """出力ファイルを閉じる"""
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+        return True
+
+class FFmpegEncoder:
+    """ffmpegサブプロセスへパイプでフレームを流し込むエンコーダー"""
+    name = 'ffmpeg'
+
+    def __init__(self, settings: Dict[str, Any], ffmpeg_path: str):
+        """
+        エンコーダーの初期化
+        Args:
+            settings: encoderセクションの設定値
+            ffmpeg_path: ffmpeg実行ファイルのパス
+        """
+        self.ffmpeg_path = ffmpeg_path
+        self.video_codec = settings.get('codec', 'libx264')
+        self.preset = settings.get('preset', 'veryfast')
+        self.crf = int(settings.get('crf', 23))
+        self.threads = int(settings.get('threads', 0))
+        # jpeg: バッファのJPEGをそのまま image2pipe で渡す / raw: BGRの生フレームを渡す
+        self.accepts_jpeg = settings.get('input', 'jpeg') == 'jpeg'
+        self._process = None
+        self._frame_size = None
+        self._writer = None
+        self._pump_thread = None
+        self._pump_error = None
+
+    @property
+    def codec(self) -> str:
+        """出力コーデック名"""
+        return self.video_codec
+
+    def _build_command(self, output_path: str, fps: float, frame_size: Tuple[int, int]):
+        """ffmpegのコマンドラインを組み立てる"""
+        cmd = [self.ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y']
+        if self.accepts_jpeg:
+            cmd += ['-f', 'image2pipe', '-c:v', 'mjpeg', '-framerate', f'{fps}']
+        else:
+            width, height = frame_size
+            cmd += [
+                '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+                '-s', f'{width}x{height}', '-framerate', f'{fps}'
+            ]
+        cmd += ['-i', 'pipe:0']
+        cmd += [
+            '-c:v', self.video_codec,
+            '-preset', self.preset,
+            '-crf', str(self.crf),
+            '-threads', str(self.threads),
+            '-pix_fmt', 'yuv420p'
+        ]
+        if self.video_codec in ('libx265', 'hevc'):
+            # QuickTime等で再生できるようにタグを指定
+            cmd += ['-tag:v', 'hvc1']
+        if output_path is None:
+            # パイプ出力はシークできないため fragmented MP4 で書き出す
+            cmd += ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof', 'pipe:1']
+        else:
+            cmd.append(output_path)
+        return cmd
+
+    def open(self, output_path: str, fps: float, frame_size: Tuple[int, int], writer=None):
+        """
+        ffmpegプロセスを起動
+        Args:
+            writer: ClipWriter（指定時は標準出力を受け取り、一時ファイルへ書き込む）
+        """
+        self._frame_size = frame_size
+        cmd = self._build_command(None if writer else output_path, fps, frame_size)
+        logger.debug(f"ffmpegを起動: {' '.join(cmd)}")
+        if writer is not None:
+            writer.open()
+        try:
+            self._process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE if writer else subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+        except OSError as e:
+            raise VideoError(f"ffmpegの起動に失敗: {e}")
+
+        if writer is not None:
+            self._writer = writer
+            self._pump_error = None
+            self._pump_thread = threading.Thread(target=self._pump_output, name='ffmpeg-output', daemon=True)
+            self._pump_thread.start()
+
+    def _pump_output(self):
+        """ffmpegの出力をClipWriterへ転送（帯域制限中はffmpeg側が待たされる）"""
+        stdout = self._process.stdout
+        try:
+            while True:
+                chunk = stdout.read(256 * 1024)
+                if not chunk:
+                    break
+                self._writer.write(chunk)
+        except Exception as e:
+            self._pump_error = e
+            # ffmpegが出力待ちで止まらないよう読み捨てる
+            while stdout.read(256 * 1024):
+                pass
+
+    def _write(self, data):
+        try:
+            self._process.stdin.write(data)
+        except (BrokenPipeError, ValueError) as e:
+            raise VideoError(f"ffmpegへの書き込みに失敗: {e}: {self._read_stderr()}")
+
+    def write_frame(self, frame: np.ndarray):
+        """デコード済みフレームを書き込み"""
+        if self.accepts_jpeg:
+            result, payload = cv2.imencode('.jpg', frame)
+            if not result:
+                raise VideoError("フレームの圧縮に失敗しました")
+            self._write(payload.tobytes())
+            return
+        if (frame.shape[1], frame.shape[0]) != self._frame_size:
+            frame = cv2.resize(frame, self._frame_size)
+        self._write(np.ascontiguousarray(frame).data)
+
+    def write_jpeg(self, payload: np.ndarray):
+        """JPEGデータを書き込み（jpeg入力時はデコードしない）"""
+        if self.accepts_jpeg:
+            self._write(payload.tobytes())
+            return
+        frame = cv2.imdecode(payload, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise VideoError("フレームのデコードに失敗しました")
+        self.write_frame(frame)
+
+    def _read_stderr(self) -> str:
+        if self._process is None or self._process.stderr is None:
+            return ''
+        try:
+            return self._process.stderr.read().decode('utf-8', errors='replace').strip()
+        except Exception:
+            return ''
+
+    def close(self) -> bool:
+        """入力を閉じてエンコード完了を待つ"""
+        if self._process is None:
+            return True
+        process, self._process = self._process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = process.stderr.read().decode('utf-8', errors='replace').strip()
+        returncode = process.wait()
+        if self._pump_thread is not None:
+            self._pump_thread.join()
+            self._pump_thread = None
+            self._writer = None
+            if self._pump_error is not None:
+                logger.error(f"エンコード結果の書き込みに失敗しました: {self._pump_error}")
+                return False
+        if returncode != 0:
+            logger.error(f"ffmpegがエラー終了しました (code={returncode}): {stderr}")
+            return False
+        return True
+
+def find_ffmpeg(settings: Dict[str, Any]) -> Optional[str]:
+    """ffmpeg実行ファイルを探す"""
+    return shutil.which(settings.get('ffmpeg_path', 'ffmpeg'))
+
+def create_encoder(settings: Dict[str, Any]):
+    """
+    設定に応じたエンコーダーを生成
+    Args:
+        settings: encoderセクションの設定値
+    """
+    backend = settings.get('backend', 'auto').lower()
+    if backend in ('auto', 'ffmpeg'):
+        ffmpeg_path = find_ffmpeg(settings)
+        if ffmpeg_path:
+            return FFmpegEncoder(settings, ffmpeg_path)
+        if backend == 'ffmpeg':
+            logger.warning("ffmpegが見つからないため、cv2.VideoWriterで保存します")
+    elif backend != 'opencv':
+        raise VideoError(f"未対応のエンコーダー: {backend}")
+    return OpenCVEncoder(settings)
+
+def create_decode_pool(settings: Dict[str, Any]) -> Optional[ThreadPoolExecutor]:
+    """
+    クリップ書き出し時のJPEGデコード用スレッドプールを生成
+    Args:
+        settings: saveセクションの設定値（decode_workers: 0で自動、1で並列化しない）
+    """
+    workers = int(settings.get('decode_workers', 0))
+    if workers <= 0:
+        workers = min(4, os.cpu_count() or 1)
+    if workers <= 1:
+        return None
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export-decode')
+
+def _decode_batch(payloads: List[np.ndarray]) -> List[np.ndarray]:
+    frames = []
+    for payload in payloads:
+        frame = cv2.imdecode(payload, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise VideoError("フレームのデコードに失敗しました")
+        frames.append(frame)
+    return frames
+
+def decode_ordered(payloads: Sequence[np.ndarray], executor: Executor = None,
+                   batch_size: int = 8, window: int = 4) -> Iterator[np.ndarray]:
+    """
+    JPEGデータをスレッドプールでバッチごとに並列デコードし、元の順序で返す
+    cv2.imdecode はGILを解放するため、スレッドでも複数コアを使える
+    Args:
+        payloads: JPEGデータ（fps変換で同じデータが連続する場合は一度だけデコード）
+        executor: デコードに使うスレッドプール（Noneの場合はこのスレッドで順にデコード）
+        batch_size: 1タスクでデコードするフレーム数
+        window: 先行してデコードするバッチ数の上限（デコード済みフレームのメモリ使用量を抑える）
+    """
+    unique = []
+    repeats = []
+    for payload in payloads:
+        if unique and payload is unique[-1]:
+            repeats[-1] += 1
+        else:
+            unique.append(payload)
+            repeats.append(1)
+    starts = list(range(0, len(unique), max(1, batch_size)))
+
+    pending = deque()
+    next_batch = 0
+    try:
+        while next_batch < len(starts) or pending:
+            if executor is None:
+                start = starts[next_batch]
+                next_batch += 1
+                frames = _decode_batch(unique[start:start + batch_size])
+            else:
+                while next_batch < len(starts) and len(pending) < max(1, window):
+                    start = starts[next_batch]
+                    pending.append((start, executor.submit(_decode_batch, unique[start:start + batch_size])))
+                    next_batch += 1
+                start, future = pending.popleft()
+                frames = future.result()
+            for index, frame in enumerate(frames, start):
+                for _ in range(repeats[index]):
+                    yield frame
+    finally:
+        # 途中で中断した場合は未着手のデコードを取り消す
+        for _, future in pending:
+            future.cancel()
+
+def write_payloads(encoder, payloads: Sequence[np.ndarray], executor: Executor = None,
+                   batch_size: int = 8, window: int = 4) -> int:
+    """
+    JPEGデータをエンコーダーに書き込み、書き込んだフレーム数を返す
+    デコードが必要なエンコーダーには、スレッドプールで並列にデコードしたフレームを順に渡す
+    """
+    if encoder.accepts_jpeg:
+        for payload in payloads:
+            encoder.write_jpeg(payload)
+    else:
+        for frame in decode_ordered(payloads, executor, batch_size, window):
+            encoder.write_frame(frame)
+    return len(payloads)
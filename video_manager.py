@@ -1,14 +1,28 @@
+import bisect
 import cv2
 import numpy as np
+import os
+import subprocess
+import sys
 import threading
 import queue
 import time
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Any, Callable, Dict, Optional, Tuple
 from contextlib import contextmanager
 
-from exceptions import VideoError, CameraError, ResourceError
-from utils import logger, FrameBuffer, Config
+from exceptions import VideoError, CameraError, ConfigError, ResourceError
+from utils import logger, now, FrameBuffer, FramePacer, CaptureHealth, Config
+from video_encoder import create_encoder, create_decode_pool, write_payloads
+from save_worker import SaveWorkerPool
+from shared_ring import SharedFrameRing, RingFrameBuffer
+from capture_process import ring_name_for
+from clip_catalog import ClipInfo
+from clip_writer import ClipWriter
+from buffer_snapshot import read_snapshot, write_snapshot
+from clip_index import write_sidecar
+from overlay import FrameOverlay, Telemetry
+from tracing import tracer
 
 class VideoManager:
     def __init__(self, config: Config):
@@ -22,21 +36,78 @@ class VideoManager:
         self.camera = None
         self.frame_width = config.get('camera', 'frame_width')
         self.frame_height = config.get('camera', 'frame_height')
+        # 目標fps（保存する動画のフレームレート）と実測fps
         self.fps = config.get('camera', 'fps')
+        self.pacer = FramePacer(self.fps)
         
         # フレームバッファの初期化
         max_bytes = config.get('buffer', 'max_size_mb') * 1024 * 1024
         compression_quality = config.get('buffer', 'compression_quality')
-        self.frame_buffer = FrameBuffer(max_bytes, compression_quality)
+        self.frame_buffer = FrameBuffer(
+            max_bytes,
+            compression_quality,
+            full_resolution_seconds=config.get('buffer', 'full_resolution_seconds', 10),
+            tiers=config.get('buffer', 'tiers', []),
+            static_threshold=config.get('buffer', 'static_threshold', 0.0),
+            static_max_interval=config.get('buffer', 'static_max_interval', 1.0)
+        )
+        self._local_buffer = self.frame_buffer
+
+        # 日時・テレメトリ（速度など）の焼き込み（キャプチャ時に行う）
+        self.telemetry = Telemetry(config.get('overlay', 'telemetry_max_age', 5.0))
+        self.overlay = FrameOverlay.from_config(config, self.telemetry)
+
+        # 再起動をまたいでトリガー前の映像を残すためのスナップショット
+        self.snapshot_enabled = config.get('snapshot', 'enabled', False)
+        self.snapshot_path = config.get('snapshot', 'path', 'buffer.snapshot')
+        if self.snapshot_enabled and config.get('capture', 'mode', 'thread') == 'thread':
+            self._restore_snapshot(config.get('snapshot', 'max_age', 600))
+
+        # キャプチャ方式（thread: このプロセス内 / process: 別プロセス + 共有メモリ）
+        self.capture_mode = config.get('capture', 'mode', 'thread')
+        self.ring = None
+        self.capture_process = None
+
+        # エンコーダー設定とクリップ書き込み設定（fsync間隔・帯域制限）
+        self.encoder_settings = config.get_section('encoder')
+        self.save_settings = config.get_section('save')
+        # 書き出し時のJPEGデコード（縮小フレームの拡大やraw入力のエンコーダー）を並列化するスレッドプール
+        self.decode_pool = create_decode_pool(self.save_settings)
+
+        # 保存ワーカープロセス（0の場合はこのプロセス内で保存）
+        worker_processes = config.get('save', 'worker_processes', 0)
+        self.save_workers = None
+        if worker_processes > 0:
+            self.save_workers = SaveWorkerPool(worker_processes, self.encoder_settings, self.save_settings)
         
+        # 読み出しの失敗・停止を検知して再接続する監視スレッド
         self.capture_thread = None
+        self.stall_timeout = config.get('capture', 'stall_timeout', 5.0)
+        self.gap_threshold = config.get('capture', 'gap_threshold', 0.5)
+        self.health = CaptureHealth(
+            config.get('capture', 'reconnect_backoff', 0.5),
+            config.get('capture', 'reconnect_backoff_max', 10.0)
+        )
+        self._stop_event = threading.Event()
+        self._generation = 0  # 読み出しスレッドの世代（停止したスレッドを切り離すため）
+        self._reader_error = None
+        self._last_frame_at = 0.0
         self._lock = threading.Lock()
 
+        # カメラの切り替え（ウォームアップ済みのカメラを監視スレッドに引き渡す）
+        self.device_id = config.get('camera', 'default_device', 0)
+        self.warmup_frames = config.get('capture', 'warmup_frames', 5)
+        self._pending_switch = None
+        self._switch_thread = None
+
     @property
     def running(self) -> bool:
         """カメラの動作状態を取得"""
         with self._lock:
-            return self._running
+            running = self._running
+        if running and self.ring is not None:
+            return self.ring.writer_alive()
+        return running
 
     @contextmanager
     def camera_session(self, device_id: int = 0):
@@ -49,142 +120,685 @@ class VideoManager:
 
     def start_capture(self, device_id: int = 0) -> bool:
         """ビデオキャプチャを開始"""
-        try:
-            self.camera = cv2.VideoCapture(device_id)
-            if not self.camera.isOpened():
-                raise CameraError(f"カメラ {device_id} を開けませんでした")
-
-            # カメラの設定
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.frame_width)
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.frame_height)
-            self.camera.set(cv2.CAP_PROP_FPS, self.fps)
+        self.device_id = device_id
+        if self.capture_mode == 'process':
+            return self._start_capture_process(device_id)
 
-            # 実際の設定値を取得
-            self.frame_width = int(self.camera.get(cv2.CAP_PROP_FRAME_WIDTH))
-            self.frame_height = int(self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            self.fps = int(self.camera.get(cv2.CAP_PROP_FPS))
+        try:
+            camera = self._open_camera(device_id)
+            # 実際の設定値を取得（fpsは目標値のまま、実測値はキャプチャ中に計測）
+            self.frame_width = int(camera.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.frame_height = int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            camera_fps = camera.get(cv2.CAP_PROP_FPS)
+            self.pacer = FramePacer(self.fps)
 
             with self._lock:
                 self._running = True
-            
+            self._stop_event.clear()
+            self.health.mark_connected()
+
             self.capture_thread = threading.Thread(
-                target=self._capture_frames,
+                target=self._supervise_capture,
+                args=(camera,),
+                name='capture-supervisor',
                 daemon=True
             )
             self.capture_thread.start()
-            logger.info(f"カメラ {device_id} の録画を開始: {self.frame_width}x{self.frame_height} @{self.fps}fps")
+            logger.info(f"カメラ {device_id} の録画を開始: {self.frame_width}x{self.frame_height} @{self.fps}fps (camera={camera_fps})")
             return True
 
         except Exception as e:
             logger.error(f"カメラの起動に失敗: {str(e)}")
-            if self.camera:
-                self.camera.release()
-                self.camera = None
             return False
 
-    def stop_capture(self):
-        """ビデオキャプチャを停止"""
+    def _open_camera(self, device_id: int, frame_width: int = None, frame_height: int = None,
+                     fps: float = None):
+        """カメラを開いて解像度とfpsを設定（省略時は現在の設定値）"""
+        camera = cv2.VideoCapture(device_id)
+        if not camera.isOpened():
+            camera.release()
+            raise CameraError(f"カメラ {device_id} を開けませんでした")
+        camera.set(cv2.CAP_PROP_FRAME_WIDTH, frame_width or self.frame_width)
+        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, frame_height or self.frame_height)
+        camera.set(cv2.CAP_PROP_FPS, fps or self.fps)
+        return camera
+
+    def _supervise_capture(self, camera):
+        """
+        キャプチャの監視
+        読み出しの失敗や停止（一定時間フレームが届かない）を検知し、バッファを保持したまま
+        バックオフしながらカメラを開き直す。切り替え要求があればウォームアップ済みのカメラに引き継ぐ
+        """
+        while self.running:
+            if camera is None:
+                device_id = self.device_id
+                try:
+                    camera = self._open_camera(device_id)
+                except Exception as e:
+                    self.health.mark_disconnected(str(e))
+                    delay = self.health.next_backoff()
+                    logger.warning(f"カメラ {device_id} の再接続に失敗: {e}（{delay:.1f}秒後に再試行）")
+                    self._stop_event.wait(delay)
+                    continue
+                self.health.mark_connected()
+                logger.info(f"カメラ {device_id} に接続しました")
+
+            # 読み出しは別スレッドで行い、ブロックしたままのスレッドは切り離せるようにする
+            with self._lock:
+                self._generation += 1
+                generation = self._generation
+            self._reader_error = None
+            self._last_frame_at = time.monotonic()
+            self.camera = camera
+            self.frame_width = int(camera.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.frame_height = int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            reader = threading.Thread(
+                target=self._capture_frames,
+                args=(camera, generation),
+                name='capture',
+                daemon=True
+            )
+            reader.start()
+            camera = None
+
+            reason = None
+            while self.running:
+                reader.join(timeout=0.5)
+                if not reader.is_alive():
+                    reason = self._reader_error or "キャプチャが終了しました"
+                    break
+                if time.monotonic() - self._last_frame_at > self.stall_timeout:
+                    reason = f"{self.stall_timeout:g}秒間フレームが届きません"
+                    break
+
+            with self._lock:
+                # 停止したスレッドは後で戻ってきてもバッファに書き込まない
+                self._generation += 1
+                switch = self._pending_switch
+                self._pending_switch = None
+            self.camera = None
+
+            if switch is not None:
+                if not self.running:
+                    if switch['camera'] is not None:
+                        switch['camera'].release()
+                    break
+                camera = self._apply_switch(switch)
+                continue
+            if reason is None or not self.running:
+                reader.join(timeout=3.0)
+                break
+            self.health.mark_disconnected(reason)
+            logger.error(f"カメラ {self.device_id} の映像が途切れました: {reason}。再接続します")
+
+    def switch_camera(self, device_id: int = None, frame_width: int = None,
+                      frame_height: int = None, fps: float = None,
+                      on_done: Callable[[bool], None] = None) -> bool:
+        """
+        カメラ・解像度・fpsの切り替え（録画を止めずにバッファを保持したまま行う）
+        別のカメラへの切り替えは新しいカメラをバックグラウンドで開き、フレームが届くのを
+        確認してから引き継ぐため、タイムラインは途切れない
+        同じカメラの解像度・fpsの変更はカメラを開き直す間だけ途切れる
+        Args:
+            device_id: カメラ番号（省略時は現在のカメラ）
+            frame_width: フレーム幅
+            frame_height: フレーム高さ
+            fps: 目標fps
+            on_done: 切り替え完了時に成否を受け取るコールバック
+        Returns:
+            切り替えを開始した場合True（停止中は設定値のみ更新してTrue）
+        """
+        settings = {
+            'device_id': self.device_id if device_id is None else device_id,
+            'frame_width': frame_width or self.frame_width,
+            'frame_height': frame_height or self.frame_height,
+            'fps': fps or self.fps
+        }
+        if not self.running:
+            self._apply_settings(settings)
+            if on_done:
+                on_done(True)
+            return True
+
         with self._lock:
-            self._running = False
+            if self._switch_thread is not None and self._switch_thread.is_alive():
+                logger.warning("カメラの切り替え中のため、新しい切り替え要求を無視します")
+                return False
+            self._switch_thread = threading.Thread(
+                target=self._prepare_switch,
+                args=(settings, on_done),
+                name='camera-switch',
+                daemon=True
+            )
+            self._switch_thread.start()
+        return True
 
-        if self.capture_thread:
-            try:
-                self.capture_thread.join(timeout=3.0)
-            except Exception as e:
-                logger.warning(f"キャプチャスレッドの停止中にエラー: {e}")
+    def _prepare_switch(self, settings: Dict[str, Any], on_done: Optional[Callable[[bool], None]]):
+        """切り替え先のカメラを開いてウォームアップし、監視スレッドに引き渡す"""
+        device_id = settings['device_id']
+        success = False
+        try:
+            if self.capture_mode == 'process':
+                # キャプチャプロセスはカメラごとにリングバッファを持つため、起動し直す（バッファは引き継がない）
+                logger.warning("process モードではカメラの切り替え時にバッファを引き継ぎません")
+                self.stop_capture()
+                self._apply_settings(settings)
+                success = self.start_capture(device_id)
+                return
 
-        if self.camera:
-            try:
-                self.camera.release()
-                self.camera = None
-            except Exception as e:
-                logger.error(f"カメラのリソース解放中にエラー: {e}")
+            camera = None
+            if device_id != self.device_id:
+                camera = self._open_camera(
+                    device_id, settings['frame_width'], settings['frame_height'], settings['fps']
+                )
+                try:
+                    # 露出の調整中などで最初のフレームは遅いため読み捨て、フレームが届くことを確認する
+                    for _ in range(self.warmup_frames):
+                        if not camera.grab():
+                            raise CameraError(f"カメラ {device_id} からフレームを取得できません")
+                except Exception:
+                    camera.release()
+                    raise
 
-        self.frame_buffer.clear()
-        logger.info("カメラを停止しました")
+            with self._lock:
+                if not self._running:
+                    if camera is not None:
+                        camera.release()
+                    return
+                previous = self._pending_switch
+                self._pending_switch = dict(settings, camera=camera)
+                # 現在の読み出しスレッドを次のフレームで止め、監視スレッドに引き継がせる
+                self._generation += 1
+            if previous is not None and previous['camera'] is not None:
+                previous['camera'].release()
+            success = True
+        except Exception as e:
+            logger.error(f"カメラ {device_id} への切り替えに失敗: {e}")
+        finally:
+            if on_done:
+                on_done(success)
 
-    def _capture_frames(self):
-        """フレームをキャプチャしてバッファに保存"""
-        frame_interval = 1.0 / self.fps
-        last_capture = time.time()
+    def _apply_switch(self, switch: Dict[str, Any]):
+        """切り替え要求を適用し、引き継ぐカメラを返す（Noneの場合は監視スレッドが開き直す）"""
+        self._apply_settings(switch)
+        camera = switch['camera']
+        logger.info(
+            f"カメラを切り替えました: camera={self.device_id} "
+            f"{self.frame_width}x{self.frame_height} @{self.fps}fps"
+        )
+        return camera
 
-        while self.running:
-            try:
-                # フレームレート制御
-                current_time = time.time()
-                if current_time - last_capture < frame_interval:
-                    time.sleep(0.001)  # CPUの負荷を軽減
+    def _apply_settings(self, settings: Dict[str, Any]):
+        """カメラ番号・解像度・fpsを反映"""
+        self.device_id = settings['device_id']
+        self.frame_width = settings['frame_width']
+        self.frame_height = settings['frame_height']
+        if settings['fps'] != self.fps:
+            self.fps = settings['fps']
+            self.pacer = FramePacer(self.fps)
+
+    def reconfigure(self, settings: Dict[str, Any],
+                    on_done: Callable[[bool], None] = None) -> Dict[str, Any]:
+        """
+        実行中の設定変更（再起動不要）
+        Args:
+            settings: camera_device / frame_width / frame_height / fps / buffer_size_mb / compression_quality
+            on_done: カメラの切り替え完了時に成否を受け取るコールバック
+        Returns:
+            適用した設定
+        """
+        applied = {}
+        for key, value in settings.items():
+            if key not in RECONFIGURABLE:
+                raise ConfigError(f"変更できない設定です: {key}")
+            kind, minimum, maximum = RECONFIGURABLE[key]
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ConfigError(f"{key} は数値で指定してください")
+            if not minimum <= value <= maximum:
+                raise ConfigError(f"{key} は {minimum}〜{maximum} の範囲で指定してください")
+            applied[key] = kind(value)
+
+        if 'buffer_size_mb' in applied or 'compression_quality' in applied:
+            if self.capture_mode == 'process':
+                # フレームはキャプチャプロセスのリングバッファ（capture.ring_slots）に保存される
+                raise ConfigError("process モードではバッファの設定を実行中に変更できません")
+            size_mb = applied.get('buffer_size_mb', self.config.get('buffer', 'max_size_mb'))
+            quality = applied.get('compression_quality')
+            self._local_buffer.resize(int(size_mb * 1024 * 1024), quality)
+            self.config.set('buffer', 'max_size_mb', size_mb)
+            if quality is not None:
+                self.config.set('buffer', 'compression_quality', quality)
+            logger.info(f"バッファを変更しました: {size_mb}MB quality={self._local_buffer.compression_quality}")
+
+        camera_keys = {'camera_device', 'frame_width', 'frame_height', 'fps'} & set(applied)
+        if camera_keys:
+            self.switch_camera(
+                applied.get('camera_device'),
+                applied.get('frame_width'),
+                applied.get('frame_height'),
+                applied.get('fps'),
+                on_done
+            )
+            for key in camera_keys - {'camera_device'}:
+                self.config.set('camera', key, applied[key])
+        return applied
+
+    def _capture_frames(self, camera, generation: int):
+        """
+        フレームをキャプチャしてバッファに保存
+        カメラのブロッキング読み出しでペースを取り、取得時刻を単調時計で記録する
+        """
+        try:
+            while self.running and generation == self._generation:
+                # grab() はフレームが届くまでブロックする
+                if not camera.grab():
+                    raise CameraError("フレームの取得に失敗")
+                self._last_frame_at = time.monotonic()
+                timestamp = now()
+
+                # 目標fpsより速い場合のみ間引く（retrieveを省略してデコードしない）
+                if not self.pacer.should_keep(timestamp):
                     continue
 
-                ret, frame = self.camera.read()
-                if ret:
-                    self.frame_buffer.add_frame(frame)
-                    last_capture = current_time
-                else:
+                ret, frame = camera.retrieve()
+                if not ret:
                     raise CameraError("フレームの取得に失敗")
+                if generation != self._generation:
+                    break
+                if self.overlay is not None:
+                    self.overlay.apply(frame, timestamp)
+
+                # 前のフレームから大きく空いた場合はタイムラインの途切れとして記録
+                latest = self.frame_buffer.latest_timestamp
+                if latest is not None and timestamp - latest > self.gap_threshold:
+                    self.health.add_discontinuity(latest, timestamp)
+                    logger.warning(f"映像が {timestamp - latest:.1f}秒間途切れました")
+                self.frame_buffer.add_frame(frame, timestamp)
+
+        except Exception as e:
+            self._reader_error = str(e)
+        finally:
+            camera.release()
+
+    def _start_capture_process(self, device_id: int) -> bool:
+        """キャプチャプロセスを起動（または既存プロセスに接続）し、リングバッファを読み出す"""
+        name = ring_name_for(self.config, device_id)
+        try:
+            ring = self._attach_ring(name)
+            if ring is not None and ring.writer_alive():
+                logger.info(f"既存のキャプチャプロセスに接続: {name}")
+            else:
+                if ring is not None:
+                    ring.close()
+                ring = self._launch_capture_process(device_id, name)
 
+            self.ring = ring
+            self.frame_buffer = RingFrameBuffer(ring)
+            self.frame_width, self.frame_height, _ = ring.frame_info
+
+            with self._lock:
+                self._running = True
+            logger.info(f"カメラ {device_id} の録画を開始 (process): {self.frame_width}x{self.frame_height} @{self.fps}fps")
+            return True
+
+        except Exception as e:
+            logger.error(f"キャプチャプロセスの起動に失敗: {str(e)}")
+            self._stop_capture_process()
+            return False
+
+    @staticmethod
+    def _attach_ring(name: str) -> Optional[SharedFrameRing]:
+        try:
+            return SharedFrameRing.attach(name)
+        except FileNotFoundError:
+            return None
+        except ResourceError as e:
+            # 別バージョンのリングは使わない（キャプチャプロセスを起動すると作り直される）
+            logger.warning(str(e))
+            return None
+
+    def _launch_capture_process(self, device_id: int, name: str) -> SharedFrameRing:
+        """キャプチャプロセスを起動し、リングバッファの作成を待つ"""
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'capture_process.py')
+        cmd = [sys.executable, script, '--device', str(device_id)]
+        if self.config.path:
+            cmd += ['--config', self.config.path]
+        # GUIプロセスが異常終了しても録画を続けられるよう、別セッションで起動する
+        self.capture_process = subprocess.Popen(cmd, start_new_session=True)
+
+        deadline = time.monotonic() + self.config.get('capture', 'attach_timeout', 10)
+        while time.monotonic() < deadline:
+            if self.capture_process.poll() is not None:
+                raise CameraError(f"キャプチャプロセスが終了しました (code={self.capture_process.returncode})")
+            ring = self._attach_ring(name)
+            if ring is not None:
+                return ring
+            time.sleep(0.1)
+        raise CameraError(f"キャプチャプロセスの共有メモリ {name} に接続できませんでした")
+
+    def _stop_capture_process(self):
+        """キャプチャプロセスを停止してリングバッファから切断"""
+        if self.ring is not None:
+            self.ring.request_stop()
+        if self.capture_process is not None:
+            try:
+                self.capture_process.wait(timeout=3.0)
+            except subprocess.TimeoutExpired:
+                logger.warning("キャプチャプロセスが応答しないため強制終了します")
+                self.capture_process.terminate()
+            self.capture_process = None
+        if self.ring is not None:
+            self.frame_buffer = self._local_buffer
+            self.ring.close()
+            self.ring = None
+
+    def stop_capture(self):
+        """ビデオキャプチャを停止"""
+        with self._lock:
+            self._running = False
+
+        if self.ring is not None or self.capture_process is not None:
+            self._stop_capture_process()
+            logger.info("カメラを停止しました")
+            return
+
+        # 監視スレッドが読み出しスレッドを止め、カメラを解放する
+        # バッファはトリガー前の映像として残す（再開時は途切れとして記録される）
+        self._stop_event.set()
+        if self.capture_thread:
+            try:
+                self.capture_thread.join(timeout=5.0)
             except Exception as e:
-                logger.error(f"フレームキャプチャ中にエラー: {e}")
-                break
+                logger.warning(f"キャプチャスレッドの停止中にエラー: {e}")
+            self.capture_thread = None
+
+        logger.info("カメラを停止しました")
 
-        logger.info("フレームキャプチャを終了")
+    @property
+    def measured_fps(self) -> float:
+        """実測したキャプチャfps"""
+        if self.ring is not None:
+            return self.ring.frame_info[2]
+        return self.pacer.measured_fps
 
-    def save_video(self, output_path: str, before_seconds: int, after_seconds: int) -> bool:
+    def save_video(self, output_path: str, before_seconds: int, after_seconds: int,
+                   trigger_time: float = None, trace_id: str = None) -> Optional[ClipInfo]:
         """
         トリガー前後の動画を保存
         Args:
             output_path: 保存先のパス
             before_seconds: トリガー前の秒数
             after_seconds: トリガー後の秒数
+            trigger_time: トリガー発生時刻（省略時は現在時刻）
+            trace_id: 処理時間を記録するトレースID
+        Returns:
+            保存したクリップの情報（失敗時はNone）
         """
         try:
-            # 必要なフレーム数を計算
-            before_frames = before_seconds * self.fps
-            after_frames = after_seconds * self.fps
-            
-            # バッファからフレームを取得
-            frames = self.frame_buffer.get_frames(before_frames)
-            initial_frames_count = len(frames)
-            
-            if initial_frames_count < before_frames:
-                logger.warning(f"要求されたフレーム数に満たないため、{initial_frames_count}フレームのみ使用します")
-
-            # トリガー後のフレームを取得
-            frames_needed = after_frames
-            start_time = time.time()
-            while frames_needed > 0 and self.running:
-                if len(self.frame_buffer.get_frames()) > initial_frames_count:
-                    new_frames = self.frame_buffer.get_frames()[-1:]
-                    frames.extend(new_frames)
-                    frames_needed -= 1
-                
-                # タイムアウトチェック（5秒）
-                if time.time() - start_time > 5.0:
+            if trigger_time is None:
+                trigger_time = now()
+            start_time = trigger_time - before_seconds
+            end_time = trigger_time + after_seconds
+
+            # トリガー前のフレームを先に確保（待機中に階層変換や容量超過で失われないように）
+            stage_start = now()
+            preroll = self.frame_buffer.get_entries(start_time, trigger_time)
+            stage_end = now()
+            tracer.span(trace_id, 'save.preroll', stage_start, stage_end, frames=len(preroll))
+            stage_start = stage_end
+
+            # トリガー後のフレームがバッファに揃うまで待機
+            timeout_at = time.monotonic() + after_seconds + 5.0
+            while self.running:
+                latest = self.frame_buffer.latest_timestamp
+                if latest is not None and latest >= end_time:
+                    break
+                if time.monotonic() > timeout_at:
                     logger.warning("トリガー後のフレーム取得がタイムアウト")
                     break
-                
-                time.sleep(1.0 / self.fps)
+                self.frame_buffer.wait_for_frame(latest or 0.0, 0.5)
 
-            # 動画ファイルの作成
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(
-                output_path,
-                fourcc,
-                self.fps,
-                (self.frame_width, self.frame_height)
+            # バッファから圧縮済みフレームを取得（デコードはエンコーダー側で必要な場合のみ）
+            after = preroll[-1].timestamp if preroll else start_time
+            postroll = [
+                entry for entry in self.frame_buffer.get_entries(after, end_time)
+                if not preroll or entry.timestamp > after
+            ]
+            entries = preroll + postroll
+            stage_end = now()
+            tracer.span(trace_id, 'save.postroll', stage_start, stage_end, frames=len(postroll))
+            stage_start = stage_end
+            if not entries:
+                raise VideoError("保存対象のフレームがありません")
+
+            gaps = self.health.gaps_between(entries[0].timestamp, entries[-1].timestamp)
+            if gaps:
+                logger.warning(
+                    f"クリップに映像の途切れが {len(gaps)}件あります "
+                    f"(合計 {sum(end - start for start, end in gaps):.1f}秒、直前のフレームで補間)"
+                )
+
+            if entries[0].timestamp > start_time + 1.0 / self.fps:
+                logger.warning(f"バッファが不足しているため、トリガー前 {trigger_time - entries[0].timestamp:.1f}秒のみ保存します")
+
+            # 縮小保持されたフレームを出力解像度に合わせる
+            frame_size = (self.frame_width, self.frame_height)
+            payloads = self._fit_payloads(entries, frame_size)
+
+            # 実際のタイムスタンプに合わせて目標fpsの等間隔フレーム列に変換
+            timestamps = [entry.timestamp for entry in entries]
+            indices = resample_to_fps(timestamps, self.fps)
+            frames = [payloads[i] for i in indices]
+            frame_timestamps = [timestamps[i] for i in indices]
+            logger.debug(
+                f"フレームを変換: {len(entries)} -> {len(frames)} "
+                f"({timestamps[-1] - timestamps[0]:.2f}秒, 実測 {self.measured_fps:.1f}fps)"
             )
 
-            # フレームを書き込み
-            for frame in frames:
-                out.write(frame)
+            # 動画ファイルの作成
+            if self.save_workers:
+                # フレームは共有メモリ経由で渡し、エンコードは別プロセスで行う
+                stats = self.save_workers.save(output_path, frames, self.fps, frame_size)
+                if stats is None:
+                    raise VideoError("エンコードに失敗しました")
+                # ワーカー内ではエンコードと公開をまとめて行う
+                tracer.span(trace_id, 'save.encode', stage_start, frames=len(frames), worker=True, **stats)
+                logger.info(f"動画を保存しました (worker, {stats.get('export_fps', 0.0):.0f}fps): {output_path}")
+                self._write_sidecar(output_path, frames, frame_timestamps, trace_id)
+                return self._clip_info(output_path, entries, len(frames), trigger_time)
+
+            # 一時ファイルに書き込み、完了後に保存先へアトミックに公開する
+            writer = ClipWriter.from_settings(output_path, self.save_settings)
+            encoder = create_encoder(self.encoder_settings)
+            try:
+                encoder.open(output_path, self.fps, frame_size, writer=writer)
 
-            out.release()
-            logger.info(f"動画を保存しました: {output_path}")
-            return True
+                # フレームを書き込み（デコードが必要な場合はスレッドプールで並列に行う）
+                try:
+                    write_payloads(
+                        encoder, frames, self.decode_pool,
+                        self.save_settings.get('decode_batch', 8),
+                        self.save_settings.get('decode_window', 4)
+                    )
+                finally:
+                    if not encoder.close():
+                        raise VideoError("エンコードに失敗しました")
+                stage_end = now()
+                export_fps = len(frames) / max(stage_end - stage_start, 1e-6)
+                tracer.span(trace_id, 'save.encode', stage_start, stage_end,
+                            frames=len(frames), encoder=encoder.name, export_fps=round(export_fps, 1))
+                stats = writer.commit()
+                tracer.span(trace_id, 'save.publish', stage_end, **stats)
+            except Exception:
+                writer.abort()
+                raise
+
+            logger.info(f"動画を保存しました ({encoder.name}/{encoder.codec}, {export_fps:.0f}fps): {output_path}")
+            self._write_sidecar(output_path, frames, frame_timestamps, trace_id)
+            return self._clip_info(output_path, entries, len(frames), trigger_time, encoder.codec)
 
         except Exception as e:
             logger.error(f"動画保存中にエラー: {str(e)}")
-            return False
+            return None
+
+    def _write_sidecar(self, output_path: str, frames, frame_timestamps, trace_id: str = None):
+        """シーク用インデックスとサムネイル列を書き出す（失敗してもクリップの保存は成功扱い）"""
+        if not self.save_settings.get('sidecar', True):
+            return
+        stage_start = now()
+        try:
+            index = write_sidecar(
+                output_path, frames, frame_timestamps, self.fps,
+                self.save_settings.get('thumbnail_interval', 1.0),
+                self.save_settings.get('thumbnail_height', 72)
+            )
+            tracer.span(trace_id, 'save.sidecar', stage_start,
+                        frames=index['frame_count'], keyframes=len(index['keyframes']))
+        except Exception as e:
+            logger.warning(f"クリップのインデックスを作成できませんでした: {output_path}: {e}")
+
+    def _clip_info(self, output_path: str, entries, frame_count: int, trigger_time: float,
+                   codec: str = None) -> ClipInfo:
+        """保存したクリップの情報を作成"""
+        if codec is None:
+            codec = create_encoder(self.encoder_settings).codec
+        return ClipInfo(
+            output_path,
+            start_time=entries[0].timestamp,
+            end_time=entries[-1].timestamp,
+            duration=frame_count / self.fps,
+            frame_count=frame_count,
+            size=os.path.getsize(output_path),
+            codec=codec,
+            trigger_time=trigger_time
+        )
+
+    def _fit_payloads(self, entries, frame_size: Tuple[int, int]):
+        """
+        解像度が出力と異なるフレーム（縮小階層など）を拡大・レターボックスして再圧縮
+        Args:
+            entries: バッファのフレーム
+            frame_size: 出力解像度 (幅, 高さ)
+        """
+        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), self.config.get('buffer', 'compression_quality')]
+
+        def fit(payload):
+            frame = cv2.imdecode(payload, cv2.IMREAD_COLOR)
+            if frame is None:
+                raise VideoError("フレームのデコードに失敗しました")
+            result, fitted = cv2.imencode('.jpg', letterbox(frame, frame_size), encode_param)
+            if not result:
+                raise ResourceError("フレームの圧縮に失敗しました")
+            return fitted
+
+        payloads = [entry.payload for entry in entries]
+        targets = [
+            index for index, entry in enumerate(entries)
+            if entry.size is not None and tuple(entry.size) != frame_size
+        ]
+        if not targets:
+            return payloads
+        # デコード・拡大・再圧縮はGILを解放するため、スレッドプールで並列に行う
+        sources = [entries[index].payload for index in targets]
+        if self.decode_pool is not None:
+            fitted = self.decode_pool.map(fit, sources)
+        else:
+            fitted = map(fit, sources)
+        for index, payload in zip(targets, fitted):
+            payloads[index] = payload
+        return payloads
+
+    def _restore_snapshot(self, max_age: float):
+        """前回終了時のスナップショットをバッファに戻す（古すぎる場合は破棄）"""
+        if not os.path.exists(self.snapshot_path):
+            return
+        started = time.monotonic()
+        try:
+            entries = read_snapshot(self.snapshot_path)
+            if entries and now() - entries[-1][1].timestamp > max_age:
+                logger.info(f"スナップショットが古いため読み込みません: {self.snapshot_path}")
+                entries = []
+            count = self._local_buffer.restore(entries)
+            if entries:
+                logger.info(
+                    f"バッファを復元しました: {len(entries)}フレーム "
+                    f"({entries[-1][1].timestamp - entries[0][1].timestamp:.1f}秒, "
+                    f"{(time.monotonic() - started) * 1000:.0f}ms) バッファ内 {count}フレーム"
+                )
+        except Exception as e:
+            logger.error(f"バッファの復元に失敗: {e}")
+        finally:
+            # 異常終了した場合に同じ映像を再度読み込まないよう削除する（マップ済みの領域は残る）
+            try:
+                os.remove(self.snapshot_path)
+            except OSError:
+                pass
+
+    def save_snapshot(self) -> int:
+        """
+        バッファの内容をスナップショットに書き出す（次回起動時に復元される）
+        Returns:
+            書き出したフレーム数
+        """
+        if self.capture_mode == 'process':
+            # 別プロセスのリングバッファはGUIの再起動後もそのまま残る
+            return 0
+        started = time.monotonic()
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 停止のタイムアウト（systemd など）内に終わるよう、録画できる最大の長さ分だけ書き出す
+        latest = self._local_buffer.latest_timestamp
+        since = latest - self.config.get('recording', 'max_time', 30) if latest is not None else None
+        count = write_snapshot(self.snapshot_path, self._local_buffer.snapshot_entries(since))
+        logger.info(
+            f"バッファのスナップショットを書き出しました: {self.snapshot_path} "
+            f"({count}フレーム, {(time.monotonic() - started) * 1000:.0f}ms)"
+        )
+        return count
+
+    def shutdown(self):
+        """キャプチャと保存ワーカーを停止"""
+        self.stop_capture()
+        if self.snapshot_enabled:
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                logger.error(f"バッファのスナップショットの書き出しに失敗: {e}")
+        self._local_buffer.close()
+        if self.save_workers:
+            self.save_workers.shutdown()
+            self.save_workers = None
+        if self.decode_pool:
+            self.decode_pool.shutdown(wait=False)
+            self.decode_pool = None
+
+    def update_telemetry(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        焼き込みに使うテレメトリの値を更新
+        Returns:
+            有効期限内の値
+        """
+        self.telemetry.update(values)
+        return self.telemetry.current()
+
+    def capture_metrics(self) -> Dict[str, Any]:
+        """キャプチャの接続状態・再接続回数・途切れ時間"""
+        if self.capture_mode == 'process':
+            ring = self.ring
+            return {
+                'mode': 'process',
+                'connected': ring is not None and ring.writer_alive(),
+                'measured_fps': self.measured_fps
+            }
+        metrics = self.health.snapshot()
+        metrics['mode'] = 'thread'
+        metrics['measured_fps'] = round(self.measured_fps, 2)
+        return metrics
+
+    def get_latest_entry(self):
+        """最新フレームをJPEGのまま取得（動き検知・配信用）"""
+        return self.frame_buffer.get_latest()
 
     def get_current_frame(self) -> Optional[np.ndarray]:
         """現在のフレームを取得（プレビュー用）"""
@@ -195,3 +809,60 @@ class VideoManager:
     def get_camera_info(self) -> Tuple[int, int, int]:
         """カメラの情報を取得"""
         return self.frame_width, self.frame_height, self.fps
+
+# 実行中に変更できる設定（型, 最小値, 最大値）
+RECONFIGURABLE = {
+    'camera_device': (int, 0, 63),
+    'frame_width': (int, 16, 7680),
+    'frame_height': (int, 16, 4320),
+    'fps': (int, 1, 240),
+    'buffer_size_mb': (float, 1, 65536),
+    'compression_quality': (int, 1, 100)
+}
+
+def resample_to_fps(timestamps, fps: float):
+    """
+    不等間隔のタイムスタンプ列を等間隔（fps）に変換するためのインデックス列を返す
+    各出力時刻に最も近いフレームを採用するため、不足時は複製し、過剰時は間引く
+    Args:
+        timestamps: 昇順のフレームタイムスタンプ
+        fps: 出力フレームレート
+    """
+    if not timestamps:
+        return []
+    interval = 1.0 / fps
+    first = timestamps[0]
+    count = int(round((timestamps[-1] - first) / interval)) + 1
+    indices = []
+    for n in range(count):
+        target = first + n * interval
+        # target の前後のフレームのうち近い方（等距離なら前のフレーム）
+        index = bisect.bisect_left(timestamps, target)
+        if index >= len(timestamps) or (
+                index > 0 and target - timestamps[index - 1] <= timestamps[index] - target):
+            index -= 1
+        indices.append(index)
+    return indices
+
+def letterbox(frame: np.ndarray, frame_size: Tuple[int, int]) -> np.ndarray:
+    """
+    アスペクト比を保ったまま指定解像度に拡大縮小し、余白を黒で埋める
+    Args:
+        frame: フレーム画像
+        frame_size: 出力解像度 (幅, 高さ)
+    """
+    width, height = frame_size
+    source_height, source_width = frame.shape[:2]
+    ratio = min(width / source_width, height / source_height)
+    new_width = max(1, int(round(source_width * ratio)))
+    new_height = max(1, int(round(source_height * ratio)))
+    interpolation = cv2.INTER_LINEAR if ratio > 1 else cv2.INTER_AREA
+    resized = cv2.resize(frame, (new_width, new_height), interpolation=interpolation)
+    if (new_width, new_height) == (width, height):
+        return resized
+
+    canvas = np.zeros((height, width, 3), dtype=frame.dtype)
+    x = (width - new_width) // 2
+    y = (height - new_height) // 2
+    canvas[y:y + new_height, x:x + new_width] = resized
+    return canvas